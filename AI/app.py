@@ -1,17 +1,37 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Request, Response, g, request, jsonify, stream_with_context
 from flask_cors import CORS
 from dotenv import load_dotenv
 import google.generativeai as genai
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain.prompts import ChatPromptTemplate
-from langchain.schema.output_parser import StrOutputParser
 import PyPDF2
+import pdf_worker
+import io
 import os
+import base64
 import json
 import re
+import hashlib
+import contextvars
 import logging
-from typing import Dict, Any, Optional
-from pymongo import MongoClient
+import sqlite3
+import asyncio
+import copy
+import gc
+import heapq
+import itertools
+import math
+import queue
+import sys
+import threading
+import time
+import multiprocessing
+import tempfile
+import textwrap
+import uuid
+from collections import OrderedDict, deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, as_completed, wait
+from contextlib import contextmanager
+from typing import Dict, Any, List, Optional, Tuple
+from pymongo import MongoClient, monitoring
 from bson import ObjectId
 
 # Basic logging setup
@@ -28,8 +48,293 @@ class MongoJSONEncoder(json.JSONEncoder):
 load_dotenv()
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 MONGO_URI = os.getenv("MONGO_URI")
+# Number of warm model handles shared by all request threads
+GEMINI_POOL_SIZE = int(os.getenv("GEMINI_POOL_SIZE", "4"))
+# Seconds a request waits for a free model handle before giving up
+GEMINI_POOL_TIMEOUT = float(os.getenv("GEMINI_POOL_TIMEOUT", "30"))
+# Connect to MongoDB and discover the Gemini model in the background at startup
+AI_LAZY_INIT = os.getenv("AI_LAZY_INIT", "false").lower() in ("1", "true", "yes")
+# Seconds a request waits for background Gemini initialization in lazy mode
+AI_INIT_WAIT = float(os.getenv("AI_INIT_WAIT", "10"))
+# Local cache of the discovered Gemini model name, so workers can skip list_models()
+GEMINI_MODEL_CACHE_PATH = os.getenv(
+    "GEMINI_MODEL_CACHE_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".gemini_model_cache.json")
+)
+GEMINI_MODEL_CACHE_TTL = int(os.getenv("GEMINI_MODEL_CACHE_TTL", "86400"))
+# Cache of /analyze results keyed by PDF content hash and language
+ANALYSIS_CACHE_MAX_ENTRIES = int(os.getenv("ANALYSIS_CACHE_MAX_ENTRIES", "512"))
+ANALYSIS_CACHE_MAX_BYTES = int(os.getenv("ANALYSIS_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+ANALYSIS_CACHE_TTL = int(os.getenv("ANALYSIS_CACHE_TTL", str(7 * 86400)))
+# Optional SQLite file backing the in-memory tier; empty disables persistence
+ANALYSIS_CACHE_PATH = os.getenv("ANALYSIS_CACHE_PATH", "")
+# Requests larger than this are rejected with 413 before the body is buffered
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_MB", "20")) * 1024 * 1024
+# Uploads up to this size stay in memory; larger ones spill to an anonymous temp file
+PDF_SPOOL_MAX_BYTES = int(os.getenv("PDF_SPOOL_MAX_KB", "4096")) * 1024
+# Reports with at least this many pages are extracted in parallel
+PDF_PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "4"))
+PDF_EXTRACT_WORKERS = int(os.getenv("PDF_EXTRACT_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Upper bounds for /analyze/batch
+BATCH_MAX_FILES = int(os.getenv("BATCH_MAX_FILES", "50"))
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", str(GEMINI_POOL_SIZE)))
+# Weighted keyword/synonym vocabulary for the specialty matcher
+SPECIALTY_VOCAB_PATH = os.getenv(
+    "SPECIALTY_VOCAB_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "specialty_vocabulary.json")
+)
+# Answer confident, mild /recommend requests from precomputed templates instead of the model
+TRIAGE_ENABLED = os.getenv("TRIAGE_ENABLED", "true").lower() in ("1", "true", "yes")
+TRIAGE_TEMPLATES_PATH = os.getenv(
+    "TRIAGE_TEMPLATES_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "triage_templates.json")
+)
+# Minimum share of the keyword score the best specialty needs before a template is used
+TRIAGE_MIN_CONFIDENCE = float(os.getenv("TRIAGE_MIN_CONFIDENCE", "0.6"))
+# Longer descriptions are too detailed for a template and go to the model
+TRIAGE_MAX_WORDS = int(os.getenv("TRIAGE_MAX_WORDS", "40"))
+# Ask Gemini for application/json output instead of free text
+GEMINI_JSON_MODE = os.getenv("GEMINI_JSON_MODE", "true").lower() in ("1", "true", "yes")
+# Long reports are analyzed in chunks of roughly this many tokens ("auto"), always ("always") or never ("off")
+ANALYSIS_CHUNKED_MODE = os.getenv("ANALYSIS_CHUNKED_MODE", "auto").lower()
+ANALYSIS_CHUNK_TOKENS = int(os.getenv("ANALYSIS_CHUNK_TOKENS", "4000"))
+ANALYSIS_CHUNK_CONCURRENCY = int(os.getenv("ANALYSIS_CHUNK_CONCURRENCY", str(GEMINI_POOL_SIZE)))
+# Analyze once in CANONICAL_LANGUAGE and translate only the text fields for other languages (opt-in)
+LANGUAGE_FANOUT = os.getenv("LANGUAGE_FANOUT", "false").lower() in ("1", "true", "yes")
+CANONICAL_LANGUAGE = os.getenv("CANONICAL_LANGUAGE", "en-US")
+# Strings per translation request, and translation requests in flight per result
+TRANSLATION_BATCH_SIZE = int(os.getenv("TRANSLATION_BATCH_SIZE", "40"))
+TRANSLATION_CONCURRENCY = int(os.getenv("TRANSLATION_CONCURRENCY", str(GEMINI_POOL_SIZE)))
+TRANSLATION_CACHE_MAX_ENTRIES = int(os.getenv("TRANSLATION_CACHE_MAX_ENTRIES", "16384"))
+# Rough characters-per-token ratio used for prompt budgeting
+CHARS_PER_TOKEN = 4
+# Typical length of a report page, which sets how many pages a chunk holds on average
+REPORT_PAGE_CHARS = 2000
+# Cache of precautions keyed by normalized symptoms and language
+PRECAUTIONS_CACHE_MAX_ENTRIES = int(os.getenv("PRECAUTIONS_CACHE_MAX_ENTRIES", "2048"))
+PRECAUTIONS_CACHE_TTL = int(os.getenv("PRECAUTIONS_CACHE_TTL", "3600"))
+# Seconds a per-specialty doctor list is served from memory
+DOCTOR_CACHE_TTL = int(os.getenv("DOCTOR_CACHE_TTL", "300"))
+# Invalidate the doctor cache from MongoDB change streams (requires a replica set)
+DOCTOR_CACHE_WATCH = os.getenv("DOCTOR_CACHE_WATCH", "false").lower() in ("1", "true", "yes")
+# Doctor search: default and largest page, geo search radius, and the distance band
+# within which more experienced doctors rank first
+DOCTOR_PAGE_SIZE = int(os.getenv("DOCTOR_PAGE_SIZE", "5"))
+DOCTOR_MAX_PAGE_SIZE = int(os.getenv("DOCTOR_MAX_PAGE_SIZE", "50"))
+DOCTOR_SEARCH_RADIUS_KM = float(os.getenv("DOCTOR_SEARCH_RADIUS_KM", "25"))
+DOCTOR_DISTANCE_BAND_KM = float(os.getenv("DOCTOR_DISTANCE_BAND_KM", "2"))
+# Create missing indexes at startup instead of only warning about them
+MONGO_CREATE_INDEXES = os.getenv("MONGO_CREATE_INDEXES", "false").lower() in ("1", "true", "yes")
+# Time budget for one model call, shared by its retries and hedged duplicates
+GEMINI_DEADLINE_SECONDS = float(os.getenv("GEMINI_DEADLINE_SECONDS", "30"))
+GEMINI_MAX_ATTEMPTS = int(os.getenv("GEMINI_MAX_ATTEMPTS", "3"))
+GEMINI_RETRY_BACKOFF = float(os.getenv("GEMINI_RETRY_BACKOFF", "0.25"))
+# Send a duplicate request when the first is slower than this latency quantile of recent calls
+GEMINI_HEDGE = os.getenv("GEMINI_HEDGE", "true").lower() in ("1", "true", "yes")
+GEMINI_HEDGE_QUANTILE = float(os.getenv("GEMINI_HEDGE_QUANTILE", "0.95"))
+GEMINI_HEDGE_MIN_SAMPLES = int(os.getenv("GEMINI_HEDGE_MIN_SAMPLES", "20"))
+# Stop calling the model for a cooldown once this share of the recent calls failed
+GEMINI_BREAKER_ERROR_RATE = float(os.getenv("GEMINI_BREAKER_ERROR_RATE", "0.5"))
+GEMINI_BREAKER_MIN_CALLS = int(os.getenv("GEMINI_BREAKER_MIN_CALLS", "10"))
+GEMINI_BREAKER_WINDOW = int(os.getenv("GEMINI_BREAKER_WINDOW", "30"))
+GEMINI_BREAKER_COOLDOWN = float(os.getenv("GEMINI_BREAKER_COOLDOWN", "30"))
+# Background analysis jobs (POST /analyze with mode=job): worker threads, queue bound,
+# SQLite file that keeps queued jobs across restarts, and how long finished jobs are kept
+ANALYSIS_JOB_WORKERS = int(os.getenv("ANALYSIS_JOB_WORKERS", "2"))
+ANALYSIS_JOB_QUEUE_SIZE = int(os.getenv("ANALYSIS_JOB_QUEUE_SIZE", "32"))
+ANALYSIS_JOB_DB_PATH = os.getenv(
+    "ANALYSIS_JOB_DB_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".analysis_jobs.sqlite3")
+)
+ANALYSIS_JOB_TTL = int(os.getenv("ANALYSIS_JOB_TTL", "86400"))
+# Admission control for /recommend and /analyze: requests served at once, bounded wait queue
+# and the longest a request may wait in it
+ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "true").lower() in ("1", "true", "yes")
+ADMISSION_SLOTS = int(os.getenv("ADMISSION_SLOTS", str(GEMINI_POOL_SIZE * 2)))
+ADMISSION_QUEUE_SIZE = int(os.getenv("ADMISSION_QUEUE_SIZE", "64"))
+ADMISSION_MAX_WAIT = float(os.getenv("ADMISSION_MAX_WAIT", "15"))
+# Per-client token bucket: sustained requests per second and burst size
+CLIENT_RATE_LIMIT = float(os.getenv("CLIENT_RATE_LIMIT", "2"))
+CLIENT_BURST = float(os.getenv("CLIENT_BURST", "20"))
+# Comma-separated peer addresses of reverse proxies whose X-Client-Id header is trusted;
+# requests from anywhere else are rate limited by their own address
+TRUSTED_PROXIES = frozenset(address.strip() for address in os.getenv("TRUSTED_PROXIES", "").split(",") if address.strip())
+# Seconds a client stays prioritized after an assessment told them to seek emergency care
+EMERGENCY_PRIORITY_TTL = float(os.getenv("EMERGENCY_PRIORITY_TTL", "3600"))
+# Requests slower than this are logged with a per-stage breakdown; 0 disables the log
+SLOW_REQUEST_MS = float(os.getenv("SLOW_REQUEST_MS", "0"))
+# Pre-forking server (python app.py serve): bind address, worker processes, request threads per
+# worker, and the resident memory after which a worker is replaced; 0 disables recycling
+SERVE_BIND = os.getenv("SERVE_BIND", "0.0.0.0:8080")
+SERVE_WORKERS = int(os.getenv("SERVE_WORKERS", str(os.cpu_count() or 1)))
+SERVE_THREADS = int(os.getenv("SERVE_THREADS", "8"))
+SERVE_MAX_RSS_MB = int(os.getenv("SERVE_MAX_RSS_MB", "1024"))
+SERVE_TIMEOUT = int(os.getenv("SERVE_TIMEOUT", "120"))
+# Set when a launcher imports the app once and forks its workers from that process (gunicorn
+# --preload and the like): MongoDB, Gemini and the job workers then start in each worker after the
+# fork (see ensure_worker), not at import. python app.py serve sets it itself
+AI_PREFORK = os.getenv("AI_PREFORK", "false").lower() in ("1", "true", "yes") \
+    or (__name__ == "__main__" and sys.argv[1:2] == ["serve"])
+
+_boot_started = time.perf_counter()
+
+# Histogram buckets in seconds, from cache hits up to slow model calls
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+class Metrics:
+    """Process-wide counters and histograms rendered in the Prometheus text format."""
+
+    HELP = {
+        "ai_requests_total": ("counter", "HTTP requests by endpoint, method and status."),
+        "ai_request_seconds": ("histogram", "HTTP request latency by endpoint."),
+        "ai_stage_seconds": ("histogram", "Time spent in each processing stage."),
+        "ai_llm_requests_total": ("counter", "Model calls by task and outcome."),
+        "ai_llm_tokens_total": ("counter", "Model tokens by task and kind (prompt or output)."),
+        "ai_llm_retries_total": ("counter", "Model attempts retried after a failure."),
+        "ai_llm_hedges_total": ("counter", "Duplicate model requests sent after the hedge delay."),
+        "ai_llm_hedges_won_total": ("counter", "Hedged duplicates that answered first."),
+        "ai_fallbacks_total": ("counter", "Fallback responses served instead of a model answer."),
+        "ai_triage_total": ("counter", "Recommendations by answering tier and triage reason."),
+        "ai_translation_strings_total": ("counter", "Strings localized, by source (cache or model)."),
+        "ai_admission_total": ("counter", "Admission decisions by priority and outcome."),
+        "ai_admission_wait_seconds": ("histogram", "Time admitted requests waited for a slot, by priority."),
+        "ai_mongo_round_trips_total": ("counter", "MongoDB commands by command name and outcome."),
+        "ai_mongo_command_seconds": ("histogram", "MongoDB command latency by command name."),
+    }
+
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._counters: Dict[Tuple[str, Tuple], float] = {}
+        # Per label set: bucket counts, then sum, then count
+        self._histograms: Dict[Tuple[str, Tuple], List[float]] = {}
+
+    def inc(self, name: str, amount: float = 1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def observe(self, name: str, value: float, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            series = self._histograms.get(key)
+            if series is None:
+                series = self._histograms[key] = [0] * (len(self.buckets) + 2)
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    @staticmethod
+    def _labels(labels) -> str:
+        if not labels:
+            return ""
+        escaped = (
+            f'{key}="{str(value).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34)).replace(chr(10), "")}"'
+            for key, value in labels
+        )
+        return "{" + ",".join(escaped) + "}"
+
+    def render(self, samples=()) -> str:
+        """Render all metrics, plus (name, type, help, labels, value) samples collected by the caller."""
+        families: Dict[str, List[str]] = {}
+        types = {name: kind for name, (kind, _) in self.HELP.items()}
+        helps = {name: text for name, (_, text) in self.HELP.items()}
+        with self._lock:
+            for (name, labels), value in sorted(self._counters.items()):
+                families.setdefault(name, []).append(f"{name}{self._labels(labels)} {value:g}")
+            for (name, labels), series in sorted(self._histograms.items()):
+                lines = families.setdefault(name, [])
+                for index, bound in enumerate(self.buckets):
+                    lines.append(f"{name}_bucket{self._labels(labels + (('le', f'{bound:g}'),))} {series[index]}")
+                lines.append(f"{name}_bucket{self._labels(labels + (('le', '+Inf'),))} {series[-1]}")
+                lines.append(f"{name}_sum{self._labels(labels)} {series[-2]:.6f}")
+                lines.append(f"{name}_count{self._labels(labels)} {series[-1]}")
+        for name, kind, help_text, labels, value in samples:
+            types.setdefault(name, kind)
+            helps.setdefault(name, help_text)
+            families.setdefault(name, []).append(f"{name}{self._labels(tuple(sorted(labels.items())))} {value:g}")
+
+        out = []
+        for name, lines in families.items():
+            out.append(f"# HELP {name} {helps.get(name, name)}")
+            out.append(f"# TYPE {name} {types.get(name, 'untyped')}")
+            out.extend(lines)
+        return "\n".join(out) + "\n"
+
+metrics = Metrics()
+
+# Stage timings of the request being handled, as (stage, seconds) pairs
+_request_stages: contextvars.ContextVar = contextvars.ContextVar("request_stages", default=None)
+
+def note_stage(name: str, seconds: float):
+    """Add a timing to the current request's breakdown without recording it in a histogram."""
+    stages = _request_stages.get()
+    if stages is not None:
+        stages.append((name, seconds))
+
+@contextmanager
+def stage(name: str):
+    """Time a processing stage into ai_stage_seconds and the current request's breakdown."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        metrics.observe("ai_stage_seconds", elapsed, stage=name)
+        note_stage(name, elapsed)
+
+def begin_request():
+    """Start collecting the stage breakdown of a request."""
+    _request_stages.set([])
+
+def end_request(endpoint: str, method: str, status: int, seconds: float):
+    """Record a finished request and log it when it exceeds SLOW_REQUEST_MS."""
+    metrics.inc("ai_requests_total", endpoint=endpoint, method=method, status=str(status))
+    metrics.observe("ai_request_seconds", seconds, endpoint=endpoint)
+    stages = _request_stages.get() or []
+    if SLOW_REQUEST_MS and seconds * 1000 >= SLOW_REQUEST_MS:
+        breakdown = ", ".join(f"{name}={elapsed * 1000:.1f}ms" for name, elapsed in stages)
+        logger.warning(f"Slow request {method} {endpoint} {status} took {seconds * 1000:.1f} ms: {breakdown or 'no stages'}")
+    _request_stages.set(None)
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """Counts MongoDB round trips and their latency per command."""
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        self._record(event, "ok")
+
+    def failed(self, event):
+        self._record(event, "error")
+
+    @staticmethod
+    def _record(event, outcome: str):
+        seconds = event.duration_micros / 1e6
+        metrics.inc("ai_mongo_round_trips_total", command=event.command_name, outcome=outcome)
+        metrics.observe("ai_mongo_command_seconds", seconds, command=event.command_name)
+        note_stage(f"mongo_{event.command_name}", seconds)
+
+def record_llm_usage(task: str, response):
+    """Add a response's token usage, when the SDK reports it, to ai_llm_tokens_total."""
+    usage = getattr(response, "usage_metadata", None)
+    if usage is None:
+        return
+    metrics.inc("ai_llm_tokens_total", getattr(usage, "prompt_token_count", 0) or 0, task=task, kind="prompt")
+    metrics.inc("ai_llm_tokens_total", getattr(usage, "candidates_token_count", 0) or 0, task=task, kind="output")
+
+class UploadRequest(Request):
+    """Request that spools uploaded files to memory below PDF_SPOOL_MAX_BYTES."""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return tempfile.SpooledTemporaryFile(max_size=PDF_SPOOL_MAX_BYTES, mode="rb+")
 
 app = Flask(__name__)
+app.request_class = UploadRequest
+app.config["MAX_CONTENT_LENGTH"] = MAX_UPLOAD_BYTES
 # Improved CORS configuration
 CORS(app, resources={
     r"/*": {
@@ -41,67 +346,1405 @@ CORS(app, resources={
 })
 app.json_encoder = MongoJSONEncoder
 
-# MongoDB setup
-try:
-    db_client = MongoClient(
-        MONGO_URI,
-        serverSelectionTimeoutMS=5000,
-        connectTimeoutMS=5000,
-        socketTimeoutMS=6000,
-        retryWrites=True,
-        tls=True,
-        tlsAllowInvalidCertificates=True
-    )
-    db_client.server_info()
-    logger.info("MongoDB Atlas connection successful!")
-    db = db_client.get_database()
-    doctors_collection = db["doctors"]
-    users_collection = db["users"]
-except Exception as e:
-    logger.error(f"MongoDB connection error: {str(e)}")
-    db = None
-    doctors_collection = None
-    users_collection = None
-    logger.warning("Running with database functionality disabled")
-
-# Initialize Gemini models
-try:
-    genai.configure(api_key=GEMINI_API_KEY)
-    # List available models to identify the correct model name
-    models = genai.list_models()
+MONGO_CLIENT_OPTIONS = {
+    "serverSelectionTimeoutMS": 5000,
+    "connectTimeoutMS": 5000,
+    "socketTimeoutMS": 6000,
+    "retryWrites": True,
+    "tls": True,
+    "tlsAllowInvalidCertificates": True,
+    "event_listeners": [MongoCommandMetrics()]
+}
+
+# External dependencies, bound by init_mongo() and init_gemini()
+db_client = None
+db = None
+doctors_collection = None
+users_collection = None
+gemini_model_name = None
+# Set once each dependency has finished initializing, successfully or not
+_init_done = {"mongo": threading.Event(), "gemini": threading.Event()}
+
+def init_mongo():
+    """Connect to MongoDB and bind the collections used by the service."""
+    global db_client, db, doctors_collection, users_collection
+    try:
+        db_client = MongoClient(MONGO_URI, **MONGO_CLIENT_OPTIONS)
+        db_client.server_info()
+        logger.info("MongoDB Atlas connection successful!")
+        db = db_client.get_database()
+        doctors_collection = db["doctors"]
+        users_collection = db["users"]
+        ensure_indexes()
+        if DOCTOR_CACHE_WATCH:
+            threading.Thread(target=watch_doctor_changes, name="doctor-watch", daemon=True).start()
+    except Exception as e:
+        logger.error(f"MongoDB connection error: {str(e)}")
+        db = None
+        doctors_collection = None
+        users_collection = None
+        logger.warning("Running with database functionality disabled")
+    finally:
+        _init_done["mongo"].set()
+
+# Cities are matched case-insensitively; queries and the index on address.city must share this
+CITY_COLLATION = {"locale": "en", "strength": 2}
+
+# Indexes the doctor directory queries rely on, as (collection, keys, create_index options)
+REQUIRED_INDEXES = [
+    # Ranked search: equality on specialty and availability, then the experience/_id keyset order
+    ("doctors", [("specialization", 1), ("isAvailable", 1), ("experience", -1), ("_id", 1)], {}),
+    # Doctor profiles of users found by city or location
+    ("doctors", [("userId", 1)], {}),
+    ("users", [("address.city", 1), ("role", 1)], {"collation": CITY_COLLATION}),
+    ("users", [("geoLocation", "2dsphere")], {}),
+]
+
+def ensure_indexes():
+    """Check that required indexes exist, creating them when MONGO_CREATE_INDEXES is set."""
+    for collection_name, keys, options in REQUIRED_INDEXES:
+        collection = db[collection_name]
+        try:
+            existing = [list(info["key"]) for info in collection.index_information().values()]
+            if any(index_keys[:len(keys)] == keys for index_keys in existing):
+                continue
+            if MONGO_CREATE_INDEXES:
+                collection.create_index(keys, **options)
+                logger.info(f"Created index {keys} on {collection_name}")
+            else:
+                logger.warning(f"Missing index {keys} on {collection_name}; set MONGO_CREATE_INDEXES=true to create it")
+        except Exception as e:
+            logger.warning(f"Could not verify indexes on {collection_name}: {str(e)}")
+
+def watch_doctor_changes():
+    """Clear the doctor directory cache whenever doctors or users change."""
+    backoff = 1
+    while True:
+        try:
+            with db.watch([{"$match": {"ns.coll": {"$in": ["doctors", "users"]}}}]) as stream:
+                logger.info("Watching doctor directory changes")
+                backoff = 1
+                for _ in stream:
+                    doctor_directory_cache.clear()
+        except Exception as e:
+            logger.warning(f"Doctor change stream interrupted: {str(e)}; retrying in {backoff}s")
+            time.sleep(backoff)
+            backoff = min(backoff * 2, 60)
+
+def load_cached_model_name() -> Optional[str]:
+    """Return the cached Gemini model name if the cache file is still fresh."""
+    try:
+        with open(GEMINI_MODEL_CACHE_PATH, "r") as f:
+            cached = json.load(f)
+        if time.time() - cached.get("saved_at", 0) < GEMINI_MODEL_CACHE_TTL:
+            return cached.get("model")
+    except (OSError, ValueError):
+        pass
+    return None
+
+def save_cached_model_name(model_name: str):
+    """Persist the selected Gemini model name for other workers and restarts."""
+    tmp_path = f"{GEMINI_MODEL_CACHE_PATH}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, "w") as f:
+            json.dump({"model": model_name, "saved_at": time.time()}, f)
+        os.replace(tmp_path, GEMINI_MODEL_CACHE_PATH)
+    except OSError as e:
+        logger.warning(f"Could not write Gemini model cache: {str(e)}")
+
+def discover_gemini_model() -> Optional[str]:
+    """List available models and pick a Gemini model, preferring a pro variant."""
+    # list_models() returns a generator, so materialize it before scanning twice
+    models = list(genai.list_models())
     logger.info(f"Available models: {[model.name for model in models]}")
-    gemini_model_name = None
     
     # Find an appropriate Gemini model
     for model in models:
         if "gemini" in model.name.lower():
             if "pro" in model.name.lower():
-                gemini_model_name = model.name
-                logger.info(f"Selected Gemini model: {gemini_model_name}")
-                break
+                logger.info(f"Selected Gemini model: {model.name}")
+                return model.name
     
-    if not gemini_model_name:
-        # If no pro model found, use the first available Gemini model
-        for model in models:
-            if "gemini" in model.name.lower():
-                gemini_model_name = model.name
-                logger.info(f"Selected alternative Gemini model: {gemini_model_name}")
-                break
-    
-    if not gemini_model_name:
-        gemini_model_name = "gemini-1.5-pro"  # Fallback to a common model name
-        logger.warning(f"No Gemini model found, using fallback: {gemini_model_name}")
-    
-    llm = ChatGoogleGenerativeAI(
-        model=gemini_model_name,
-        google_api_key=GEMINI_API_KEY,
-        temperature=0.3,
-        timeout=5,
-        max_retries=2
+    # If no pro model found, use the first available Gemini model
+    for model in models:
+        if "gemini" in model.name.lower():
+            logger.info(f"Selected alternative Gemini model: {model.name}")
+            return model.name
+    return None
+
+def init_gemini():
+    """Configure the Gemini SDK and resolve the model name, using the local cache when fresh."""
+    global gemini_model_name
+    try:
+        genai.configure(api_key=GEMINI_API_KEY)
+        gemini_model_name = load_cached_model_name()
+        if gemini_model_name:
+            logger.info(f"Using cached Gemini model: {gemini_model_name}")
+        else:
+            gemini_model_name = discover_gemini_model()
+            if gemini_model_name:
+                save_cached_model_name(gemini_model_name)
+        
+        if not gemini_model_name:
+            gemini_model_name = "gemini-1.5-pro"  # Fallback to a common model name
+            logger.warning(f"No Gemini model found, using fallback: {gemini_model_name}")
+    except Exception as e:
+        logger.error(f"Gemini API initialization error: {str(e)}")
+        gemini_model_name = None
+    finally:
+        _init_done["gemini"].set()
+
+class PoolTimeoutError(TimeoutError):
+    """Raised when no model handle of a pool frees up in time."""
+
+class ModelPool:
+    """Fixed-size pool of warm Gemini model handles shared across requests.
+
+    All handles talk to the backend through the SDK's process-wide client, so
+    the underlying connection is opened once and kept alive between requests.
+    """
+
+    def __init__(self, model_name: str, size: int = GEMINI_POOL_SIZE, system_instruction: Optional[str] = None):
+        self.model_name = model_name
+        self.size = max(1, size)
+        generation_config = {"response_mime_type": "application/json"} if GEMINI_JSON_MODE else None
+        self._handles = queue.LifoQueue(maxsize=self.size)
+        for _ in range(self.size):
+            self._handles.put(genai.GenerativeModel(
+                model_name, generation_config=generation_config, system_instruction=system_instruction
+            ))
+        # Async calls are multiplexed over one channel, so one handle serves them all
+        self.async_model = genai.GenerativeModel(
+            model_name, generation_config=generation_config, system_instruction=system_instruction
+        )
+        self._lock = threading.Lock()
+        self._in_use = 0
+        self._peak_in_use = 0
+        self._checkouts = 0
+        self._waits = 0
+
+    @contextmanager
+    def model(self, timeout: Optional[float] = GEMINI_POOL_TIMEOUT):
+        """Check out a model handle for the duration of the block."""
+        try:
+            handle = self._handles.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                self._waits += 1
+            try:
+                handle = self._handles.get(timeout=timeout)
+            except queue.Empty:
+                raise PoolTimeoutError(f"No model handle available after {timeout}s")
+        with self._lock:
+            self._in_use += 1
+            self._checkouts += 1
+            self._peak_in_use = max(self._peak_in_use, self._in_use)
+        try:
+            yield handle
+        finally:
+            with self._lock:
+                self._in_use -= 1
+            self._handles.put(handle)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return current pool occupancy."""
+        with self._lock:
+            return {
+                "model": self.model_name,
+                "size": self.size,
+                "in_use": self._in_use,
+                "idle": self.size - self._in_use,
+                "peak_in_use": self._peak_in_use,
+                "checkouts": self._checkouts,
+                "waits": self._waits
+            }
+
+class ResultCache:
+    """Thread-safe LRU cache of JSON results with TTL and size-based eviction.
+
+    Entries live in memory and, when persist_path is set, in a SQLite file as a
+    second tier that survives restarts and is shared by workers on the host.
+    """
+
+    def __init__(self, name: str, max_entries: int, max_bytes: int, ttl: float,
+                 persist_path: Optional[str] = None):
+        self.name = name
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (expires_at, serialized value)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "persistent_hits": 0, "misses": 0, "evictions": 0, "expired": 0}
+        self.persist_path = persist_path
+        self._db = None
+        self._connect()
+
+    def _connect(self):
+        if not self.persist_path:
+            return
+        try:
+            self._db = sqlite3.connect(self.persist_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value TEXT, expires_at REAL)"
+            )
+            self._db.commit()
+        except sqlite3.Error as e:
+            logger.warning(f"Persistent {self.name} cache disabled: {str(e)}")
+            self._db = None
+
+    def reopen(self):
+        """Open a fresh SQLite connection; a connection must not be shared with a forked child."""
+        with self._lock:
+            self._db = None
+            self._connect()
+
+    def get(self, key: str) -> Optional[Any]:
+        """Return a copy of the cached value, or None on a miss."""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, serialized = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self._counters["hits"] += 1
+                    return json.loads(serialized)
+                self._remove(key)
+                self._counters["expired"] += 1
+
+            if self._db is not None:
+                try:
+                    row = self._db.execute(
+                        "SELECT value, expires_at FROM cache WHERE key = ?", (key,)
+                    ).fetchone()
+                except sqlite3.Error as e:
+                    logger.warning(f"Persistent {self.name} cache read failed: {str(e)}")
+                    row = None
+                if row is not None and row[1] > now:
+                    self._store(key, row[0], row[1])
+                    self._counters["persistent_hits"] += 1
+                    return json.loads(row[0])
+
+            self._counters["misses"] += 1
+            return None
+
+    def set(self, key: str, value: Any):
+        """Store a JSON-serializable value in every tier."""
+        serialized = json.dumps(value, cls=MongoJSONEncoder)
+        expires_at = time.time() + self.ttl
+        with self._lock:
+            self._store(key, serialized, expires_at)
+            if self._db is not None:
+                try:
+                    self._db.execute(
+                        "INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)",
+                        (key, serialized, expires_at)
+                    )
+                    self._db.execute("DELETE FROM cache WHERE expires_at <= ?", (time.time(),))
+                    self._db.commit()
+                except sqlite3.Error as e:
+                    logger.warning(f"Persistent {self.name} cache write failed: {str(e)}")
+
+    def clear(self):
+        """Drop every in-memory entry."""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def _store(self, key: str, serialized: str, expires_at: float):
+        if len(serialized) > self.max_bytes:
+            return
+        self._remove(key)
+        self._entries[key] = (expires_at, serialized)
+        self._bytes += len(serialized)
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self._counters["evictions"] += 1
+
+    def _remove(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= len(entry[1])
+
+    def stats(self) -> Dict[str, Any]:
+        """Return hit/miss counters and current occupancy."""
+        with self._lock:
+            lookups = self._counters["hits"] + self._counters["persistent_hits"] + self._counters["misses"]
+            hits = lookups - self._counters["misses"]
+            return {
+                **self._counters,
+                "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "persistent": self._db is not None
+            }
+
+class SpecialtyMatcher:
+    """Scores every specialty against a symptom description in a single pass.
+
+    All keywords and synonyms are compiled into one trie-shaped regular
+    expression with word boundaries, so matching cost depends on the length of
+    the text rather than the size of the vocabulary.
+    """
+
+    def __init__(self, vocabulary: Dict[str, Dict[str, float]]):
+        # phrase -> [(specialty, weight)]
+        self._terms = {}
+        # Ties are broken by the order specialties appear in the vocabulary
+        self._order = {specialty: index for index, specialty in enumerate(vocabulary)}
+        for specialty, phrases in vocabulary.items():
+            for phrase, weight in phrases.items():
+                phrase = self.normalize(phrase)
+                if phrase:
+                    self._terms.setdefault(phrase, []).append((specialty, float(weight)))
+        self.vocabulary_size = len(self._terms)
+        if self._terms:
+            self._pattern = re.compile(r"\b(" + self._trie_regex(self._terms) + r")(?:e?s)?\b")
+        else:
+            self._pattern = None
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        """Lowercase and collapse punctuation and whitespace to single spaces."""
+        return " ".join(re.sub(r"[^\w\s]", " ", text.lower()).split())
+
+    @staticmethod
+    def _trie_regex(phrases) -> str:
+        """Build a regex whose alternations follow a character trie of the phrases."""
+        trie = {}
+        for phrase in phrases:
+            node = trie
+            for char in phrase:
+                node = node.setdefault(char, {})
+            node[""] = {}
+
+        def build(node) -> str:
+            optional = "" in node
+            branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+            if not branches:
+                return ""
+            body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+            if optional:
+                return "(?:" + body + ")?"
+            return body
+
+        return build(trie)
+
+    @classmethod
+    def from_file(cls, path: str, base: Dict[str, Dict[str, Any]]) -> "SpecialtyMatcher":
+        """Build a matcher from SPECIALIZATIONS-style base keywords extended by a vocabulary file.
+
+        Base keywords get weight 1.0; file keywords override them and synonyms
+        inherit the weight of their keyword. Specialties missing from base are ignored.
+        """
+        vocabulary = {specialty: {keyword: 1.0 for keyword in info["keywords"]} for specialty, info in base.items()}
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            for specialty, entry in data.get("specialties", {}).items():
+                if specialty not in vocabulary:
+                    logger.warning(f"Ignoring vocabulary for unknown specialty: {specialty}")
+                    continue
+                keywords = entry.get("keywords", {})
+                vocabulary[specialty].update(keywords)
+                for keyword, synonyms in entry.get("synonyms", {}).items():
+                    weight = keywords.get(keyword, vocabulary[specialty].get(keyword, 1.0))
+                    for synonym in synonyms:
+                        vocabulary[specialty][synonym] = weight
+        except (OSError, ValueError) as e:
+            logger.warning(f"Specialty vocabulary not loaded ({str(e)}), using built-in keywords")
+        return cls(vocabulary)
+
+    def rank(self, symptoms: str) -> List[Dict[str, Any]]:
+        """Return matching specialties ordered by score, each with a confidence share."""
+        if self._pattern is None:
+            return []
+        scores = {}
+        matched = {}
+        terms = dict.fromkeys(match.group(1) for match in self._pattern.finditer(self.normalize(symptoms)))
+        for term in terms:
+            for specialty, weight in self._terms[term]:
+                scores[specialty] = scores.get(specialty, 0.0) + weight
+                matched.setdefault(specialty, []).append(term)
+        total = sum(scores.values())
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], self._order[item[0]]))
+        return [
+            {
+                "specialty": specialty,
+                "score": round(score, 3),
+                "confidence": round(score / total, 3),
+                "matched_terms": sorted(matched[specialty])
+            }
+            for specialty, score in ranked
+        ]
+
+class TriageTier:
+    """Answers common mild /recommend cases from versioned templates without a model call.
+
+    A request is served locally only when triage is enabled, the language is
+    English, the description is short, the best specialty holds at least
+    TRIAGE_MIN_CONFIDENCE of the keyword score, no red-flag term appears and
+    the severity terms do not mark it as severe. The red flags only catch
+    phrasings someone thought of, so the description must also be made of
+    known words: every word that is not a stop word, number or severity term
+    has to be in benign_terms for the matched specialty (or under common).
+    Specialties in escalate_specialties are never answered locally, and for
+    those in severity_cue_required the description must say how bad it is.
+    Everything else escalates to the model, with the reason recorded.
+    """
+
+    def __init__(self, data: Dict[str, Any], enabled: bool = TRIAGE_ENABLED,
+                 min_confidence: float = TRIAGE_MIN_CONFIDENCE, max_words: int = TRIAGE_MAX_WORDS):
+        self.enabled = enabled and bool(data.get("templates"))
+        self.version = data.get("version")
+        self.templates = data.get("templates", {})
+        self.min_confidence = min_confidence
+        self.max_words = max_words
+        self._red_flags = self._compile(data.get("red_flags", []))
+        self._urgent = self._compile(data.get("red_flags", []) + data.get("priority_terms", []))
+        self._severity = [
+            (severity, self._compile(data.get("severity_terms", {}).get(severity, [])))
+            for severity in ("severe", "moderate", "mild")
+        ]
+        self.severity_cue_required = frozenset(data.get("severity_cue_required", []))
+        self.escalate_specialties = frozenset(data.get("escalate_specialties", []))
+        benign_terms = data.get("benign_terms", {})
+        common = self._words(benign_terms.get("common", []))
+        self.benign_terms = {
+            specialty: common | self._words(terms) for specialty, terms in benign_terms.items() if specialty != "common"
+        }
+        # Words that only qualify a description: stop words, negations and the mild and moderate terms
+        self._qualifiers = SYMPTOM_STOP_WORDS | SYMPTOM_NEGATIONS | self._words(
+            data.get("severity_terms", {}).get("mild", []) + data.get("severity_terms", {}).get("moderate", [])
+        )
+        self._lock = threading.Lock()
+        self._counts = {"local": 0, "model": 0}
+        self._reasons: Dict[str, int] = {}
+
+    @staticmethod
+    def _compile(phrases) -> Optional[re.Pattern]:
+        phrases = {SpecialtyMatcher.normalize(phrase) for phrase in phrases} - {""}
+        if not phrases:
+            return None
+        return re.compile(r"\b(" + SpecialtyMatcher._trie_regex(phrases) + r")(?:e?s)?\b")
+
+    @staticmethod
+    def _words(phrases) -> frozenset:
+        return frozenset(word for phrase in phrases for word in SpecialtyMatcher.normalize(phrase).split())
+
+    def unlisted_words(self, text: str, specialty: str) -> List[str]:
+        """Words of a normalized description that are not known benign terms for the specialty."""
+        benign = self.benign_terms.get(specialty, frozenset())
+        return [
+            word for word in text.split()
+            if word not in self._qualifiers and not word.isdigit() and word not in benign
+            and not (word.endswith("s") and word[:-1] in benign)
+        ]
+
+    @classmethod
+    def from_file(cls, path: str) -> "TriageTier":
+        """Load templates and term lists; a missing or invalid file disables the tier."""
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            logger.info(f"Loaded triage templates version {data.get('version')} for {len(data.get('templates', {}))} specialties")
+        except (OSError, ValueError) as e:
+            logger.warning(f"Triage templates not loaded ({str(e)}), every recommendation goes to the model")
+            data = {}
+        return cls(data)
+
+    def is_urgent(self, symptoms: str) -> bool:
+        """Whether a description mentions a red-flag or priority term (used for scheduling)."""
+        return self._urgent is not None and self._urgent.search(SpecialtyMatcher.normalize(symptoms)) is not None
+
+    def severity(self, text: str) -> str:
+        """The most severe level named by a severity term, or "unspecified" when none is."""
+        for severity, pattern in self._severity:
+            if pattern is not None and pattern.search(text):
+                return severity
+        return "unspecified"
+
+    def decide(self, symptoms: str, language: str, matches: List[Dict[str, Any]]) -> Tuple[Optional[Dict[str, Any]], Dict[str, Any]]:
+        """Return (template or None, triage info) for a request; None means ask the model."""
+        text = SpecialtyMatcher.normalize(symptoms)
+        severity = self.severity(text)
+        template = None
+        if not self.enabled:
+            reason = "disabled"
+        elif not language.lower().startswith("en"):
+            reason = "language"
+        elif self._red_flags is not None and self._red_flags.search(text):
+            reason = "red_flag"
+        elif severity == "severe":
+            reason = "severe"
+        elif len(text.split()) > self.max_words:
+            reason = "long_description"
+        elif not matches:
+            reason = "no_match"
+        elif matches[0]["confidence"] < self.min_confidence:
+            reason = "low_confidence"
+        elif matches[0]["specialty"] in self.escalate_specialties:
+            reason = "escalated_specialty"
+        elif severity == "unspecified" and matches[0]["specialty"] in self.severity_cue_required:
+            reason = "no_severity_cue"
+        elif self.unlisted_words(text, matches[0]["specialty"]):
+            reason = "unlisted_words"
+        else:
+            # Without a severity term the mild template applies
+            template = self.templates.get(matches[0]["specialty"], {}).get(
+                "mild" if severity == "unspecified" else severity
+            )
+            reason = "template" if template is not None else "no_template"
+
+        tier = "local" if template is not None else "model"
+        with self._lock:
+            self._counts[tier] += 1
+            self._reasons[reason] = self._reasons.get(reason, 0) + 1
+        metrics.inc("ai_triage_total", tier=tier, reason=reason)
+        info = {"tier": tier, "reason": reason, "severity": severity}
+        if template is not None:
+            info["template_version"] = self.version
+            template = copy.deepcopy(template)
+        return template, info
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self._counts["local"] + self._counts["model"]
+            return {
+                "enabled": self.enabled,
+                "template_version": self.version,
+                "local": self._counts["local"],
+                "model": self._counts["model"],
+                "local_percent": round(100 * self._counts["local"] / total, 1) if total else 0.0,
+                "reasons": dict(self._reasons)
+            }
+
+class CircuitOpenError(RuntimeError):
+    """Raised instead of calling a backend whose circuit breaker is open."""
+
+class CircuitBreaker:
+    """Error-rate circuit breaker over the last `window` calls.
+
+    Opens when at least min_calls outcomes are recorded and the failure share
+    reaches error_rate. After cooldown seconds one probe call is let through
+    (half-open): success closes the breaker, failure opens it again.
+    """
+
+    def __init__(self, name: str, error_rate: float = GEMINI_BREAKER_ERROR_RATE,
+                 min_calls: int = GEMINI_BREAKER_MIN_CALLS, window: int = GEMINI_BREAKER_WINDOW,
+                 cooldown: float = GEMINI_BREAKER_COOLDOWN):
+        self.name = name
+        self.error_rate = error_rate
+        self.min_calls = min_calls
+        self.cooldown = cooldown
+        self._outcomes = deque(maxlen=max(1, window))
+        self._lock = threading.Lock()
+        self._state = "closed"
+        self._opened_at = 0.0
+        self._probing = False
+        self._counters = {"opened": 0, "short_circuited": 0}
+
+    def allow(self) -> bool:
+        """Whether a call may proceed; counts the refusals."""
+        with self._lock:
+            if self._state == "open" and time.monotonic() - self._opened_at >= self.cooldown:
+                self._state = "half_open"
+                self._probing = False
+            if self._state == "closed" or (self._state == "half_open" and not self._probing):
+                self._probing = self._state == "half_open"
+                return True
+            self._counters["short_circuited"] += 1
+            return False
+
+    def release(self):
+        """Give back a half-open probe slot for a call that ended without an outcome."""
+        with self._lock:
+            self._probing = False
+
+    def record(self, success: bool):
+        with self._lock:
+            if self._state == "half_open":
+                self._probing = False
+                if success:
+                    self._state = "closed"
+                    self._outcomes.clear()
+                else:
+                    self._open()
+                return
+            self._outcomes.append(success)
+            failures = self._outcomes.count(False)
+            if (self._state == "closed" and len(self._outcomes) >= self.min_calls
+                    and failures / len(self._outcomes) >= self.error_rate):
+                self._open()
+
+    def _open(self):
+        self._state = "open"
+        self._opened_at = time.monotonic()
+        self._counters["opened"] += 1
+        logger.warning(f"Circuit breaker {self.name} opened; failing fast for {self.cooldown}s")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            calls = len(self._outcomes)
+            return {
+                **self._counters,
+                "state": self._state,
+                "recent_calls": calls,
+                "recent_error_rate": round(self._outcomes.count(False) / calls, 4) if calls else 0.0
+            }
+
+class LatencyTracker:
+    """Rolling window of successful call latencies, for hedging delays."""
+
+    def __init__(self, window: int = 200):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def add(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def quantile(self, q: float) -> Optional[float]:
+        """The q-quantile of recent latencies, or None below GEMINI_HEDGE_MIN_SAMPLES samples."""
+        with self._lock:
+            if len(self._samples) < GEMINI_HEDGE_MIN_SAMPLES:
+                return None
+            ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+class SingleFlight:
+    """Coalesces concurrent calls for the same key into a single execution.
+
+    The first caller for a key runs the work; callers arriving while it is in
+    flight wait for it and receive a copy of its result (or its exception).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._async_calls = {}
+        self._counters = {"executions": 0, "coalesced": 0}
+
+    def do(self, key: str, fn):
+        """Run fn for key, or wait for the run already in flight."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = {"done": threading.Event(), "result": None, "error": None}
+                self._calls[key] = call
+                self._counters["executions"] += 1
+            else:
+                self._counters["coalesced"] += 1
+
+        if not leader:
+            call["done"].wait()
+            if call["error"] is not None:
+                raise call["error"]
+            return copy.deepcopy(call["result"])
+
+        try:
+            call["result"] = fn()
+            return call["result"]
+        except BaseException as e:
+            call["error"] = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call["done"].set()
+
+    async def do_async(self, key: str, coroutine_fn):
+        """Coroutine variant of do() for callers on one event loop."""
+        future = self._async_calls.get(key)
+        if future is not None:
+            with self._lock:
+                self._counters["coalesced"] += 1
+            return copy.deepcopy(await asyncio.shield(future))
+
+        future = asyncio.get_running_loop().create_future()
+        self._async_calls[key] = future
+        with self._lock:
+            self._counters["executions"] += 1
+        try:
+            result = await coroutine_fn()
+            future.set_result(result)
+            return result
+        except Exception as e:
+            future.set_exception(e)
+            # Mark the exception retrieved when nobody else was waiting on it
+            future.exception()
+            raise
+        finally:
+            # A cancelled leader cancels its followers instead of leaving them waiting forever
+            if not future.done():
+                future.cancel()
+            del self._async_calls[key]
+
+    def stats(self) -> Dict[str, Any]:
+        """Return execution and coalescing counters."""
+        with self._lock:
+            return {**self._counters, "in_flight": len(self._calls) + len(self._async_calls)}
+
+_OUTSIDE_STRING_RUN = re.compile(r"[^\"'{}\[\]]+")
+_DOUBLE_QUOTED_STRING = re.compile(r'"[^"\\\n]*(?:\\.[^"\\\n]*)*"')
+_DOUBLE_QUOTED_RUN = re.compile(r'[^"\\\n]+')
+_SINGLE_QUOTED_RUN = re.compile(r"[^'\"\\\n]+")
+
+def _strip_trailing_comma(out: list):
+    if out:
+        tail = out[-1].rstrip()
+        if tail.endswith(","):
+            out[-1] = tail[:-1]
+
+def repair_json(text: str) -> Optional[str]:
+    """Repair the JSON object embedded in a model response in a single pass.
+
+    Skips anything before the first brace (prose, code fences) and after its
+    matching close, drops trailing commas, rewrites single-quoted strings
+    without touching apostrophes inside double-quoted ones, escapes raw
+    newlines in strings. Returns None when the text contains no object or
+    the object is never closed: a truncated response is missing content, and
+    closing it here would pass a partial answer off as a complete one.
+    """
+    pos = text.find("{")
+    if pos < 0:
+        return None
+    out = []
+    stack = []
+    quote = None
+    length = len(text)
+    while pos < length:
+        if quote is None:
+            run = _OUTSIDE_STRING_RUN.match(text, pos)
+            if run:
+                out.append(run.group())
+                pos = run.end()
+                continue
+            char = text[pos]
+            if char == '"':
+                # Well-formed strings are copied whole; others are rewritten below
+                string = _DOUBLE_QUOTED_STRING.match(text, pos)
+                if string:
+                    out.append(string.group())
+                    pos = string.end()
+                    continue
+            if char in "\"'":
+                quote = char
+                out.append('"')
+            elif char in "{[":
+                stack.append("}" if char == "{" else "]")
+                out.append(char)
+            else:
+                _strip_trailing_comma(out)
+                out.append(stack.pop() if stack else char)
+                if not stack:
+                    break
+        else:
+            run = (_DOUBLE_QUOTED_RUN if quote == '"' else _SINGLE_QUOTED_RUN).match(text, pos)
+            if run:
+                out.append(run.group())
+                pos = run.end()
+                continue
+            char = text[pos]
+            if char == "\\":
+                escaped = text[pos + 1:pos + 2]
+                out.append("'" if quote == "'" and escaped == "'" else char + escaped)
+                pos += 2
+                continue
+            if char == quote:
+                out.append('"')
+                quote = None
+            elif char == "\n":
+                out.append("\\n")
+            else:
+                # A double quote inside a single-quoted string
+                out.append('\\"')
+        pos += 1
+
+    if stack:
+        return None
+    return "".join(out)
+
+class ParseStats:
+    """Counts how model responses were parsed, for the parse-failure rate."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {"responses": 0, "direct": 0, "extracted": 0, "repaired": 0, "truncated": 0, "failed": 0}
+
+    def record(self, outcome: str):
+        with self._lock:
+            self._counters["responses"] += 1
+            self._counters[outcome] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Return parse outcome counters and the failure rate."""
+        with self._lock:
+            responses = self._counters["responses"]
+            return {
+                **self._counters,
+                "failure_rate": round((self._counters["failed"] + self._counters["truncated"]) / responses, 4) if responses else 0.0
+            }
+
+json_parse_stats = ParseStats()
+_json_decoder = json.JSONDecoder()
+
+class JSONSectionStream:
+    """Incrementally parses a streamed JSON object, one top-level member at a time.
+
+    feed() returns the (key, value) pairs whose values became complete with
+    the new text. Anything before the opening brace, such as a code fence, is
+    skipped. A member that does not parse is dropped here and left to the
+    final full-response parse.
+    """
+
+    def __init__(self):
+        self.text = ""
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self._member_start = None
+        self._closed = False
+
+    def feed(self, chunk: str) -> List[Tuple[str, Any]]:
+        self.text += chunk
+        sections = []
+        text = self.text
+        while self._pos < len(text) and not self._closed:
+            char = text[self._pos]
+            if self._member_start is None:
+                if char == "{":
+                    self._depth = 1
+                    self._member_start = self._pos + 1
+            elif self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char in "{[":
+                self._depth += 1
+            elif char in "}]":
+                self._depth -= 1
+                if self._depth == 0:
+                    self._emit(text[self._member_start:self._pos], sections)
+                    self._closed = True
+            elif char == "," and self._depth == 1:
+                self._emit(text[self._member_start:self._pos], sections)
+                self._member_start = self._pos + 1
+            self._pos += 1
+        return sections
+
+    @staticmethod
+    def _emit(fragment: str, sections: list):
+        fragment = fragment.strip()
+        if not fragment:
+            return
+        try:
+            sections.extend(json.loads("{" + fragment + "}").items())
+        except ValueError:
+            try:
+                sections.extend(json.loads(repair_json("{" + fragment + "}")).items())
+            except ValueError:
+                pass
+
+# Words that carry no clinical meaning when comparing symptom descriptions.
+# Negations and severity words are deliberately kept.
+SYMPTOM_STOP_WORDS = frozenset("""
+    a about after again all also am an and any are as at be been before being but by can could
+    did do does doing for from get getting got had has have having he her him his how i i'm im i've i'd
+    in into is it its just last like me my myself of on or our past please since so some
+    she than that the their them then there these they this those to too up very was we were
+    what when which while who with would you your feel feeling feels it's
+""".split())
+# Words that negate the symptom after them ("no fever", "without pain", "don't have a cough")
+SYMPTOM_NEGATIONS = frozenset("""
+    no not without never none nor denies deny don't dont doesn't didn't isn't haven't hasn't can't cannot
+""".split())
+
+def normalize_symptoms(symptoms: str) -> str:
+    """Canonical form of a symptom description: lowercased, stop words removed, sorted.
+
+    A negation is attached to the word it negates before sorting, so "fever,
+    no cough" and "cough, no fever" keep different forms.
+    """
+    tokens = re.findall(r"[a-z0-9]+(?:'[a-z]+)?", symptoms.lower().replace("\u2019", "'"))
+    terms = set()
+    negated = False
+    for token in tokens:
+        if token in SYMPTOM_NEGATIONS:
+            negated = True
+        elif token not in SYMPTOM_STOP_WORDS:
+            terms.add(f"no-{token}" if negated else token)
+            negated = False
+    return " ".join(sorted(terms))
+
+class TaskPrompt:
+    """A prompt split into a static system instruction and a per-request template.
+
+    The instruction (role, guidelines and JSON schema) is compiled once and
+    bound to the task's model handles, so each request only sends the
+    rendered template: the language line and the symptoms or report text.
+    """
+
+    def __init__(self, instruction: str, template: str):
+        self.instruction = textwrap.dedent(instruction).strip()
+        self.template = textwrap.dedent(template).strip()
+
+    def render(self, language: str = "en-US", **fields) -> str:
+        """Build the per-request part of the prompt."""
+        language_prompt = f"Respond in {language} language.\n" if language != "en-US" else ""
+        return language_prompt + self.template.format(**fields)
+
+TASK_PROMPTS = {
+    "precautions": TaskPrompt(
+        instruction="""
+        Analyze the symptoms in each message and provide detailed precautions and recommendations in JSON format.
+
+        Required JSON structure:
+        {
+            "initial_assessment": {
+                "severity": "mild/moderate/severe",
+                "immediate_action_required": true/false,
+                "seek_emergency": true/false
+            },
+            "precautions": [
+                {
+                    "category": "category name",
+                    "measures": ["detailed precautionary measures"],
+                    "priority": "high/medium/low"
+                }
+            ],
+            "lifestyle_recommendations": [
+                {
+                    "area": "area of focus",
+                    "suggestions": ["specific actionable suggestions"],
+                    "duration": "temporary/long-term"
+                }
+            ],
+            "home_remedies": [
+                {
+                    "remedy": "remedy name",
+                    "instructions": "how to apply/use",
+                    "caution": "any warnings or contraindications"
+                }
+            ],
+            "when_to_seek_emergency": ["list of warning signs that require immediate medical attention"]
+        }
+
+        If the message asks for another language, write every text value in that language.
+        Ensure the response is ONLY the JSON object with no additional text.
+        """,
+        template="""
+        Symptoms:
+        {symptoms}
+        """
+    ),
+    "analysis": TaskPrompt(
+        instruction="""
+        Analyze the medical report in each message as a specialized medical AI. Provide a detailed analysis in JSON format.
+
+        Guidelines:
+        1. Extract ALL symptoms mentioned, even mild ones
+        2. List ALL possible diseases that match the symptoms
+        3. Consider test results and vital signs if present
+        4. Recommend specialists based on symptoms and possible conditions
+        5. Provide a comprehensive summary of the findings
+        6. Include severity assessment of the overall condition
+
+        Required JSON structure:
+        {
+            "summary": {
+                "overview": "Brief overview of the case how diagnostic it and need to be reviewed by a specialist",
+                "severity_assessment": "mild/moderate/severe",
+                "key_findings": ["list of important findings"],
+                "urgent_attention": "yes/no",
+                "follow_up_timeline": "immediate/within week/routine"
+            },
+            "symptoms": [
+                {
+                    "symptom": "detailed symptom",
+                    "severity": "mild/moderate/severe",
+                    "duration": "duration if mentioned",
+                    "related_conditions": ["possible related conditions"]
+                }
+            ],
+            "possible_diseases": [
+                {
+                    "disease": "disease name",
+                    "confidence": "high/medium/low",
+                    "reasoning": "brief explanation",
+                    "common_complications": ["possible complications"]
+                }
+            ],
+            "recommended_doctor": {
+                "primary": {
+                    "specialist": "main specialist needed",
+                    "specialty_area": "specific area of expertise",
+                    "urgency": "immediate/soon/routine"
+                },
+                "secondary": {
+                    "specialist": "additional specialist if needed",
+                    "specialty_area": "specific area of expertise",
+                    "urgency": "immediate/soon/routine"
+                },
+                "reasoning": "explanation for specialist choices"
+            },
+            "precautions": [
+                {
+                    "precaution": "specific precaution",
+                    "importance": "critical/important/recommended",
+                    "duration": "how long to follow",
+                    "details": "additional details"
+                }
+            ],
+            "additional_tests": [
+                {
+                    "test": "test name",
+                    "purpose": "why it's needed",
+                    "urgency": "immediate/soon/routine"
+                }
+            ],
+            "lifestyle_recommendations": [
+                {
+                    "category": "diet/exercise/sleep/etc",
+                    "recommendation": "specific advice",
+                    "importance": "high/medium/low"
+                }
+            ]
+        }
+
+        If the message asks for another language, write every text value in that language.
+        Ensure the response is ONLY the JSON object with no additional text.
+        """,
+        template="""
+        Medical Report:
+        {text}
+        """
+    ),
+    "translation": TaskPrompt(
+        instruction="""
+        Translate patient-facing medical text into the target language named in each message.
+
+        The message contains a JSON object mapping ids to source strings. Return a JSON object with exactly
+        the same ids, each mapped to the translation of its string. Translate the meaning faithfully, keep
+        numbers, units, doses and test names exact, and use words a patient would understand.
+        Do not add, drop, merge or explain items.
+        Ensure the response is ONLY the JSON object with no additional text.
+        """,
+        template="""
+        Target language: {target}
+        Strings:
+        {strings}
+        """
     )
-except Exception as e:
-    logger.error(f"Gemini API initialization error: {str(e)}")
-    gemini_model_name = None
+}
+
+class PromptStats:
+    """Per-task accounting of the prompt text sent per request.
+
+    "inline" is what the request would cost with the instruction pasted into
+    every prompt, "sent" is what actually goes out next to the bound
+    system instruction.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tasks: Dict[str, Dict[str, int]] = {}
+
+    def record(self, task: str, prompt: str):
+        inline_chars = len(TASK_PROMPTS[task].instruction) + len(prompt)
+        logger.info(f"Prompt for {task}: {len(prompt)} chars sent ({inline_chars} inline)")
+        with self._lock:
+            counters = self._tasks.setdefault(task, {"requests": 0, "sent_chars": 0, "inline_chars": 0})
+            counters["requests"] += 1
+            counters["sent_chars"] += len(prompt)
+            counters["inline_chars"] += inline_chars
+
+    def stats(self) -> Dict[str, Any]:
+        """Return average prompt sizes per task, in characters and estimated tokens."""
+        with self._lock:
+            stats = {}
+            for task, counters in self._tasks.items():
+                requests = counters["requests"]
+                stats[task] = {
+                    "requests": requests,
+                    "instruction_tokens": len(TASK_PROMPTS[task].instruction) // CHARS_PER_TOKEN,
+                    "avg_sent_tokens": round(counters["sent_chars"] / requests / CHARS_PER_TOKEN, 1),
+                    "avg_inline_tokens": round(counters["inline_chars"] / requests / CHARS_PER_TOKEN, 1),
+                    "saved_ratio": round(1 - counters["sent_chars"] / counters["inline_chars"], 4)
+                }
+            return stats
+
+prompt_stats = PromptStats()
+
+# Per-task breakers and latency windows outlive MedicalSystem instances
+model_breakers = {task: CircuitBreaker(f"gemini_{task}") for task in TASK_PROMPTS}
+model_latency = {task: LatencyTracker() for task in TASK_PROMPTS}
+# Runs model attempts so a slow one can be hedged while the request thread waits
+_attempt_executor = ThreadPoolExecutor(
+    max_workers=2 * GEMINI_POOL_SIZE * len(TASK_PROMPTS), thread_name_prefix="model-attempt"
+)
+
+# Process pool for page extraction, started on the first multi-page report
+_pdf_pool = None
+_pdf_pool_lock = threading.Lock()
+
+def get_pdf_pool() -> Optional[ProcessPoolExecutor]:
+    """Return the shared extraction process pool, or None when parallelism is disabled."""
+    global _pdf_pool
+    if PDF_EXTRACT_WORKERS < 2:
+        return None
+    if _pdf_pool is None:
+        with _pdf_pool_lock:
+            if _pdf_pool is None:
+                _pdf_pool = ProcessPoolExecutor(
+                    max_workers=PDF_EXTRACT_WORKERS,
+                    mp_context=multiprocessing.get_context("spawn")
+                )
+    return _pdf_pool
+
+class DoctorSearch:
+    """Ranked, keyset-paginated search for available doctors of one specialty.
+
+    With coordinates, doctors within DOCTOR_SEARCH_RADIUS_KM are ranked
+    nearest first, in DOCTOR_DISTANCE_BAND_KM bands ordered by experience.
+    Without them, doctors in the requested city come first and everyone else
+    after, each most experienced first. The city (matched case-insensitively)
+    is first resolved to its doctors' user ids through the users city index,
+    so neither segment joins more than one page of doctors; the ids are kept
+    in the doctor directory cache, so later pages skip that lookup. A page cursor
+    holds the sort key of the last doctor returned, so every page is one
+    index range scan instead of a skip over the pages before it.
+    """
+
+    def __init__(self, specialty: str, city: Optional[str] = None,
+                 coordinates: Optional[Tuple[float, float]] = None,
+                 page_size: int = DOCTOR_PAGE_SIZE, cursor: Optional[str] = None):
+        if not 1 <= page_size <= DOCTOR_MAX_PAGE_SIZE:
+            raise ValueError(f"page_size must be between 1 and {DOCTOR_MAX_PAGE_SIZE}")
+        self.specialty = specialty
+        self.city = city.strip() if isinstance(city, str) and city.strip() else None
+        # (longitude, latitude), the GeoJSON order
+        self.coordinates = coordinates
+        self.page_size = page_size
+        if coordinates is not None:
+            self.segments = ["near"]
+        elif self.city:
+            self.segments = ["city", "elsewhere"]
+        else:
+            self.segments = ["all"]
+        self.fingerprint = hashlib.sha256(
+            f"{specialty}|{(self.city or '').casefold()}|{coordinates}".encode("utf-8")
+        ).hexdigest()[:12]
+        self.segment, self.after = self.segments[0], None
+        if cursor:
+            self.segment, self.after = self._decode(cursor)
+
+    @classmethod
+    def from_request(cls, specialty: str, fields: Dict[str, Any]) -> "DoctorSearch":
+        """Build a search from request fields: city, location ({lat, lng}), page_size and cursor."""
+        coordinates = None
+        location = fields.get("location")
+        if location is not None:
+            try:
+                coordinates = (float(location["lng"]), float(location["lat"]))
+            except (KeyError, TypeError, ValueError):
+                raise ValueError("location must be an object with numeric lat and lng")
+            if not (-180 <= coordinates[0] <= 180 and -90 <= coordinates[1] <= 90):
+                raise ValueError("location is out of range")
+        try:
+            page_size = int(fields.get("page_size") or DOCTOR_PAGE_SIZE)
+        except (TypeError, ValueError):
+            raise ValueError("page_size must be an integer")
+        return cls(specialty, fields.get("city"), coordinates, page_size, fields.get("cursor"))
+
+    def _encode(self, segment: str, after: Optional[list]) -> str:
+        payload = json.dumps({"q": self.fingerprint, "s": segment, "a": after}, separators=(",", ":"))
+        return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+    def _decode(self, cursor: str) -> Tuple[str, Optional[list]]:
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+            segment, after = payload["s"], payload["a"]
+            if after is not None:
+                ObjectId(after[-1])
+        except Exception:
+            raise ValueError("Invalid cursor")
+        if payload.get("q") != self.fingerprint or segment not in self.segments:
+            raise ValueError("Cursor belongs to a different search")
+        return segment, after
+
+    def cache_key(self) -> str:
+        return f"{self.fingerprint}|{self.page_size}|{self.segment}|{self.after}"
+
+    def city_cache_key(self) -> str:
+        return f"city_users|{self.city.casefold()}"
+
+    def cached_city_users(self) -> Optional[list]:
+        """Return the city's doctor user ids from the directory cache, or None on a miss."""
+        cached = doctor_directory_cache.get(self.city_cache_key())
+        return None if cached is None else [ObjectId(user_id) for user_id in cached]
+
+    def city_pipeline(self) -> Tuple[str, list]:
+        """Return (collection, aggregation) listing the user ids of doctors in the city; run with CITY_COLLATION."""
+        return "users", [
+            {"$match": {"address.city": self.city, "role": "doctor"}},
+            {"$project": {"_id": 1}}
+        ]
+
+    def pipeline(self, segment: str, after: Optional[list], limit: int,
+                 city_users: Optional[list] = None) -> Tuple[str, list]:
+        """Return (collection, aggregation) for up to limit doctors of a segment after a sort key.
+
+        The city and elsewhere segments take city_users, the user ids from city_pipeline().
+        """
+        if segment == "near":
+            return "users", self._near_pipeline(after, limit)
+        match = {"specialization": self.specialty, "isAvailable": True}
+        if segment == "city":
+            match["userId"] = {"$in": city_users}
+        elif segment == "elsewhere":
+            match["userId"] = {"$nin": city_users}
+        if after is not None:
+            experience, doctor_id = after[0], ObjectId(after[1])
+            match["$or"] = [
+                {"experience": {"$lt": experience}},
+                {"experience": experience, "_id": {"$gt": doctor_id}}
+            ]
+        pipeline = [
+            {"$match": match},
+            {"$sort": {"experience": -1, "_id": 1}},
+            # Nothing filters on the joined user, so only one page needs joining
+            {"$limit": limit},
+            {"$lookup": {"from": "users", "localField": "userId", "foreignField": "_id", "as": "user"}},
+            {"$unwind": "$user"},
+            {"$project": {
+                "degree": 1,
+                "experience": 1,
+                "user._id": 1,
+                "user.firstName": 1,
+                "user.lastName": 1,
+                "user.address.city": 1
+            }}
+        ]
+        return "doctors", pipeline
+
+    def _near_pipeline(self, after: Optional[list], limit: int) -> list:
+        band_meters = max(DOCTOR_DISTANCE_BAND_KM, 0.001) * 1000
+        geo_near = {
+            "near": {"type": "Point", "coordinates": list(self.coordinates)},
+            "distanceField": "distance",
+            "maxDistance": DOCTOR_SEARCH_RADIUS_KM * 1000,
+            "query": {"role": "doctor"},
+            "spherical": True
+        }
+        if after is not None:
+            # Skip the bands already paged through inside the geo index scan
+            geo_near["minDistance"] = after[0] * band_meters
+        pipeline = [
+            {"$geoNear": geo_near},
+            {"$lookup": {"from": "doctors", "localField": "_id", "foreignField": "userId", "as": "doctor"}},
+            {"$unwind": "$doctor"},
+            {"$match": {"doctor.specialization": self.specialty, "doctor.isAvailable": True}},
+            {"$addFields": {"band": {"$floor": {"$divide": ["$distance", band_meters]}}}}
+        ]
+        if after is not None:
+            band, experience, user_id = after[0], after[1], ObjectId(after[2])
+            pipeline.append({"$match": {"$or": [
+                {"band": {"$gt": band}},
+                {"band": band, "doctor.experience": {"$lt": experience}},
+                {"band": band, "doctor.experience": experience, "_id": {"$gt": user_id}}
+            ]}})
+        pipeline += [
+            {"$sort": {"band": 1, "doctor.experience": -1, "_id": 1}},
+            {"$limit": limit},
+            {"$project": {
+                "firstName": 1,
+                "lastName": 1,
+                "address.city": 1,
+                "distance": 1,
+                "band": 1,
+                "doctor.degree": 1,
+                "doctor.experience": 1
+            }}
+        ]
+        return pipeline
+
+    @staticmethod
+    def summarize(document: Dict[str, Any], segment: str) -> Dict[str, Any]:
+        if segment == "near":
+            summary = MedicalSystem.doctor_summary(document["doctor"], document)
+            summary["distanceKm"] = round(document["distance"] / 1000, 2)
+            return summary
+        return MedicalSystem.doctor_summary(document, document["user"])
+
+    @staticmethod
+    def sort_key(document: Dict[str, Any], segment: str) -> list:
+        if segment == "near":
+            return [document["band"], document["doctor"].get("experience"), str(document["_id"])]
+        return [document.get("experience"), str(document["_id"])]
+
+    def _take(self, segment: str, found: list, doctors: list) -> Optional[str]:
+        """Add a segment's results to the page; return the next cursor once the page is full."""
+        want = self.page_size - len(doctors)
+        doctors.extend(self.summarize(document, segment) for document in found[:want])
+        if len(found) <= want:
+            return None
+        # A page that ended exactly at a segment boundary resumes at the start of this segment
+        return self._encode(segment, self.sort_key(found[want - 1], segment) if want else None)
+
+    def _remaining(self):
+        after = self.after
+        for segment in self.segments[self.segments.index(self.segment):]:
+            yield segment, after
+            after = None
+
+    @staticmethod
+    def _user_ids(found: list) -> list:
+        return [document["_id"] for document in found]
+
+    def run(self, fetch) -> Tuple[list, Optional[str]]:
+        """Return (doctors, next cursor or None).
+
+        fetch(collection, pipeline, collation) runs one aggregation; collation may be None.
+        """
+        doctors = []
+        city_users = None
+        if self.city and self.coordinates is None:
+            city_users = self.cached_city_users()
+            if city_users is None:
+                city_users = self._user_ids(fetch(*self.city_pipeline(), CITY_COLLATION))
+                doctor_directory_cache.set(self.city_cache_key(), city_users)
+        for segment, after in self._remaining():
+            found = fetch(*self.pipeline(segment, after, self.page_size - len(doctors) + 1, city_users), None)
+            next_cursor = self._take(segment, found, doctors)
+            if next_cursor is not None:
+                return doctors, next_cursor
+        return doctors, None
+
+    async def run_async(self, fetch) -> Tuple[list, Optional[str]]:
+        """Async variant of run; fetch returns an awaitable."""
+        doctors = []
+        city_users = None
+        if self.city and self.coordinates is None:
+            city_users = self.cached_city_users()
+            if city_users is None:
+                city_users = self._user_ids(await fetch(*self.city_pipeline(), CITY_COLLATION))
+                doctor_directory_cache.set(self.city_cache_key(), city_users)
+        for segment, after in self._remaining():
+            found = await fetch(*self.pipeline(segment, after, self.page_size - len(doctors) + 1, city_users), None)
+            next_cursor = self._take(segment, found, doctors)
+            if next_cursor is not None:
+                return doctors, next_cursor
+        return doctors, None
 
 class MedicalSystem:
     SPECIALIZATIONS = {
@@ -135,285 +1778,665 @@ class MedicalSystem:
         }
     }
 
-    def __init__(self):
+    def __init__(self, pool_size: int = GEMINI_POOL_SIZE):
         try:
             global gemini_model_name
             if gemini_model_name:
-                self.model = genai.GenerativeModel(gemini_model_name)
-                logger.info(f"Medical system initialized with model: {gemini_model_name}")
+                # One pool per task, each bound to that task's system instruction
+                self.model_pools = {
+                    task: ModelPool(gemini_model_name, pool_size, system_instruction=prompt.instruction)
+                    for task, prompt in TASK_PROMPTS.items()
+                }
+                logger.info(f"Medical system initialized with model: {gemini_model_name} (pool size {pool_size})")
             else:
                 logger.error("No valid Gemini model name available")
-                self.model = None
+                self.model_pools = None
         except Exception as e:
             logger.error(f"Gemini model initialization error: {str(e)}")
-            self.model = None
+            self.model_pools = None
+
+    def generate(self, task: str, prompt: str):
+        """Run a generation on a pooled model handle of the task.
+
+        The call gets GEMINI_DEADLINE_SECONDS in total. Failed attempts are
+        retried within that budget, an attempt slower than the task's recent
+        p95 is hedged with a duplicate, and an open circuit breaker raises
+        CircuitOpenError at once so callers serve their fallback. A pool that
+        stays full for GEMINI_POOL_TIMEOUT is not retried: its handles are
+        busy with calls that are themselves still waiting on the backend.
+        """
+        prompt_stats.record(task, prompt)
+        deadline = time.monotonic() + GEMINI_DEADLINE_SECONDS
+        try:
+            with stage("generate"):
+                response = self._generate_with_retries(task, prompt, deadline)
+        except Exception:
+            metrics.inc("ai_llm_requests_total", task=task, outcome="error")
+            raise
+        metrics.inc("ai_llm_requests_total", task=task, outcome="ok")
+        record_llm_usage(task, response)
+        return response
+
+    def _generate_with_retries(self, task: str, prompt: str, deadline: float):
+        last_error = None
+        for attempt in range(max(1, GEMINI_MAX_ATTEMPTS)):
+            if attempt:
+                metrics.inc("ai_llm_retries_total", task=task)
+                time.sleep(min(GEMINI_RETRY_BACKOFF * 2 ** (attempt - 1), max(0.0, deadline - time.monotonic()) / 2))
+            try:
+                return self._hedged_attempt(task, prompt, deadline)
+            except (CircuitOpenError, PoolTimeoutError):
+                raise
+            except Exception as e:
+                last_error = e
+                logger.warning(f"Model attempt {attempt + 1} for {task} failed: {str(e)}")
+                if time.monotonic() >= deadline:
+                    break
+        raise last_error
+
+    def _hedged_attempt(self, task: str, prompt: str, deadline: float):
+        """One attempt, duplicated on an idle handle if it outlives the task's hedge delay."""
+        delay = model_latency[task].quantile(GEMINI_HEDGE_QUANTILE) if GEMINI_HEDGE else None
+        if delay is None:
+            return self._attempt(task, prompt, deadline)
+
+        primary = _attempt_executor.submit(contextvars.copy_context().run, self._attempt, task, prompt, deadline)
+        done, _ = wait([primary], timeout=min(delay, max(0.0, deadline - time.monotonic())))
+        # Hedging a saturated pool would only queue behind the requests it is meant to overtake
+        if done or self.model_pools[task].stats()["idle"] == 0 or time.monotonic() >= deadline:
+            return primary.result()
+
+        metrics.inc("ai_llm_hedges_total", task=task)
+        hedge = _attempt_executor.submit(contextvars.copy_context().run, self._attempt, task, prompt, deadline)
+        pending = {primary, hedge}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is hedge:
+                        metrics.inc("ai_llm_hedges_won_total", task=task)
+                    return future.result()
+                error = error or future.exception()
+        raise error
+
+    def _attempt(self, task: str, prompt: str, deadline: float):
+        """A single model call bounded by what is left of the deadline."""
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise TimeoutError(f"Model deadline of {GEMINI_DEADLINE_SECONDS}s exceeded")
+        breaker = model_breakers[task]
+        with self._checkout(task, min(remaining, GEMINI_POOL_TIMEOUT)) as model:
+            started = time.perf_counter()
+            try:
+                response = model.generate_content(
+                    prompt, request_options={"timeout": max(0.1, deadline - time.monotonic())}
+                )
+            except Exception:
+                breaker.record(False)
+                raise
+        breaker.record(True)
+        model_latency[task].add(time.perf_counter() - started)
+        return response
+
+    @contextmanager
+    def _checkout(self, task: str, timeout: float = GEMINI_POOL_TIMEOUT):
+        """Check out a handle of the task's pool, asking its circuit breaker first.
+
+        An open breaker raises CircuitOpenError without waiting for a handle,
+        which in an outage are all held by hung calls. A checkout that times
+        out gives back the breaker's half-open probe slot, since no call was made.
+        """
+        breaker = model_breakers[task]
+        if not breaker.allow():
+            raise CircuitOpenError(f"Model circuit for {task} is open")
+        try:
+            with self.model_pools[task].model(timeout=timeout) as model:
+                yield model
+        except PoolTimeoutError:
+            breaker.release()
+            raise
+
+    def generate_stream(self, task: str, prompt: str):
+        """Yield response text chunks as the model generates them.
+
+        Streams share the deadline and circuit breaker but are neither
+        retried nor hedged, since part of the answer may already be sent.
+        """
+        prompt_stats.record(task, prompt)
+        breaker = model_breakers[task]
+        chunk = None
+        try:
+            with stage("generate"), self._checkout(task) as model:
+                succeeded = None
+                try:
+                    for chunk in model.generate_content(
+                        prompt, stream=True, request_options={"timeout": GEMINI_DEADLINE_SECONDS}
+                    ):
+                        if chunk.parts:
+                            yield chunk.text
+                    succeeded = True
+                except Exception:
+                    succeeded = False
+                    raise
+                finally:
+                    # A client that disconnects mid-stream leaves no outcome to record
+                    if succeeded is None:
+                        breaker.release()
+                    else:
+                        breaker.record(succeeded)
+        except Exception:
+            metrics.inc("ai_llm_requests_total", task=task, outcome="error")
+            raise
+        metrics.inc("ai_llm_requests_total", task=task, outcome="ok")
+        # The final chunk carries the usage for the whole response
+        record_llm_usage(task, chunk)
+
+    def stream_sections(self, task: str, prompt: str):
+        """Stream a generation, yielding ("section", key, value) as each top-level member parses.
+
+        Ends with ("complete", parsed_response) built from the full text.
+        """
+        parser = JSONSectionStream()
+        for text in self.generate_stream(task, prompt):
+            for key, value in parser.feed(text):
+                yield "section", key, value
+        yield "complete", None, self.clean_json_response(parser.text)
+
+    async def generate_async(self, task: str, prompt: str):
+        """Async variant of generate, with the same deadline, retries, hedging and breaker."""
+        prompt_stats.record(task, prompt)
+        deadline = time.monotonic() + GEMINI_DEADLINE_SECONDS
+        try:
+            with stage("generate"):
+                response = await self._generate_with_retries_async(task, prompt, deadline)
+        except Exception:
+            metrics.inc("ai_llm_requests_total", task=task, outcome="error")
+            raise
+        metrics.inc("ai_llm_requests_total", task=task, outcome="ok")
+        record_llm_usage(task, response)
+        return response
+
+    async def _generate_with_retries_async(self, task: str, prompt: str, deadline: float):
+        last_error = None
+        for attempt in range(max(1, GEMINI_MAX_ATTEMPTS)):
+            if attempt:
+                metrics.inc("ai_llm_retries_total", task=task)
+                await asyncio.sleep(min(GEMINI_RETRY_BACKOFF * 2 ** (attempt - 1), max(0.0, deadline - time.monotonic()) / 2))
+            try:
+                return await self._hedged_attempt_async(task, prompt, deadline)
+            except CircuitOpenError:
+                raise
+            except Exception as e:
+                last_error = e
+                logger.warning(f"Model attempt {attempt + 1} for {task} failed: {str(e)}")
+                if time.monotonic() >= deadline:
+                    break
+        raise last_error
+
+    async def _hedged_attempt_async(self, task: str, prompt: str, deadline: float):
+        delay = model_latency[task].quantile(GEMINI_HEDGE_QUANTILE) if GEMINI_HEDGE else None
+        if delay is None:
+            return await self._attempt_async(task, prompt, deadline)
+
+        primary = asyncio.ensure_future(self._attempt_async(task, prompt, deadline))
+        done, _ = await asyncio.wait({primary}, timeout=min(delay, max(0.0, deadline - time.monotonic())))
+        if done or time.monotonic() >= deadline:
+            return await primary
+
+        metrics.inc("ai_llm_hedges_total", task=task)
+        hedge = asyncio.ensure_future(self._attempt_async(task, prompt, deadline))
+        pending = {primary, hedge}
+        error = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    # Unlike threads, the slower async call can be abandoned
+                    for other in pending:
+                        other.cancel()
+                    if future is hedge:
+                        metrics.inc("ai_llm_hedges_won_total", task=task)
+                    return future.result()
+                error = error or future.exception()
+        raise error
+
+    async def _attempt_async(self, task: str, prompt: str, deadline: float):
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise TimeoutError(f"Model deadline of {GEMINI_DEADLINE_SECONDS}s exceeded")
+        breaker = model_breakers[task]
+        if not breaker.allow():
+            raise CircuitOpenError(f"Model circuit for {task} is open")
+        started = time.perf_counter()
+        try:
+            response = await asyncio.wait_for(
+                self.model_pools[task].async_model.generate_content_async(prompt, request_options={"timeout": remaining}),
+                remaining
+            )
+        except asyncio.CancelledError:
+            # A cancelled hedge says nothing about backend health; free the half-open probe slot
+            breaker.release()
+            raise
+        except Exception:
+            breaker.record(False)
+            raise
+        breaker.record(True)
+        model_latency[task].add(time.perf_counter() - started)
+        return response
+
+    def pool_stats(self) -> Optional[Dict[str, Any]]:
+        """Return model pool occupancy per task, or None when the model is unavailable."""
+        if self.model_pools is None:
+            return None
+        return {task: pool.stats() for task, pool in self.model_pools.items()}
 
     @staticmethod
-    def extract_text_from_pdf(pdf_path: str) -> str:
+    def extract_text_from_pdf(pdf_source) -> str:
         """Extract text from PDF file."""
-        text = []
-        try:
-            with open(pdf_path, "rb") as file:
-                reader = PyPDF2.PdfReader(file)
-                for page in reader.pages:
-                    page_text = page.extract_text()
-                    if page_text:
-                        text.append(page_text)
-            return ' '.join(text)
-        except Exception as e:
-            raise Exception(f"Error reading PDF: {str(e)}")
+        return ' '.join(MedicalSystem.extract_pages_from_pdf(pdf_source))
+
+    @staticmethod
+    def extract_pages_from_pdf(pdf_source) -> List[str]:
+        """Extract the non-empty page texts of a PDF given as a path, bytes or a binary stream.
+
+        Reports with at least PDF_PARALLEL_MIN_PAGES pages are split into page
+        ranges and extracted concurrently in the extraction process pool.
+        """
+        with stage("pdf_extract"):
+            try:
+                if isinstance(pdf_source, str):
+                    with open(pdf_source, "rb") as file:
+                        pdf_bytes = file.read()
+                    stream = io.BytesIO(pdf_bytes)
+                elif isinstance(pdf_source, (bytes, bytearray)):
+                    pdf_bytes = bytes(pdf_source)
+                    stream = io.BytesIO(pdf_bytes)
+                else:
+                    pdf_bytes = None
+                    stream = pdf_source
+                    stream.seek(0)
+
+                reader = PyPDF2.PdfReader(stream)
+                page_count = len(reader.pages)
+                pool = get_pdf_pool()
+                if pool is not None and page_count >= PDF_PARALLEL_MIN_PAGES:
+                    if pdf_bytes is None:
+                        stream.seek(0)
+                        pdf_bytes = stream.read()
+                    step = -(-page_count // PDF_EXTRACT_WORKERS)
+                    futures = [
+                        pool.submit(pdf_worker.extract_page_range, pdf_bytes, start, min(start + step, page_count))
+                        for start in range(0, page_count, step)
+                    ]
+                    pages = [page_text for future in futures for page_text in future.result()]
+                else:
+                    pages = []
+                    for page in reader.pages:
+                        page_text = page.extract_text()
+                        if page_text:
+                            pages.append(page_text)
+                return pages
+            except Exception as e:
+                raise Exception(f"Error reading PDF: {str(e)}")
 
     @staticmethod
     def clean_json_response(response_text: str) -> Dict[str, Any]:
-        """Clean and parse JSON response."""
-        try:
-            return json.loads(response_text)
-        except json.JSONDecodeError:
-            # Try to extract JSON from text
-            match = re.search(r'\{.*\}', response_text, re.DOTALL)
-            if match:
-                try:
-                    return json.loads(match.group(0))
-                except json.JSONDecodeError:
-                    pass
-            
-            # Try to handle single quotes instead of double quotes
+        """Clean and parse JSON response.
+
+        Well-formed output (the norm in JSON mode) parses directly. An object
+        wrapped in code fences or prose is decoded in place from its first
+        brace. Anything else goes through one repair pass before giving up.
+        Truncated output is a failure, so a partial answer is never cached.
+        """
+        with stage("json_parse"):
             try:
-                fixed_text = response_text.replace("'", '"')
-                return json.loads(fixed_text)
-            except json.JSONDecodeError:
+                result = json.loads(response_text)
+                if isinstance(result, dict):
+                    json_parse_stats.record("direct")
+                    return result
+            except ValueError:
                 pass
-                
-        return {"error": "Failed to parse AI response", "raw_response": response_text}
+
+            start = response_text.find("{")
+            if start >= 0:
+                try:
+                    result, _ = _json_decoder.raw_decode(response_text, start)
+                    json_parse_stats.record("extracted")
+                    return result
+                except ValueError:
+                    pass
+
+            repaired = repair_json(response_text)
+            if repaired is not None:
+                try:
+                    result = json.loads(repaired)
+                    if isinstance(result, dict):
+                        json_parse_stats.record("repaired")
+                        return result
+                except ValueError:
+                    pass
+            elif start >= 0:
+                json_parse_stats.record("truncated")
+                logger.warning(f"AI response was truncated ({len(response_text)} chars)")
+                return {"error": "AI response was truncated", "raw_response": response_text}
+
+            json_parse_stats.record("failed")
+            logger.warning(f"Failed to parse AI response ({len(response_text)} chars)")
+            return {"error": "Failed to parse AI response", "raw_response": response_text}
+
+    @staticmethod
+    def analysis_fallback(error: str) -> Dict[str, Any]:
+        """Error payload returned when a report cannot be analyzed."""
+        metrics.inc("ai_fallbacks_total", kind="analysis")
+        return {"error": error, "raw_response": None}
+
+    @staticmethod
+    def precautions_fallback(error: str) -> Dict[str, Any]:
+        """Generic precautions returned when the model cannot answer."""
+        metrics.inc("ai_fallbacks_total", kind="precautions")
+        return {
+            "error": error,
+            "initial_assessment": {
+                "severity": "unknown",
+                "immediate_action_required": False,
+                "seek_emergency": False
+            },
+            "precautions": [
+                {
+                    "category": "General Advice",
+                    "measures": ["Please consult with a healthcare professional for proper evaluation"],
+                    "priority": "high"
+                }
+            ]
+        }
+
+    @staticmethod
+    def precautions_prompt(symptoms: str, language: str = "en-US") -> str:
+        """Build the per-request precautions prompt for a symptom description."""
+        return TASK_PROMPTS["precautions"].render(language, symptoms=symptoms)
 
     def get_precautions_and_recommendations(self, symptoms: str, language: str = "en-US") -> Dict[str, Any]:
-        """Generate precautions and recommendations based on symptoms using Gemini."""
-        if self.model is None:
+        """Generate precautions and recommendations based on symptoms using Gemini.
+
+        Results are cached by normalized symptoms and language, and concurrent
+        identical misses share a single model call.
+        """
+        if self.model_pools is None:
             logger.error("Model is not initialized, returning fallback response")
-            return {
-                "error": "AI model not initialized",
-                "initial_assessment": {
-                    "severity": "unknown",
-                    "immediate_action_required": False,
-                    "seek_emergency": False
-                },
-                "precautions": [
-                    {
-                        "category": "General Advice",
-                        "measures": ["Please consult with a healthcare professional for proper evaluation"],
-                        "priority": "high"
-                    }
-                ]
-            }
-            
-        # Determine language for the response
-        language_prompt = ""
-        if language != "en-US":
-            language_prompt = f"Respond in {language} language. "
-            
-        prompt = f"""
-        {language_prompt}Analyze these symptoms and provide detailed precautions and recommendations in JSON format:
+            return self.precautions_fallback("AI model not initialized")
 
-        Required JSON structure:
-        {{
-            "initial_assessment": {{
-                "severity": "mild/moderate/severe",
-                "immediate_action_required": true/false,
-                "seek_emergency": true/false
-            }},
-            "precautions": [
-                {{
-                    "category": "category name",
-                    "measures": ["detailed precautionary measures"],
-                    "priority": "high/medium/low"
-                }}
-            ],
-            "lifestyle_recommendations": [
-                {{
-                    "area": "area of focus",
-                    "suggestions": ["specific actionable suggestions"],
-                    "duration": "temporary/long-term"
-                }}
-            ],
-            "home_remedies": [
-                {{
-                    "remedy": "remedy name",
-                    "instructions": "how to apply/use",
-                    "caution": "any warnings or contraindications"
-                }}
-            ],
-            "when_to_seek_emergency": ["list of warning signs that require immediate medical attention"]
-        }}
+        cache_key = precautions_cache_key(symptoms, language)
+        cached = precautions_cache.get(cache_key)
+        if cached is not None:
+            return cached
 
-        Symptoms:
-        {symptoms}
+        def generate_and_cache():
+            result = self._generate_precautions(symptoms, language)
+            # Fallback payloads carry an "error" key and must not be served again
+            if "error" not in result:
+                precautions_cache.set(cache_key, result)
+            return result
 
-        Ensure the response is ONLY the JSON object with no additional text.
+        return precautions_flight.do(cache_key, generate_and_cache)
+
+    def _generate_precautions(self, symptoms: str, language: str) -> Dict[str, Any]:
+        if self.translates(language):
+            canonical = self.get_precautions_and_recommendations(symptoms, CANONICAL_LANGUAGE)
+            return self.localize("precautions", canonical, language)
+        try:
+            logger.info(f"Sending prompt to Gemini for symptoms: {symptoms[:50]}...")
+            response = self.generate("precautions", self.precautions_prompt(symptoms, language))
+            logger.info("Successfully received response from Gemini")
+            return self.clean_json_response(response.text)
+        except Exception as e:
+            logger.error(f"Precautions generation error: {str(e)}")
+            return self.precautions_fallback(f"Precautions generation failed: {str(e)}")
+
+    def stream_precautions(self, symptoms: str, language: str = "en-US"):
+        """Streaming variant of get_precautions_and_recommendations.
+
+        Yields ("section", key, value) events and finally ("complete", None, result).
         """
+        if self.model_pools is None:
+            logger.error("Model is not initialized, returning fallback response")
+            yield "complete", None, self.precautions_fallback("AI model not initialized")
+            return
+
+        cache_key = precautions_cache_key(symptoms, language)
+        cached = precautions_cache.get(cache_key)
+        if cached is not None:
+            for key, value in cached.items():
+                yield "section", key, value
+            yield "complete", None, cached
+            return
+
+        if self.translates(language):
+            # Translations arrive as a whole, so there are no partial sections to stream
+            result = self.get_precautions_and_recommendations(symptoms, language)
+            if "error" not in result:
+                for key, value in result.items():
+                    yield "section", key, value
+            yield "complete", None, result
+            return
 
+        try:
+            logger.info(f"Streaming Gemini response for symptoms: {symptoms[:50]}...")
+            for event in self.stream_sections("precautions", self.precautions_prompt(symptoms, language)):
+                if event[0] == "complete" and "error" not in event[2]:
+                    precautions_cache.set(cache_key, event[2])
+                yield event
+        except Exception as e:
+            logger.error(f"Precautions generation error: {str(e)}")
+            yield "complete", None, self.precautions_fallback(f"Precautions generation failed: {str(e)}")
+
+    async def get_precautions_and_recommendations_async(self, symptoms: str, language: str = "en-US") -> Dict[str, Any]:
+        """Async variant of get_precautions_and_recommendations for the ASGI app."""
+        if self.model_pools is None:
+            logger.error("Model is not initialized, returning fallback response")
+            return self.precautions_fallback("AI model not initialized")
+
+        cache_key = precautions_cache_key(symptoms, language)
+        cached = precautions_cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+        async def generate_and_cache():
+            result = await self._generate_precautions_async(symptoms, language)
+            if "error" not in result:
+                precautions_cache.set(cache_key, result)
+            return result
+
+        return await precautions_flight.do_async(cache_key, generate_and_cache)
+
+    async def _generate_precautions_async(self, symptoms: str, language: str) -> Dict[str, Any]:
+        if self.translates(language):
+            canonical = await self.get_precautions_and_recommendations_async(symptoms, CANONICAL_LANGUAGE)
+            return await self.localize_async("precautions", canonical, language)
         try:
             logger.info(f"Sending prompt to Gemini for symptoms: {symptoms[:50]}...")
-            response = self.model.generate_content(prompt)
+            response = await self.generate_async("precautions", self.precautions_prompt(symptoms, language))
             logger.info("Successfully received response from Gemini")
             return self.clean_json_response(response.text)
         except Exception as e:
             logger.error(f"Precautions generation error: {str(e)}")
-            return {
-                "error": f"Precautions generation failed: {str(e)}",
-                "initial_assessment": {
-                    "severity": "unknown",
-                    "immediate_action_required": False,
-                    "seek_emergency": False
-                },
-                "precautions": [
-                    {
-                        "category": "General Advice",
-                        "measures": ["Please consult with a healthcare professional for proper evaluation"],
-                        "priority": "high"
-                    }
-                ]
-            }
+            return self.precautions_fallback(f"Precautions generation failed: {str(e)}")
+
+    @staticmethod
+    def translates(language: str) -> bool:
+        """Whether results in language are derived from the canonical-language result."""
+        return LANGUAGE_FANOUT and language != CANONICAL_LANGUAGE
+
+    @staticmethod
+    def canonical_variant(language: str) -> bool:
+        """Whether language is a regional variant of CANONICAL_LANGUAGE (en-GB, en-IN for en-US)."""
+        def primary(tag: str) -> str:
+            return tag.replace("_", "-").split("-")[0].strip().lower()
+        return primary(language) == primary(CANONICAL_LANGUAGE)
+
+    @staticmethod
+    def translation_prompt(strings: List[str], language: str) -> str:
+        """Build the per-request translation prompt for a batch of strings."""
+        batch = json.dumps({str(index): text for index, text in enumerate(strings)}, ensure_ascii=False)
+        return TASK_PROMPTS["translation"].render(language, target=language, strings=batch)
+
+    def localize(self, task: str, canonical: Dict[str, Any], language: str) -> Dict[str, Any]:
+        """Translate the human-readable fields of a canonical result into language.
+
+        Only the fields in TRANSLATABLE_FIELDS[task] are sent, deduplicated and
+        minus those already in translation_cache; the rest are translated in
+        concurrent batches. Structure and enum-like values (severity, urgency,
+        booleans) are copied unchanged. If a batch fails, the canonical result
+        is returned with an "error" key so it is not cached. Regional variants
+        of the canonical language are served the canonical result as is.
+        """
+        if "error" in canonical or self.canonical_variant(language):
+            return canonical
+        with stage("translate"):
+            translations, batches = self._translation_plan(task, canonical, language)
+            if batches:
+                workers = max(1, min(TRANSLATION_CONCURRENCY, len(batches)))
+                with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="translate") as executor:
+                    contexts = [contextvars.copy_context() for _ in batches]
+                    results = list(executor.map(
+                        lambda context, batch: context.run(self.translate_batch, batch, language), contexts, batches
+                    ))
+            else:
+                results = []
+            return self._localized(task, canonical, language, translations, results)
+
+    async def localize_async(self, task: str, canonical: Dict[str, Any], language: str) -> Dict[str, Any]:
+        """Async variant of localize for the ASGI app."""
+        if "error" in canonical or self.canonical_variant(language):
+            return canonical
+        with stage("translate"):
+            translations, batches = self._translation_plan(task, canonical, language)
+            results = await asyncio.gather(*(self.translate_batch_async(batch, language) for batch in batches))
+            return self._localized(task, canonical, language, translations, results)
+
+    def _translation_plan(self, task: str, canonical: Dict[str, Any], language: str):
+        """Return (cached translations, batches of strings still to translate)."""
+        translations = {}
+        missing = []
+        for text in dict.fromkeys(collect_text_fields(canonical, TRANSLATABLE_FIELDS[task])):
+            cached = translation_cache.get(translation_cache_key(text, language))
+            if cached is not None:
+                translations[text] = cached
+            else:
+                missing.append(text)
+        metrics.inc("ai_translation_strings_total", len(translations), source="cache")
+        metrics.inc("ai_translation_strings_total", len(missing), source="model")
+        batches = [missing[i:i + TRANSLATION_BATCH_SIZE] for i in range(0, len(missing), TRANSLATION_BATCH_SIZE)]
+        return translations, batches
+
+    def translate_batch(self, strings: List[str], language: str) -> Optional[Dict[str, str]]:
+        """Translate one batch of strings; None when the model call or its answer fails."""
+        try:
+            response = self.generate("translation", self.translation_prompt(strings, language))
+            return self._read_translations(strings, language, response.text)
+        except Exception as e:
+            logger.error(f"Translation to {language} failed: {str(e)}")
+            return None
+
+    async def translate_batch_async(self, strings: List[str], language: str) -> Optional[Dict[str, str]]:
+        """Async variant of translate_batch."""
+        try:
+            response = await self.generate_async("translation", self.translation_prompt(strings, language))
+            return self._read_translations(strings, language, response.text)
+        except Exception as e:
+            logger.error(f"Translation to {language} failed: {str(e)}")
+            return None
+
+    def _read_translations(self, strings: List[str], language: str, response_text: str) -> Dict[str, str]:
+        result = self.clean_json_response(response_text)
+        translations = {}
+        for index, text in enumerate(strings):
+            translated = result.get(str(index))
+            if not isinstance(translated, str) or not translated.strip():
+                raise ValueError(f"translation is missing item {index} of {len(strings)}")
+            translations[text] = translated
+        for text, translated in translations.items():
+            translation_cache.set(translation_cache_key(text, language), translated)
+        return translations
+
+    @staticmethod
+    def _localized(task: str, canonical: Dict[str, Any], language: str,
+                   translations: Dict[str, str], results: List[Optional[Dict[str, str]]]) -> Dict[str, Any]:
+        if any(result is None for result in results):
+            metrics.inc("ai_fallbacks_total", kind="translation")
+            fallback = copy.deepcopy(canonical)
+            fallback["error"] = f"Translation to {language} failed; showing the {CANONICAL_LANGUAGE} result"
+            return fallback
+        for result in results:
+            translations.update(result)
+        return replace_text_fields(canonical, TRANSLATABLE_FIELDS[task], translations)
+
+    @staticmethod
+    def rank_specialties(symptoms: str) -> List[Dict[str, Any]]:
+        """Rank every matching specialty for the symptoms, best first."""
+        return specialty_matcher.rank(symptoms)
+
+    @staticmethod
+    def match_specialty(symptoms: str) -> Tuple[str, List[Dict[str, Any]]]:
+        """Return the best specialty and the full ranking it was chosen from."""
+        matches = specialty_matcher.rank(symptoms)
+        return (matches[0]["specialty"] if matches else "General Medicine"), matches
 
     @staticmethod
     def find_best_specialty(symptoms: str) -> str:
         """Find best matching specialty based on symptoms."""
-        symptoms_lower = symptoms.lower()
-        for specialty, info in MedicalSystem.SPECIALIZATIONS.items():
-            for keyword in info["keywords"]:
-                if keyword in symptoms_lower:
-                    return specialty
-        return "General Medicine"
+        return MedicalSystem.match_specialty(symptoms)[0]
 
     @staticmethod
-    def get_doctors_for_specialty(specialty: str) -> list:
-        """Get available doctors for a specialty."""
+    def doctor_summary(doctor: Dict[str, Any], user: Dict[str, Any]) -> Dict[str, Any]:
+        """Shape a doctor document and its user document for API responses."""
+        return {
+            "doctorId": str(user["_id"]),
+            "name": f"{user.get('firstName', '')} {user.get('lastName', '')}",
+            "degree": doctor.get("degree", ""),
+            "experience": doctor.get("experience", ""),
+            "location": user.get("address", {}).get("city", "")
+        }
+
+    @staticmethod
+    def find_doctors(search: DoctorSearch) -> Tuple[list, Optional[str]]:
+        """Run a ranked doctor search; return one page of doctors and the next page's cursor."""
+        cache_key = search.cache_key()
+        cached = doctor_directory_cache.get(cache_key)
+        if cached is not None:
+            return cached["doctors"], cached["next_cursor"]
+
         if doctors_collection is None or users_collection is None:
             # Return empty list if database is not available
             logger.warning("Database connection not available, returning empty doctors list")
-            return []
+            return [], None
             
         try:
-            doctor_cursor = doctors_collection.find(
-                {"specialization": specialty, "isAvailable": True},
-                {"userId": 1, "degree": 1, "experience": 1}
-            ).limit(5)
-            print(doctor_cursor)
-            doctors = []
-            for doctor in doctor_cursor:
-                user = users_collection.find_one(
-                    {"_id": doctor.get("userId")},
-                    {"firstName": 1, "lastName": 1, "address.city": 1}
-                )
-                
-                if user:
-                    doctors.append({
-                        "doctorId": str(user["_id"]),
-                        "name": f"{user.get('firstName', '')} {user.get('lastName', '')}",
-                        "degree": doctor.get("degree", ""),
-                        "experience": doctor.get("experience", ""),
-                        "location": user.get("address", {}).get("city", "")
-                    })
+            collections = {"doctors": doctors_collection, "users": users_collection}
+            doctors, next_cursor = search.run(
+                lambda name, pipeline, collation: list(collections[name].aggregate(pipeline, collation=collation))
+            )
+            doctor_directory_cache.set(cache_key, {"doctors": doctors, "next_cursor": next_cursor})
             
             # Return the actual doctors found, which may be an empty list if none are available
-            return doctors
+            return doctors, next_cursor
         except Exception as e:
             logger.error(f"Database error: {str(e)}")
-            return []
-
-    def analyze_medical_report(self, text: str, language: str = "en-US") -> Dict[str, Any]:
-        """Analyze medical report using Google's Gemini model."""
-        if self.model is None:
-            logger.error("Model is not initialized, returning fallback response")
-            return {"error": "AI model not initialized"}
-            
-        # Determine language for the response
-        language_prompt = ""
-        if language != "en-US":
-            language_prompt = f"Respond in {language} language. "
-            
-        prompt = f"""
-        {language_prompt}Analyze this medical report as a specialized medical AI. Provide a detailed analysis in JSON format:
-
-        Guidelines:
-        1. Extract ALL symptoms mentioned, even mild ones
-        2. List ALL possible diseases that match the symptoms
-        3. Consider test results and vital signs if present
-        4. Recommend specialists based on symptoms and possible conditions
-        5. Provide a comprehensive summary of the findings
-        6. Include severity assessment of the overall condition
-
-        Required JSON structure:
-        {{
-            "summary": {{
-                "overview": "Brief overview of the case how diagnostic it and need to be reviewed by a specialist",
-                "severity_assessment": "mild/moderate/severe",
-                "key_findings": ["list of important findings"],
-                "urgent_attention": "yes/no",
-                "follow_up_timeline": "immediate/within week/routine"
-            }},
-            "symptoms": [
-                {{
-                    "symptom": "detailed symptom",
-                    "severity": "mild/moderate/severe",
-                    "duration": "duration if mentioned",
-                    "related_conditions": ["possible related conditions"]
-                }}
-            ],
-            "possible_diseases": [
-                {{
-                    "disease": "disease name",
-                    "confidence": "high/medium/low",
-                    "reasoning": "brief explanation",
-                    "common_complications": ["possible complications"]
-                }}
-            ],
-            "recommended_doctor": {{
-                "primary": {{
-                    "specialist": "main specialist needed",
-                    "specialty_area": "specific area of expertise",
-                    "urgency": "immediate/soon/routine"
-                }},
-                "secondary": {{
-                    "specialist": "additional specialist if needed",
-                    "specialty_area": "specific area of expertise",
-                    "urgency": "immediate/soon/routine"
-                }},
-                "reasoning": "explanation for specialist choices"
-            }},
-            "precautions": [
-                {{
-                    "precaution": "specific precaution",
-                    "importance": "critical/important/recommended",
-                    "duration": "how long to follow",
-                    "details": "additional details"
-                }}
-            ],
-            "additional_tests": [
-                {{
-                    "test": "test name",
-                    "purpose": "why it's needed",
-                    "urgency": "immediate/soon/routine"
-                }}
-            ],
-            "lifestyle_recommendations": [
-                {{
-                    "category": "diet/exercise/sleep/etc",
-                    "recommendation": "specific advice",
-                    "importance": "high/medium/low"
-                }}
-            ]
-        }}
+            return [], None
 
-        Medical Report:
-        {text}
+    @staticmethod
+    def get_doctors_for_specialty(specialty: str) -> list:
+        """Get the first page of available doctors for a specialty, most experienced first."""
+        return MedicalSystem.find_doctors(DoctorSearch(specialty))[0]
 
-        Ensure the response is ONLY the JSON object with no additional text.
-        """
+    @staticmethod
+    def analysis_prompt(text: str, language: str = "en-US") -> str:
+        """Build the per-request report analysis prompt for extracted report text."""
+        return TASK_PROMPTS["analysis"].render(language, text=text)
 
-        try:
-            response = self.model.generate_content(prompt)
-            result = self.clean_json_response(response.text)
-            
+    def finalize_analysis(self, result: Dict[str, Any]) -> Dict[str, Any]:
+        """Fill in missing analysis fields and attach specialty descriptions."""
+        with stage("finalize"):
             # Validate and provide defaults for missing fields
             default_response = {
                 "summary": {
@@ -438,7 +2461,7 @@ class MedicalSystem:
                 "additional_tests": [{"test": "General health assessment", "purpose": "Baseline health evaluation", "urgency": "routine"}],
                 "lifestyle_recommendations": [{"category": "general", "recommendation": "Maintain healthy lifestyle", "importance": "high"}]
             }
-            
+        
             # Merge with defaults for any missing fields
             for key in default_response:
                 if key not in result or not result[key]:
@@ -449,24 +2472,1038 @@ class MedicalSystem:
                 primary_specialist = result["recommended_doctor"]["primary"]["specialist"]
                 if primary_specialist in self.SPECIALIZATIONS:
                     result["recommended_doctor"]["primary"]["specialty_description"] = self.SPECIALIZATIONS[primary_specialist]
-                
-                if result["recommended_doctor"]["secondary"] is not None:
+            
+                if result["recommended_doctor"].get("secondary") is not None:
                     secondary_specialist = result["recommended_doctor"]["secondary"]["specialist"]
                     if secondary_specialist in self.SPECIALIZATIONS:
                         result["recommended_doctor"]["secondary"]["specialty_description"] = self.SPECIALIZATIONS[secondary_specialist]
-                    
             return result
+
+    def analyze_medical_report(self, text: str, language: str = "en-US",
+                               pages: Optional[List[str]] = None) -> Dict[str, Any]:
+        """Analyze medical report using Google's Gemini model.
+
+        Reports over the chunk budget are analyzed section by section (see
+        analyze_medical_report_chunked); pages, when given, keep page
+        boundaries intact when splitting.
+        """
+        if self.model_pools is None:
+            logger.error("Model is not initialized, returning fallback response")
+            return self.analysis_fallback("AI model not initialized")
+
+        if self.should_chunk(text):
+            return self.analyze_medical_report_chunked(pages or [text], language)
+
+        try:
+            response = self.generate("analysis", self.analysis_prompt(text, language))
+            return self.finalize_analysis(self.clean_json_response(response.text))
+        except Exception as e:
+            logger.error(f"Analysis failed: {str(e)}")
+            return self.analysis_fallback(f"Analysis failed: {str(e)}")
+
+    @staticmethod
+    def should_chunk(text: str) -> bool:
+        """Whether a report is analyzed in chunks under ANALYSIS_CHUNKED_MODE."""
+        if ANALYSIS_CHUNKED_MODE == "always":
+            return True
+        if ANALYSIS_CHUNKED_MODE == "off":
+            return False
+        return len(text) > ANALYSIS_CHUNK_TOKENS * CHARS_PER_TOKEN
+
+    def analyze_medical_report_chunked(self, pages: List[str], language: str = "en-US") -> Dict[str, Any]:
+        """Map-reduce analysis: analyze token-budgeted sections concurrently, then merge.
+
+        Each section's findings are cached by its content hash, so a report
+        that changes by one page only re-analyzes the section containing it
+        (and, when that page's size forces a different cut, the next one).
+        """
+        chunks = split_report(pages, ANALYSIS_CHUNK_TOKENS * CHARS_PER_TOKEN)
+        logger.info(f"Analyzing report in {len(chunks)} chunks")
+        workers = max(1, min(ANALYSIS_CHUNK_CONCURRENCY, len(chunks)))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="chunk") as executor:
+            # Each chunk runs in a copy of this context so its stages land in the request breakdown
+            contexts = [contextvars.copy_context() for _ in chunks]
+            results = list(executor.map(
+                lambda context, chunk: context.run(self.analyze_chunk, chunk, language), contexts, chunks
+            ))
+
+        findings = [result for result in results if "error" not in result]
+        if not findings:
+            return self.analysis_fallback(results[0]["error"] if results else "Analysis failed: empty report")
+        try:
+            return self.finalize_analysis(merge_chunk_analyses(findings))
+        except Exception as e:
+            logger.error(f"Merging chunk analyses failed: {str(e)}")
+            return self.analysis_fallback(f"Analysis failed: {str(e)}")
+
+    def analyze_chunk(self, chunk: str, language: str) -> Dict[str, Any]:
+        """Analyze one report section, reusing the cached findings for identical sections."""
+        cache_key = f"{hashlib.sha256(chunk.encode('utf-8')).hexdigest()}:{language}"
+        cached = chunk_analysis_cache.get(cache_key)
+        if cached is not None:
+            return cached
+        try:
+            prompt = self.analysis_prompt(
+                "This is one section of a longer medical report; analyze only what this section contains.\n" + chunk,
+                language
+            )
+            result = self.clean_json_response(self.generate("analysis", prompt).text)
+        except Exception as e:
+            logger.error(f"Chunk analysis failed: {str(e)}")
+            return {"error": f"Analysis failed: {str(e)}"}
+        if "error" not in result:
+            chunk_analysis_cache.set(cache_key, result)
+        return result
+
+    def stream_medical_report(self, text: str, language: str = "en-US", pages: Optional[List[str]] = None):
+        """Streaming variant of analyze_medical_report.
+
+        Yields ("section", key, value) events as the model writes them and
+        finally ("complete", None, result) with defaults filled in. Chunked
+        reports only become available once every section is merged.
+        """
+        if self.model_pools is None:
+            logger.error("Model is not initialized, returning fallback response")
+            yield "complete", None, self.analysis_fallback("AI model not initialized")
+            return
+
+        if self.should_chunk(text):
+            result = self.analyze_medical_report_chunked(pages or [text], language)
+            if "error" not in result:
+                for key, value in result.items():
+                    yield "section", key, value
+            yield "complete", None, result
+            return
+
+        try:
+            for kind, key, value in self.stream_sections("analysis", self.analysis_prompt(text, language)):
+                if kind == "complete":
+                    value = self.finalize_analysis(value)
+                yield kind, key, value
         except Exception as e:
             logger.error(f"Analysis failed: {str(e)}")
+            yield "complete", None, self.analysis_fallback(f"Analysis failed: {str(e)}")
+
+    async def analyze_medical_report_async(self, text: str, language: str = "en-US",
+                                           pages: Optional[List[str]] = None) -> Dict[str, Any]:
+        """Async variant of analyze_medical_report for the ASGI app."""
+        if self.model_pools is None:
+            logger.error("Model is not initialized, returning fallback response")
+            return self.analysis_fallback("AI model not initialized")
+
+        if self.should_chunk(text):
+            return await asyncio.to_thread(self.analyze_medical_report_chunked, pages or [text], language)
+
+        try:
+            response = await self.generate_async("analysis", self.analysis_prompt(text, language))
+            return self.finalize_analysis(self.clean_json_response(response.text))
+        except Exception as e:
+            logger.error(f"Analysis failed: {str(e)}")
+            return self.analysis_fallback(f"Analysis failed: {str(e)}")
+
+def split_report(pages: List[str], max_chars: int) -> List[str]:
+    """Group whole pages into sections of at most max_chars.
+
+    Pages larger than the budget are split on line breaks, and single lines
+    larger than the budget are cut, so every section fits. A section ends
+    after a page chosen by a hash of that page's own text (about one in
+    every max_chars / REPORT_PAGE_CHARS pages), or earlier when the
+    budget is full. Boundaries therefore do not shift when an earlier page
+    grows or shrinks: an edited page changes its own section and at most
+    the one after it.
+    """
+    pages_per_section = max(1, max_chars // REPORT_PAGE_CHARS)
+    pieces = []
+    for page in pages:
+        if len(page) <= max_chars:
+            pieces.append(page)
+            continue
+        current = ""
+        for line in page.splitlines(keepends=True):
+            while len(line) > max_chars:
+                if current:
+                    pieces.append(current)
+                    current = ""
+                pieces.append(line[:max_chars])
+                line = line[max_chars:]
+            if len(current) + len(line) > max_chars:
+                pieces.append(current)
+                current = ""
+            current += line
+        if current:
+            pieces.append(current)
+
+    chunks = []
+    current = ""
+    for piece in pieces:
+        if current and len(current) + 1 + len(piece) > max_chars:
+            chunks.append(current)
+            current = ""
+        current = f"{current} {piece}" if current else piece
+        if int.from_bytes(hashlib.sha256(piece.encode("utf-8")).digest()[:4], "big") % pages_per_section == 0:
+            chunks.append(current)
+            current = ""
+    if current:
+        chunks.append(current)
+    return chunks
+
+_SEVERITY_RANK = {"unknown": 0, "mild": 1, "moderate": 2, "severe": 3}
+_URGENCY_RANK = {"routine": 0, "soon": 1, "within week": 1, "immediate": 2}
+_CONFIDENCE_RANK = {"low": 0, "medium": 1, "high": 2}
+
+def _rank(ranking: Dict[str, int], value: Any) -> int:
+    return ranking.get(str(value).strip().lower(), -1)
+
+def _merge_unique(items: List[Dict[str, Any]], key: str, prefer=None) -> List[Dict[str, Any]]:
+    """Deduplicate dict items by a name field, keeping the preferred duplicate."""
+    merged = {}
+    for item in items:
+        if not isinstance(item, dict):
+            continue
+        name = str(item.get(key, "")).strip().lower()
+        if name not in merged or (prefer is not None and prefer(item) > prefer(merged[name])):
+            merged[name] = item
+    return list(merged.values())
+
+def merge_chunk_analyses(findings: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Merge per-section analyses into the single-report analysis schema."""
+    summaries = [f["summary"] for f in findings if isinstance(f.get("summary"), dict)]
+    key_findings = []
+    for summary in summaries:
+        for finding in summary.get("key_findings") or []:
+            if finding not in key_findings:
+                key_findings.append(finding)
+
+    merged = {
+        "summary": {
+            "overview": " ".join(s["overview"] for s in summaries if s.get("overview")),
+            "severity_assessment": max((s.get("severity_assessment", "unknown") for s in summaries),
+                                       key=lambda value: _rank(_SEVERITY_RANK, value), default="unknown"),
+            "key_findings": key_findings,
+            "urgent_attention": "yes" if any(str(s.get("urgent_attention", "")).lower() == "yes" for s in summaries) else
+                                (summaries[0].get("urgent_attention", "unknown") if summaries else "unknown"),
+            "follow_up_timeline": max((s.get("follow_up_timeline", "routine") for s in summaries),
+                                      key=lambda value: _rank(_URGENCY_RANK, value), default="routine")
+        } if summaries else None,
+        "symptoms": _merge_unique(
+            [item for f in findings for item in f.get("symptoms") or []], "symptom",
+            prefer=lambda item: _rank(_SEVERITY_RANK, item.get("severity"))
+        ),
+        "possible_diseases": _merge_unique(
+            [item for f in findings for item in f.get("possible_diseases") or []], "disease",
+            prefer=lambda item: _rank(_CONFIDENCE_RANK, item.get("confidence"))
+        ),
+        "precautions": _merge_unique([item for f in findings for item in f.get("precautions") or []], "precaution"),
+        "additional_tests": _merge_unique([item for f in findings for item in f.get("additional_tests") or []], "test"),
+        "lifestyle_recommendations": _merge_unique(
+            [item for f in findings for item in f.get("lifestyle_recommendations") or []], "recommendation"
+        )
+    }
+
+    # The section with the most urgent primary referral decides the recommendation
+    referrals = [f["recommended_doctor"] for f in findings
+                 if isinstance(f.get("recommended_doctor"), dict) and isinstance(f["recommended_doctor"].get("primary"), dict)]
+    if referrals:
+        merged["recommended_doctor"] = max(referrals, key=lambda r: _rank(_URGENCY_RANK, r["primary"].get("urgency")))
+    return merged
+
+# Keys whose string values (or lists of strings) are patient-facing text; everything else is
+# structure or an enum-like value that clients match on and is never translated
+TRANSLATABLE_FIELDS = {
+    "precautions": frozenset({
+        "category", "measures", "area", "suggestions", "remedy", "instructions", "caution", "when_to_seek_emergency"
+    }),
+    "analysis": frozenset({
+        "overview", "key_findings", "symptom", "duration", "related_conditions", "disease", "reasoning",
+        "common_complications", "specialty_area", "precaution", "details", "test", "purpose", "recommendation"
+    })
+}
+
+def collect_text_fields(value: Any, fields: frozenset, inside: bool = False) -> List[str]:
+    """Return every string held under one of fields, in document order."""
+    if isinstance(value, dict):
+        return [text for key, item in value.items() for text in collect_text_fields(item, fields, key in fields)]
+    if isinstance(value, list):
+        return [text for item in value for text in collect_text_fields(item, fields, inside)]
+    if inside and isinstance(value, str) and value.strip():
+        return [value]
+    return []
+
+def replace_text_fields(value: Any, fields: frozenset, translations: Dict[str, str], inside: bool = False) -> Any:
+    """Copy of value with the strings under fields replaced by their translations."""
+    if isinstance(value, dict):
+        return {key: replace_text_fields(item, fields, translations, key in fields) for key, item in value.items()}
+    if isinstance(value, list):
+        return [replace_text_fields(item, fields, translations, inside) for item in value]
+    if inside and isinstance(value, str):
+        return translations.get(value, value)
+    return copy.deepcopy(value)
+
+specialty_matcher = SpecialtyMatcher.from_file(SPECIALTY_VOCAB_PATH, MedicalSystem.SPECIALIZATIONS)
+triage_tier = TriageTier.from_file(TRIAGE_TEMPLATES_PATH)
+
+analysis_cache = ResultCache(
+    "analysis",
+    max_entries=ANALYSIS_CACHE_MAX_ENTRIES,
+    max_bytes=ANALYSIS_CACHE_MAX_BYTES,
+    ttl=ANALYSIS_CACHE_TTL,
+    persist_path=ANALYSIS_CACHE_PATH or None
+)
+
+precautions_cache = ResultCache(
+    "precautions",
+    max_entries=PRECAUTIONS_CACHE_MAX_ENTRIES,
+    max_bytes=16 * 1024 * 1024,
+    ttl=PRECAUTIONS_CACHE_TTL
+)
+precautions_flight = SingleFlight()
+
+def precautions_cache_key(symptoms: str, language: str) -> str:
+    """Cache key shared by every phrasing that normalizes to the same symptoms."""
+    return f"{normalize_symptoms(symptoms)}|{language}"
+
+chunk_analysis_cache = ResultCache(
+    "analysis_chunks",
+    max_entries=ANALYSIS_CACHE_MAX_ENTRIES * 4,
+    max_bytes=ANALYSIS_CACHE_MAX_BYTES,
+    ttl=ANALYSIS_CACHE_TTL
+)
+
+translation_cache = ResultCache(
+    "translations",
+    max_entries=TRANSLATION_CACHE_MAX_ENTRIES,
+    max_bytes=16 * 1024 * 1024,
+    ttl=ANALYSIS_CACHE_TTL
+)
+
+def translation_cache_key(text: str, language: str) -> str:
+    return f"{hashlib.sha256(text.encode('utf-8')).hexdigest()}:{language}"
+
+doctor_directory_cache = ResultCache(
+    "doctor_directory",
+    max_entries=2048,
+    max_bytes=8 * 1024 * 1024,
+    ttl=DOCTOR_CACHE_TTL
+)
+
+def analysis_cache_key(stream, language: str) -> str:
+    """Content-addressed cache key for a report upload stream."""
+    digest = hashlib.sha256()
+    stream.seek(0)
+    for chunk in iter(lambda: stream.read(64 * 1024), b""):
+        digest.update(chunk)
+    stream.seek(0)
+    return f"{digest.hexdigest()}:{language}"
+
+def language_cache_key(cache_key: str, language: str) -> str:
+    """The analysis_cache_key of the same upload in another language."""
+    return f"{cache_key.rsplit(':', 1)[0]}:{language}"
+
+def analyze_upload(stream, language: str, cache_key: Optional[str] = None):
+    """Analyze one uploaded report, serving repeats from the result cache.
+
+    Other languages than CANONICAL_LANGUAGE are translated from the
+    canonical analysis (see MedicalSystem.localize) when LANGUAGE_FANOUT is on.
+    Returns the analysis and whether it came from the cache.
+    """
+    if cache_key is None:
+        with stage("upload_hash"):
+            cache_key = analysis_cache_key(stream, language)
+    cached = analysis_cache.get(cache_key)
+    if cached is not None:
+        return cached, True
+    
+    medical_system = get_medical_system()
+    if medical_system.translates(language):
+        canonical, _ = analyze_upload(stream, CANONICAL_LANGUAGE, language_cache_key(cache_key, CANONICAL_LANGUAGE))
+        result = medical_system.localize("analysis", canonical, language)
+    else:
+        pages = medical_system.extract_pages_from_pdf(stream)
+        result = medical_system.analyze_medical_report(' '.join(pages), language, pages)
+    # Fallback payloads carry an "error" key and must not be served again
+    if "error" not in result:
+        analysis_cache.set(cache_key, result)
+    return result, False
+
+def stream_analyze_upload(stream, language: str):
+    """Streaming variant of analyze_upload yielding section and completion events."""
+    with stage("upload_hash"):
+        cache_key = analysis_cache_key(stream, language)
+    cached = analysis_cache.get(cache_key)
+    if cached is not None:
+        for key, value in cached.items():
+            yield "section", key, value
+        yield "complete", None, cached
+        return
+    
+    medical_system = get_medical_system()
+    if medical_system.translates(language):
+        # Translations arrive as a whole, so there are no partial sections to stream
+        result, _ = analyze_upload(stream, language, cache_key)
+        if "error" not in result:
+            for key, value in result.items():
+                yield "section", key, value
+        yield "complete", None, result
+        return
+
+    pages = medical_system.extract_pages_from_pdf(stream)
+    for kind, key, value in medical_system.stream_medical_report(' '.join(pages), language, pages):
+        if kind == "complete" and "error" not in value:
+            analysis_cache.set(cache_key, value)
+        yield kind, key, value
+
+class JobQueue:
+    """Bounded background queue for report analysis, persisted in SQLite.
+
+    submit() stores the upload and returns a job id at once; worker threads
+    run analyze_upload() and store the result for polling. Jobs still queued
+    or running when the process stopped are picked up again by start().
+    When queued plus running jobs reach max_pending, submit() raises
+    queue.Full so the caller can answer 429.
+
+    Several processes may share the file: a job is claimed by whichever
+    process flips it from queued to running first, and a process that
+    exits hands its running jobs back with requeue_running().
+    """
+
+    def __init__(self, path: str, workers: int = ANALYSIS_JOB_WORKERS,
+                 max_pending: int = ANALYSIS_JOB_QUEUE_SIZE, ttl: float = ANALYSIS_JOB_TTL):
+        self.path = path
+        self.workers = max(1, workers)
+        self.max_pending = max(1, max_pending)
+        self.ttl = ttl
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._started = False
+        # Moving average of job run time, for Retry-After estimates
+        self._avg_seconds = 5.0
+        self._counters = {"submitted": 0, "rejected": 0, "completed": 0, "failed": 0, "recovered": 0}
+        # Jobs this process is running, handed back by requeue_running()
+        self._running = set()
+        self._connect()
+
+    def _connect(self):
+        # Waits for another process's write instead of failing with "database is locked"
+        self._db = sqlite3.connect(self.path or ":memory:", check_same_thread=False, timeout=30)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS jobs (id TEXT PRIMARY KEY, status TEXT, filename TEXT, language TEXT, "
+            "pdf BLOB, result TEXT, created_at REAL, updated_at REAL)"
+        )
+        self._db.commit()
+
+    def reopen(self):
+        """Open a fresh SQLite connection; a connection must not be shared with a forked child."""
+        with self._lock:
+            self._connect()
+
+    def recover(self):
+        """Mark jobs left running by a stopped process as queued again."""
+        with self._lock:
+            recovered = self._db.execute("UPDATE jobs SET status = 'queued' WHERE status = 'running'").rowcount
+            self._db.commit()
+        if recovered:
+            logger.info(f"Requeued {recovered} interrupted analysis jobs")
+
+    def requeue_running(self):
+        """Hand the jobs this process is running back to the queue, before it exits."""
+        with self._lock:
+            for job_id in self._running:
+                self._db.execute("UPDATE jobs SET status = 'queued' WHERE id = ? AND status = 'running'", (job_id,))
+            self._db.commit()
+            self._running.clear()
+
+    def start(self, recover: bool = True):
+        """Requeue unfinished jobs from a previous run and start the workers.
+
+        With recover=False, jobs marked running are left alone, since another
+        live process sharing the file may be running them.
+        """
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        if recover:
+            self.recover()
+        with self._lock:
+            rows = self._db.execute("SELECT id FROM jobs WHERE status = 'queued' ORDER BY created_at").fetchall()
+            for (job_id,) in rows:
+                self._queue.put(job_id)
+            self._pending += len(rows)
+            self._counters["recovered"] += len(rows)
+        if rows:
+            logger.info(f"Recovered {len(rows)} unfinished analysis jobs")
+        for index in range(self.workers):
+            threading.Thread(target=self._work, name=f"analysis-job-{index}", daemon=True).start()
+
+    def submit(self, pdf_bytes: bytes, filename: str, language: str) -> str:
+        """Persist and enqueue an analysis job, raising queue.Full under backpressure."""
+        now = time.time()
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self._counters["rejected"] += 1
+                raise queue.Full(f"{self._pending} analysis jobs pending")
+            self._db.execute("DELETE FROM jobs WHERE status IN ('done', 'failed') AND updated_at < ?", (now - self.ttl,))
+            self._db.execute(
+                "INSERT INTO jobs (id, status, filename, language, pdf, created_at, updated_at) "
+                "VALUES (?, 'queued', ?, ?, ?, ?, ?)",
+                (job_id, filename, language, pdf_bytes, now, now)
+            )
+            self._db.commit()
+            self._pending += 1
+            self._counters["submitted"] += 1
+        self._queue.put(job_id)
+        return job_id
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Return a job's status, with its result once finished, or None if unknown."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT status, filename, result, created_at, updated_at FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        status, filename, result, created_at, updated_at = row
+        job = {"job_id": job_id, "status": status, "filename": filename, "created_at": created_at}
+        if status in ("done", "failed"):
+            job["result"] = json.loads(result)
+            job["elapsed_ms"] = round((updated_at - created_at) * 1000, 1)
+        return job
+
+    def retry_after(self) -> int:
+        """Seconds until a queue slot is likely to free up."""
+        with self._lock:
+            backlog = max(1, self._pending - self.max_pending + 1)
+            return max(1, round(self._avg_seconds * backlog / self.workers))
+
+    def _work(self):
+        # Recovered jobs must not be answered with fallbacks while the model is still warming up
+        _init_done["gemini"].wait()
+        while True:
+            job_id = self._queue.get()
+            started = time.perf_counter()
+            try:
+                self._run(job_id)
+            except Exception as e:
+                logger.error(f"Analysis job {job_id} crashed: {str(e)}")
+                self._finish(job_id, "failed", {"error": str(e)})
+            finally:
+                with self._lock:
+                    self._pending -= 1
+                    self._avg_seconds = 0.8 * self._avg_seconds + 0.2 * (time.perf_counter() - started)
+
+    def _run(self, job_id: str):
+        with self._lock:
+            claimed = self._db.execute(
+                "UPDATE jobs SET status = 'running', updated_at = ? WHERE id = ? AND status = 'queued'",
+                (time.time(), job_id)
+            ).rowcount
+            self._db.commit()
+            if not claimed:
+                # Finished, or claimed by another process sharing the file
+                return
+            row = self._db.execute("SELECT pdf, language FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            self._running.add(job_id)
+        pdf_bytes, language = row
+        result, _ = analyze_upload(io.BytesIO(pdf_bytes), language)
+        self._finish(job_id, "failed" if "error" in result else "done", result)
+
+    def _finish(self, job_id: str, status: str, result: Dict[str, Any]):
+        with self._lock:
+            # The upload is no longer needed once the result is stored
+            self._db.execute(
+                "UPDATE jobs SET status = ?, result = ?, pdf = NULL, updated_at = ? WHERE id = ?",
+                (status, json.dumps(result, cls=MongoJSONEncoder), time.time(), job_id)
+            )
+            self._db.commit()
+            self._running.discard(job_id)
+            self._counters["completed" if status == "done" else "failed"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Return queue depth and job counters."""
+        with self._lock:
+            return {
+                **self._counters,
+                "pending": self._pending,
+                "max_pending": self.max_pending,
+                "workers": self.workers,
+                "avg_job_seconds": round(self._avg_seconds, 3)
+            }
+
+analysis_jobs = JobQueue(ANALYSIS_JOB_DB_PATH)
+
+class AdmissionController:
+    """Per-client token buckets in front of a bounded priority queue of request slots.
+
+    admit() first charges the client's bucket (CLIENT_RATE_LIMIT per second,
+    up to CLIENT_BURST), then takes one of the slots. When all slots are busy
+    the request waits in a queue ordered by priority and arrival; a full
+    queue sheds its least urgent, newest waiter to make room for a more
+    urgent request, or rejects the newcomer. Every rejection comes with a
+    Retry-After estimate. release() hands the slot to the next waiter.
+    """
+
+    URGENT, INTERACTIVE, BULK = 0, 1, 2
+    PRIORITY_NAMES = {URGENT: "urgent", INTERACTIVE: "interactive", BULK: "bulk"}
+
+    def __init__(self, slots: int = ADMISSION_SLOTS, queue_size: int = ADMISSION_QUEUE_SIZE,
+                 max_wait: float = ADMISSION_MAX_WAIT, rate: float = CLIENT_RATE_LIMIT,
+                 burst: float = CLIENT_BURST, enabled: bool = ADMISSION_ENABLED, max_clients: int = 10000):
+        self.enabled = enabled
+        self.slots = max(1, slots)
+        self.queue_size = max(0, queue_size)
+        self.max_wait = max_wait
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self.max_clients = max_clients
+        self._lock = threading.Lock()
+        self._active = 0
+        # Heap of [priority, arrival, waiter]; a waiter is {"notify": callable, "outcome": str or None}
+        self._waiting = []
+        self._arrivals = itertools.count()
+        # client -> [tokens, last refill]
+        self._buckets = OrderedDict()
+        # client -> time their emergency priority expires
+        self._emergency = OrderedDict()
+        self._avg_hold = 1.0
+        self._counters = {"admitted": 0, "rate_limited": 0, "queue_full": 0, "evicted": 0, "timeout": 0}
+
+    def _take_token(self, client: str) -> float:
+        """Charge one token; return 0 or the seconds until the client has one again."""
+        now = time.monotonic()
+        bucket = self._buckets.pop(client, None) or [self.burst, now]
+        bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+        bucket[1] = now
+        self._buckets[client] = bucket
+        while len(self._buckets) > self.max_clients:
+            self._buckets.popitem(last=False)
+        if bucket[0] < 1:
+            return (1 - bucket[0]) / self.rate if self.rate > 0 else self.max_wait
+        bucket[0] -= 1
+        return 0.0
+
+    def flag_emergency(self, client: str):
+        """Schedule this client's next requests first for EMERGENCY_PRIORITY_TTL seconds."""
+        with self._lock:
+            self._emergency.pop(client, None)
+            self._emergency[client] = time.monotonic() + EMERGENCY_PRIORITY_TTL
+            while len(self._emergency) > self.max_clients:
+                self._emergency.popitem(last=False)
+
+    def had_emergency(self, client: str) -> bool:
+        with self._lock:
+            expires = self._emergency.get(client)
+            if expires is not None and expires < time.monotonic():
+                del self._emergency[client]
+                expires = None
+            return expires is not None
+
+    def retry_after(self) -> int:
+        """Seconds until a slot is likely to free up for a queued request."""
+        with self._lock:
+            return max(1, math.ceil(self._avg_hold * (len(self._waiting) + 1) / self.slots))
+
+    def _enter(self, client: str, priority: int, notify):
+        """Return an outcome string, or the waiter entry when the request has to queue."""
+        evicted = None
+        with self._lock:
+            wait_for_token = self._take_token(client)
+            if wait_for_token:
+                self._counters["rate_limited"] += 1
+                return "rate_limited", max(1, math.ceil(wait_for_token))
+            if self._active < self.slots and not self._waiting:
+                self._active += 1
+                return "admitted", 0
+            if len(self._waiting) >= self.queue_size:
+                worst = max(self._waiting, key=lambda entry: (entry[0], entry[1])) if self._waiting else None
+                if worst is None or worst[0] <= priority:
+                    self._counters["queue_full"] += 1
+                    return "queue_full", None
+                self._waiting.remove(worst)
+                heapq.heapify(self._waiting)
+                worst[2]["outcome"] = "evicted"
+                self._counters["evicted"] += 1
+                evicted = worst[2]
+            entry = [priority, next(self._arrivals), {"notify": notify, "outcome": None}]
+            heapq.heappush(self._waiting, entry)
+        if evicted is not None:
+            evicted["notify"]()
+        return entry, None
+
+    def _settle(self, entry, priority: int, started: float) -> str:
+        """Resolve a waiter after it was notified or timed out."""
+        with self._lock:
+            waiter = entry[2]
+            if waiter["outcome"] is None:
+                self._waiting.remove(entry)
+                heapq.heapify(self._waiting)
+                waiter["outcome"] = "timeout"
+                self._counters["timeout"] += 1
+            outcome = waiter["outcome"]
+        if outcome == "admitted":
+            metrics.observe("ai_admission_wait_seconds", time.perf_counter() - started,
+                            priority=self.PRIORITY_NAMES[priority])
+        return outcome
+
+    def _record(self, priority: int, outcome: str, retry_after: Optional[int]) -> Tuple[str, int]:
+        metrics.inc("ai_admission_total", priority=self.PRIORITY_NAMES[priority], outcome=outcome)
+        if outcome == "admitted":
+            with self._lock:
+                self._counters["admitted"] += 1
+            return outcome, 0
+        return outcome, retry_after or self.retry_after()
+
+    def admit(self, client: str, priority: int) -> Tuple[str, int]:
+        """Wait for a slot; return (outcome, retry_after). Only "admitted" must be released."""
+        if not self.enabled:
+            return "admitted", 0
+        started = time.perf_counter()
+        event = threading.Event()
+        entry, retry_after = self._enter(client, priority, event.set)
+        if isinstance(entry, str):
+            if entry == "admitted":
+                metrics.observe("ai_admission_wait_seconds", 0.0, priority=self.PRIORITY_NAMES[priority])
+            return self._record(priority, entry, retry_after)
+        with stage("admission_wait"):
+            event.wait(self.max_wait)
+            outcome = self._settle(entry, priority, started)
+        return self._record(priority, outcome, None)
+
+    async def admit_async(self, client: str, priority: int) -> Tuple[str, int]:
+        """Coroutine variant of admit() for the ASGI app."""
+        if not self.enabled:
+            return "admitted", 0
+        started = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        woken = loop.create_future()
+
+        def notify():
+            loop.call_soon_threadsafe(lambda: woken.done() or woken.set_result(None))
+
+        entry, retry_after = self._enter(client, priority, notify)
+        if isinstance(entry, str):
+            if entry == "admitted":
+                metrics.observe("ai_admission_wait_seconds", 0.0, priority=self.PRIORITY_NAMES[priority])
+            return self._record(priority, entry, retry_after)
+        with stage("admission_wait"):
+            try:
+                await asyncio.wait_for(woken, self.max_wait)
+            except asyncio.TimeoutError:
+                pass
+            except asyncio.CancelledError:
+                # The client went away; give back a slot that was granted in the meantime
+                if self._settle(entry, priority, started) == "admitted":
+                    self.release(started)
+                raise
+            outcome = self._settle(entry, priority, started)
+        return self._record(priority, outcome, None)
+
+    def release(self, admitted_at: float):
+        """Give the slot to the most urgent waiter, or free it."""
+        if not self.enabled:
+            return
+        waiter = None
+        with self._lock:
+            self._avg_hold = 0.8 * self._avg_hold + 0.2 * (time.perf_counter() - admitted_at)
+            while self._waiting:
+                candidate = heapq.heappop(self._waiting)[2]
+                if candidate["outcome"] is None:
+                    candidate["outcome"] = "admitted"
+                    waiter = candidate
+                    break
+            else:
+                self._active -= 1
+        if waiter is not None:
+            waiter["notify"]()
+
+    def stats(self) -> Dict[str, Any]:
+        """Return slot use, queue depth per priority and decision counters."""
+        with self._lock:
+            depth = {name: 0 for name in self.PRIORITY_NAMES.values()}
+            for priority, _, _ in self._waiting:
+                depth[self.PRIORITY_NAMES[priority]] += 1
             return {
-                "error": f"Analysis failed: {str(e)}",
-                "raw_response": None
+                **self._counters,
+                "enabled": self.enabled,
+                "active": self._active,
+                "slots": self.slots,
+                "queued": depth,
+                "queue_size": self.queue_size,
+                "avg_hold_seconds": round(self._avg_hold, 3),
+                "clients_tracked": len(self._buckets)
             }
 
+admission = AdmissionController()
+
+# Base scheduling priority of each admission-controlled endpoint
+ADMISSION_PRIORITIES = {
+    "/recommend": AdmissionController.INTERACTIVE,
+    "/analyze": AdmissionController.BULK,
+    "/analyze/batch": AdmissionController.BULK
+}
+
+def request_priority(endpoint: str, data: Any, client: str) -> int:
+    """Urgent for red-flag symptoms or a prior emergency assessment, else the endpoint's priority.
+
+    Only assessments this service produced count (see note_assessment);
+    anything the client sends about earlier assessments is ignored.
+    """
+    if isinstance(data, dict):
+        symptoms = data.get("symptoms")
+        if isinstance(symptoms, str) and triage_tier.is_urgent(symptoms):
+            return AdmissionController.URGENT
+    if admission.had_emergency(client):
+        return AdmissionController.URGENT
+    return ADMISSION_PRIORITIES[endpoint]
+
+def note_assessment(client: str, precautions_data: Dict[str, Any]):
+    """Remember clients whose assessment says to seek emergency care."""
+    assessment = precautions_data.get("initial_assessment") if isinstance(precautions_data, dict) else None
+    if isinstance(assessment, dict) and assessment.get("seek_emergency") is True:
+        admission.flag_emergency(client)
+
+def client_identity(client_id: Optional[str], peer: Optional[str]) -> str:
+    """Identity used for rate limiting: X-Client-Id when sent by a TRUSTED_PROXIES peer, else the peer address."""
+    if client_id and peer in TRUSTED_PROXIES:
+        return client_id
+    return peer or "unknown"
+
+def request_language(value: Any) -> Optional[str]:
+    """The response language of a JSON request: en-US when missing or empty, None when not a string."""
+    if value is None:
+        return "en-US"
+    if not isinstance(value, str):
+        return None
+    return value.strip() or "en-US"
+
+def rejection_message(outcome: str) -> str:
+    if outcome == "rate_limited":
+        return "Too many requests from this client, retry later"
+    return "Service is busy, retry later"
+
+def wants_job_mode() -> bool:
+    """Whether the client asked for a background job instead of a blocking analysis."""
+    return (request.args.get("mode") or request.form.get("mode", "")).lower() == "job"
+
+def job_response(job: Dict[str, Any]):
+    """Poll response: 202 with Retry-After while pending, 200 once finished."""
+    response = jsonify(job)
+    if job["status"] in ("queued", "running"):
+        response.status_code = 202
+        response.headers["Retry-After"] = str(analysis_jobs.retry_after())
+    return response
+
+def wants_event_stream() -> bool:
+    """Whether the client opted into server-sent events for this request."""
+    return (request.args.get("stream", "").lower() in ("1", "true", "yes")
+            or "text/event-stream" in request.headers.get("Accept", ""))
+
+def sse_event(event: str, data: Any) -> str:
+    """Format one server-sent event."""
+    return f"event: {event}\ndata: {json.dumps(data, cls=MongoJSONEncoder)}\n\n"
+
+def sse_response(events) -> Response:
+    """Stream a generator of server-sent events, keeping the request context alive."""
+    response = Response(stream_with_context(events), mimetype="text/event-stream")
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Accel-Buffering"] = "no"
+    return response
+
+def build_recommendation(specialty: str, doctors: list, precautions_data: Dict[str, Any],
+                         matches: Optional[List[Dict[str, Any]]] = None,
+                         triage: Optional[Dict[str, Any]] = None,
+                         next_cursor: Optional[str] = None) -> Dict[str, Any]:
+    """Assemble the /recommend response body."""
+    response = {
+        "recommended_specialty": specialty,
+        "specialty_description": MedicalSystem.SPECIALIZATIONS[specialty]["description"],
+        "specialty_matches": matches or [],
+        "available_doctors": doctors,
+        "doctors_available": len(doctors) > 0,  # Flag indicating whether doctors are available
+        # Pass to GET /doctors (with the same specialty, city and location) for the next page
+        "doctors_next_cursor": next_cursor,
+        "precautions_and_recommendations": precautions_data,
+        # Which tier answered: "local" templates or the "model"
+        "triage": triage or {"tier": "model"}
+    }
+    
+    # Add a message when no doctors are available
+    if not doctors:
+        response["doctor_availability_message"] = f"No {specialty} doctors are currently available."
+    return response
+
+# Process-wide MedicalSystem shared by all request threads
+_medical_system = None
+_medical_system_lock = threading.Lock()
+
+def get_medical_system() -> MedicalSystem:
+    """Return the shared MedicalSystem, creating it on first use."""
+    global _medical_system
+    if _medical_system is None:
+        if not _init_done["gemini"].wait(AI_INIT_WAIT):
+            # Still initializing in the background; serve this request with fallbacks
+            logger.warning("Gemini initialization still in progress, using fallback responses")
+            system = MedicalSystem.__new__(MedicalSystem)
+            system.model_pools = None
+            return system
+        with _medical_system_lock:
+            if _medical_system is None:
+                _medical_system = MedicalSystem()
+    return _medical_system
+
+def _warm_gemini():
+    """Initialize Gemini and build the shared model pool ahead of the first request."""
+    init_gemini()
+    get_medical_system()
+
+def init_runtime(lazy: bool = AI_LAZY_INIT, recover_jobs: bool = True):
+    """Initialize MongoDB and Gemini, in background threads when lazy."""
+    if lazy:
+        threading.Thread(target=init_mongo, name="mongo-init", daemon=True).start()
+        threading.Thread(target=_warm_gemini, name="gemini-init", daemon=True).start()
+    else:
+        init_mongo()
+        init_gemini()
+    analysis_jobs.start(recover=recover_jobs)
+
+def request_endpoint() -> str:
+    """Route pattern of the current request, so metrics are not labelled per job or file."""
+    return request.url_rule.rule if request.url_rule is not None else "unmatched"
+
+@app.before_request
+def init_forked_worker():
+    ensure_worker()
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    begin_request()
+
+def request_client() -> str:
+    """Identity used for rate limiting (see client_identity)."""
+    return client_identity(request.headers.get("X-Client-Id"), request.remote_addr)
+
+@app.before_request
+def admit_request():
+    endpoint = request_endpoint()
+    if request.method != "POST" or endpoint not in ADMISSION_PRIORITIES:
+        return None
+    client = request_client()
+    data = request.get_json(silent=True) if endpoint == "/recommend" else None
+    outcome, retry_after = admission.admit(client, request_priority(endpoint, data, client))
+    if outcome != "admitted":
+        logger.warning(f"Rejected {endpoint} from {client}: {outcome}")
+        return jsonify({"error": rejection_message(outcome)}), 429, {"Retry-After": str(retry_after)}
+    g.admitted_at = time.perf_counter()
+    return None
+
+@app.after_request
+def remember_response_status(response):
+    g.response_status = response.status_code
+    if response.is_streamed and "admitted_at" in g:
+        # Streamed bodies keep the slot until they are fully written
+        admitted_at = g.pop("admitted_at")
+        response.call_on_close(lambda: admission.release(admitted_at))
+    if response.is_streamed and "request_started" in g:
+        # Streamed bodies are written after the view returns; time the request until the body is closed
+        endpoint, method, started = request_endpoint(), request.method, g.pop("request_started")
+        response.call_on_close(
+            lambda: end_request(endpoint, method, response.status_code, time.perf_counter() - started)
+        )
+    return response
+
+@app.teardown_request
+def finish_request_timer(exc):
+    admitted_at = g.pop("admitted_at", None)
+    if admitted_at is not None:
+        admission.release(admitted_at)
+    started = g.pop("request_started", None)
+    if started is None:
+        return
+    end_request(request_endpoint(), request.method, g.get("response_status", 500), time.perf_counter() - started)
+
+def collect_service_metrics():
+    """Yield (name, type, help, labels, value) samples for state tracked outside Metrics."""
+    caches = [analysis_cache, chunk_analysis_cache, precautions_cache, translation_cache, doctor_directory_cache]
+    for cache in caches:
+        stats = cache.stats()
+        labels = {"cache": cache.name}
+        yield "ai_cache_hits_total", "counter", "Result cache hits.", labels, stats["hits"]
+        yield "ai_cache_misses_total", "counter", "Result cache misses.", labels, stats["misses"]
+        yield "ai_cache_evictions_total", "counter", "Result cache evictions.", labels, stats["evictions"]
+        yield "ai_cache_entries", "gauge", "Entries held in memory.", labels, stats["entries"]
+        yield "ai_cache_bytes", "gauge", "Bytes held in memory.", labels, stats["bytes"]
+    for outcome, count in json_parse_stats.stats().items():
+        if outcome not in ("responses", "failure_rate"):
+            yield "ai_json_parse_total", "counter", "Model responses by parse outcome.", {"outcome": outcome}, count
+    for task, breaker in model_breakers.items():
+        stats = breaker.stats()
+        yield "ai_circuit_open", "gauge", "1 while the model circuit breaker is open.", {"task": task}, int(stats["state"] == "open")
+        yield "ai_circuit_short_circuited_total", "counter", "Model calls refused by an open breaker.", {"task": task}, stats["short_circuited"]
+    yield "ai_triage_local_ratio", "gauge", "Share of recommendations answered from templates.", {}, \
+        triage_tier.stats()["local_percent"] / 100
+    admission_stats = admission.stats()
+    for priority, depth in admission_stats["queued"].items():
+        yield "ai_admission_queue_depth", "gauge", "Requests waiting for a slot, by priority.", {"priority": priority}, depth
+    yield "ai_admission_active", "gauge", "Requests holding an admission slot.", {}, admission_stats["active"]
+    jobs = analysis_jobs.stats()
+    yield "ai_job_queue_depth", "gauge", "Analysis jobs queued or running.", {}, jobs["pending"]
+    yield "ai_jobs_rejected_total", "counter", "Analysis jobs rejected with 429.", {}, jobs["rejected"]
+    flight = precautions_flight.stats()
+    yield "ai_single_flight_coalesced_total", "counter", "Precaution calls served by an in-flight twin.", {}, flight["coalesced"]
+    pools = _medical_system.pool_stats() if _medical_system is not None else None
+    for task, pool in (pools or {}).items():
+        yield "ai_model_pool_in_use", "gauge", "Model handles checked out.", {"task": task}, pool["in_use"]
+        yield "ai_model_pool_waits_total", "counter", "Checkouts that waited for a handle.", {"task": task}, pool["waits"]
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Expose service metrics in the Prometheus text format."""
+    return Response(metrics.render(collect_service_metrics()), mimetype="text/plain; version=0.0.4")
+
+@app.errorhandler(413)
+def upload_too_large(e):
+    """Reject oversized uploads with a JSON error."""
+    return jsonify({"error": f"File too large. Maximum upload size is {MAX_UPLOAD_BYTES // (1024 * 1024)} MB"}), 413
+
 @app.route('/health', methods=['GET'])
 def health_check():
     """Simple health check endpoint."""
-    return jsonify({"status": "ok", "message": "Service is running"}), 200
+    return jsonify({
+        "status": "ok",
+        "message": "Service is running",
+        "model_pool": _medical_system.pool_stats() if _medical_system is not None else None,
+        "prompt_sizes": prompt_stats.stats(),
+        "analysis_cache": analysis_cache.stats(),
+        "chunk_analysis_cache": chunk_analysis_cache.stats(),
+        "doctor_directory_cache": doctor_directory_cache.stats(),
+        "precautions_cache": precautions_cache.stats(),
+        "translation_cache": translation_cache.stats(),
+        "precautions_single_flight": precautions_flight.stats(),
+        "json_parse": json_parse_stats.stats(),
+        "analysis_jobs": analysis_jobs.stats(),
+        "circuit_breakers": {task: breaker.stats() for task, breaker in model_breakers.items()},
+        "triage": triage_tier.stats(),
+        "admission": admission.stats()
+    }), 200
+
+@app.route('/ready', methods=['GET'])
+def readiness_check():
+    """Report which dependencies have finished warming up."""
+    dependencies = {
+        "mongo": {
+            "initialized": _init_done["mongo"].is_set(),
+            "connected": doctors_collection is not None
+        },
+        "gemini": {
+            "initialized": _init_done["gemini"].is_set(),
+            "model": gemini_model_name
+        },
+        "model_pool": _medical_system.pool_stats() if _medical_system is not None else None
+    }
+    ready = all(dep["initialized"] for dep in (dependencies["mongo"], dependencies["gemini"]))
+    return jsonify({"ready": ready, "dependencies": dependencies}), 200 if ready else 503
 
 @app.route('/analyze', methods=['POST', 'OPTIONS'])
 def analyze():
@@ -474,10 +3511,13 @@ def analyze():
     if request.method == 'OPTIONS':
         return '', 204
         
-    if 'file' not in request.files:
+    # Parsing the form spools the upload to memory or a temp file
+    with stage("upload"):
+        files = request.files
+    if 'file' not in files:
         return jsonify({"error": "No file provided"}), 400
     
-    file = request.files['file']
+    file = files['file']
     if file.filename == '' or not file.filename.lower().endswith('.pdf'):
         return jsonify({"error": "Invalid or no file selected"}), 400
     
@@ -485,20 +3525,134 @@ def analyze():
     data = request.form.to_dict()
     language = data.get("language", "en-US")
     
-    medical_system = MedicalSystem()
-    pdf_path = f"temp_{file.filename}"
+    if wants_job_mode():
+        try:
+            job_id = analysis_jobs.submit(file.stream.read(), file.filename, language)
+        except queue.Full:
+            response = jsonify({"error": "Analysis queue is full, retry later"})
+            response.status_code = 429
+            response.headers["Retry-After"] = str(analysis_jobs.retry_after())
+            return response
+        response = job_response({"job_id": job_id, "status": "queued", "status_url": f"/analyze/{job_id}"})
+        response.headers["Location"] = f"/analyze/{job_id}"
+        return response
+    
+    if wants_event_stream():
+        # Upload streams are closed when the view returns, before a streamed body is sent
+        upload = io.BytesIO(file.stream.read())
+        
+        def events():
+            try:
+                for kind, key, value in stream_analyze_upload(upload, language):
+                    yield sse_event(kind, {"key": key, "value": value} if kind == "section" else value)
+            except Exception as e:
+                logger.error(f"Analysis error: {str(e)}")
+                yield sse_event("error", {"error": str(e)})
+        return sse_response(events())
     
     try:
-        file.save(pdf_path)
-        text = medical_system.extract_text_from_pdf(pdf_path)
-        result = medical_system.analyze_medical_report(text, language)
-        return jsonify(result)
+        result, cached = analyze_upload(file.stream, language)
+        response = jsonify(result)
+        response.headers["X-Cache"] = "HIT" if cached else "MISS"
+        return response
     except Exception as e:
         logger.error(f"Analysis error: {str(e)}")
         return jsonify({"error": str(e)}), 500
-    finally:
-        if os.path.exists(pdf_path):
-            os.remove(pdf_path)
+
+@app.route('/analyze/<job_id>', methods=['GET'])
+def analyze_job(job_id):
+    """Poll a background analysis job submitted with mode=job."""
+    job = analysis_jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown job id"}), 404
+    return job_response(job)
+
+@app.route('/analyze/batch', methods=['POST', 'OPTIONS'])
+def analyze_batch():
+    """Analyze many report PDFs concurrently and return per-file results.
+
+    Files are sent as repeated "files" fields. With stream=true the results
+    are written as newline-delimited JSON in completion order.
+    """
+    if request.method == 'OPTIONS':
+        return '', 204
+    
+    files = request.files.getlist('files') or request.files.getlist('file')
+    if not files:
+        return jsonify({"error": "No files provided"}), 400
+    if len(files) > BATCH_MAX_FILES:
+        return jsonify({"error": f"Too many files. Maximum batch size is {BATCH_MAX_FILES}"}), 400
+    
+    data = request.form.to_dict()
+    language = data.get("language", "en-US")
+    stream = data.get("stream", "false").lower() in ("1", "true", "yes")
+    try:
+        concurrency = min(int(data.get("concurrency", BATCH_MAX_CONCURRENCY)), BATCH_MAX_CONCURRENCY)
+    except ValueError:
+        return jsonify({"error": "concurrency must be an integer"}), 400
+    concurrency = max(1, min(concurrency, len(files)))
+    
+    uploads = [(file.filename, file.stream) for file in files]
+    if stream:
+        # Upload streams are closed when the view returns, before a streamed body is sent
+        uploads = [(filename, io.BytesIO(upload.read())) for filename, upload in uploads]
+    
+    def analyze_one(index: int, filename: str, upload) -> Dict[str, Any]:
+        entry = {"index": index, "filename": filename}
+        if filename == '' or not filename.lower().endswith('.pdf'):
+            return {**entry, "status": "error", "error": "Invalid or no file selected"}
+        try:
+            result, cached = analyze_upload(upload, language)
+            status = "error" if "error" in result else "ok"
+            return {**entry, "status": status, "cached": cached, "result": result}
+        except Exception as e:
+            logger.error(f"Batch analysis error for {filename}: {str(e)}")
+            return {**entry, "status": "error", "error": str(e)}
+    
+    started = time.perf_counter()
+    
+    def run_batch():
+        with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="batch") as executor:
+            futures = [
+                executor.submit(analyze_one, index, filename, upload)
+                for index, (filename, upload) in enumerate(uploads)
+            ]
+            for future in as_completed(futures):
+                yield future.result()
+    
+    if stream:
+        def generate():
+            for entry in run_batch():
+                yield json.dumps(entry, cls=MongoJSONEncoder) + "\n"
+        return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+    
+    results = sorted(run_batch(), key=lambda entry: entry["index"])
+    succeeded = sum(1 for entry in results if entry["status"] == "ok")
+    return jsonify({
+        "results": results,
+        "count": len(results),
+        "succeeded": succeeded,
+        "failed": len(results) - succeeded,
+        "concurrency": concurrency,
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 1)
+    })
+
+@app.route('/doctors', methods=['GET'])
+def doctors_page():
+    """Page through the ranked doctors of a specialty (see DoctorSearch)."""
+    specialty = request.args.get("specialty", "")
+    if specialty not in MedicalSystem.SPECIALIZATIONS:
+        return jsonify({"error": f"Unknown specialty: {specialty}"}), 400
+    fields = {key: request.args.get(key) for key in ("city", "page_size", "cursor")}
+    if "lat" in request.args or "lng" in request.args:
+        fields["location"] = {"lat": request.args.get("lat"), "lng": request.args.get("lng")}
+    try:
+        search = DoctorSearch.from_request(specialty, fields)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    with stage("doctor_lookup"):
+        doctors, next_cursor = MedicalSystem.find_doctors(search)
+    return jsonify({"specialty": specialty, "doctors": doctors, "next_cursor": next_cursor})
 
 @app.route("/recommend", methods=["POST", "OPTIONS"])
 def recommend():
@@ -515,37 +3669,170 @@ def recommend():
             return jsonify({"error": "No data provided in request"}), 400
             
         symptoms = data.get("symptoms", "")
-        language = data.get("language", "en-US")
+        language = request_language(data.get("language"))
         
         if not symptoms:
             return jsonify({"error": "Symptoms are required."}), 400
+        if language is None:
+            return jsonify({"error": "language must be a string"}), 400
 
-        medical_system = MedicalSystem()
+        medical_system = get_medical_system()
+        client = request_client()
         
         # Get specialty and doctors
-        specialty = medical_system.find_best_specialty(symptoms)
-        doctors = medical_system.get_doctors_for_specialty(specialty)
-        
-        # Get dynamic precautions and recommendations
-        precautions_data = medical_system.get_precautions_and_recommendations(symptoms, language)
+        with stage("specialty_match"):
+            specialty, matches = medical_system.match_specialty(symptoms)
+        try:
+            search = DoctorSearch.from_request(specialty, data)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        local_answer, triage = triage_tier.decide(symptoms, language, matches)
+        with stage("doctor_lookup"):
+            doctors, next_cursor = medical_system.find_doctors(search)
         
-        response = {
-            "recommended_specialty": specialty,
-            "specialty_description": medical_system.SPECIALIZATIONS[specialty]["description"],
-            "available_doctors": doctors,
-            "doctors_available": len(doctors) > 0,  # Flag indicating whether doctors are available
-            "precautions_and_recommendations": precautions_data
-        }
+        if wants_event_stream():
+            def events():
+                # Doctors are known before the model starts, so send them first
+                response = build_recommendation(specialty, doctors, {}, matches, triage, next_cursor)
+                del response["precautions_and_recommendations"]
+                yield sse_event("doctors", response)
+                if local_answer is not None:
+                    precautions = [("section", key, value) for key, value in local_answer.items()]
+                    precautions.append(("complete", None, local_answer))
+                else:
+                    precautions = medical_system.stream_precautions(symptoms, language)
+                try:
+                    for kind, key, value in precautions:
+                        if kind == "section":
+                            yield sse_event("section", {"key": key, "value": value})
+                        else:
+                            note_assessment(client, value)
+                            yield sse_event("complete",
+                                            build_recommendation(specialty, doctors, value, matches, triage, next_cursor))
+                except Exception as e:
+                    logger.error(f"Request error: {str(e)}")
+                    yield sse_event("error", {"error": f"An unexpected error occurred: {str(e)}"})
+            return sse_response(events())
         
-        # Add a message when no doctors are available
-        if not doctors:
-            response["doctor_availability_message"] = f"No {specialty} doctors are currently available."
+        # Common mild cases are answered from templates; the rest go to the model
+        precautions_data = local_answer
+        if precautions_data is None:
+            precautions_data = medical_system.get_precautions_and_recommendations(symptoms, language)
+        note_assessment(client, precautions_data)
         
-        return jsonify(response)
+        return jsonify(build_recommendation(specialty, doctors, precautions_data, matches, triage, next_cursor))
             
     except Exception as e:
         logger.error(f"Request error: {str(e)}")
         return jsonify({"error": f"An unexpected error occurred: {str(e)}"}), 500
 
+def current_rss_bytes() -> int:
+    """Resident memory of this process; the peak so far where /proc is not available."""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        import resource
+        # ru_maxrss is in bytes on macOS and kilobytes elsewhere
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+def init_worker():
+    """Set up a forked server worker: fresh SQLite handles, then its own MongoDB and Gemini clients."""
+    global _worker_pid
+    _worker_pid = os.getpid()
+    for cache in (analysis_cache, chunk_analysis_cache, precautions_cache, translation_cache, doctor_directory_cache):
+        cache.reopen()
+    analysis_jobs.reopen()
+    # The master requeued interrupted jobs before forking; jobs running now belong to live workers
+    init_runtime(recover_jobs=False)
+
+# Process that last ran init_worker()
+_worker_pid = None
+_worker_lock = threading.Lock()
+
+def ensure_worker():
+    """Run init_worker() once in a pre-forked worker whose launcher did not call it.
+
+    serve() calls init_worker() from gunicorn's post_fork hook. Under any
+    other launcher with AI_PREFORK set, the worker initializes itself here,
+    on its first request (Flask) or at startup (the ASGI lifespan).
+    """
+    if not AI_PREFORK or _worker_pid == os.getpid():
+        return
+    with _worker_lock:
+        if _worker_pid != os.getpid():
+            logger.info(f"Initializing pre-forked worker {os.getpid()}")
+            init_worker()
+
+def serve(bind: str = SERVE_BIND, workers: int = SERVE_WORKERS, threads: int = SERVE_THREADS,
+          max_rss_mb: int = SERVE_MAX_RSS_MB):
+    """Serve the app with gunicorn, forking workers from this already imported process.
+
+    The master keeps the import-time state (specializations, compiled prompts,
+    the specialty matcher and triage templates) and freezes it out of the
+    garbage collector before forking, so workers share those pages
+    copy-on-write. Each worker opens its own MongoDB and Gemini clients after
+    the fork, and is replaced once its resident memory exceeds max_rss_mb.
+    Caches, metrics and admission slots are per worker; the analysis job
+    queue is shared through its SQLite file.
+    """
+    from gunicorn.app.base import BaseApplication
+
+    def when_ready(server):
+        # Collector passes write to every tracked object, which would copy the shared pages into each worker
+        gc.collect()
+        gc.freeze()
+
+    def post_fork(server, worker):
+        init_worker()
+
+    def post_request(worker, req, environ, resp):
+        if max_rss_mb and worker.alive and current_rss_bytes() > max_rss_mb * 1024 * 1024:
+            logger.warning(f"Worker {worker.pid} exceeded {max_rss_mb} MB resident memory; recycling it")
+            # The worker finishes its in-flight requests and exits; the master starts a replacement
+            worker.alive = False
+
+    def worker_exit(server, worker):
+        analysis_jobs.requeue_running()
+
+    options = {
+        "bind": bind,
+        "workers": max(1, workers),
+        "threads": max(1, threads),
+        "worker_class": "gthread",
+        "preload_app": True,
+        "timeout": SERVE_TIMEOUT,
+        "when_ready": when_ready,
+        "post_fork": post_fork,
+        "post_request": post_request,
+        "worker_exit": worker_exit
+    }
+
+    class Server(BaseApplication):
+        def load_config(self):
+            for key, value in options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            return app
+
+    logger.info(f"Serving on {bind} with {options['workers']} workers x {options['threads']} threads")
+    Server().run()
+
+# Extraction pool processes are spawned and re-import the main script as __mp_main__;
+# they must not start the service. Pre-forked workers call init_worker() after the fork instead
+if __name__ != "__mp_main__" and multiprocessing.parent_process() is None:
+    if AI_PREFORK:
+        # Once per start in the launcher's master, before any worker claims jobs
+        analysis_jobs.recover()
+    else:
+        init_runtime()
+    logger.info(f"Cold start finished in {(time.perf_counter() - _boot_started) * 1000:.1f} ms (lazy init: {AI_LAZY_INIT})")
+
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=8080, debug=True)
\ No newline at end of file
+    # python app.py serve runs the production server; plain python app.py the debug server
+    if sys.argv[1:2] == ["serve"]:
+        serve()
+    else:
+        app.run(host="0.0.0.0", port=8080, debug=True)
\ No newline at end of file
@@ -0,0 +1,336 @@
+"""Async (ASGI) serving mode for the AI service.
+
+/recommend and /analyze run natively on asyncio: MongoDB is queried through
+pymongo's AsyncMongoClient and Gemini through the SDK's async client, so one
+process can hold hundreds of in-flight requests while they wait on I/O. In
+/recommend the doctor lookup and the precautions generation run concurrently.
+Every other route is served by the Flask app in app.py, which also remains
+the standalone fallback (python app.py).
+
+Run with:
+    AI_LAZY_INIT=true uvicorn asgi_app:app --host 0.0.0.0 --port 8080
+"""
+import asyncio
+import functools
+import json
+import logging
+import queue
+import time
+from contextlib import asynccontextmanager
+from typing import Any, Optional
+
+from a2wsgi import WSGIMiddleware
+from pymongo import AsyncMongoClient
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+
+import app as flask_service
+from app import (
+    CANONICAL_LANGUAGE,
+    MAX_UPLOAD_BYTES,
+    MONGO_CLIENT_OPTIONS,
+    MONGO_URI,
+    DoctorSearch,
+    MongoJSONEncoder,
+    admission,
+    analysis_cache,
+    analysis_cache_key,
+    analysis_jobs,
+    begin_request,
+    build_recommendation,
+    client_identity,
+    doctor_directory_cache,
+    end_request,
+    ensure_worker,
+    get_medical_system,
+    language_cache_key,
+    note_assessment,
+    rejection_message,
+    request_language,
+    request_priority,
+    stage,
+    triage_tier,
+)
+
+logger = logging.getLogger(__name__)
+
+# Async MongoDB handles, bound during startup
+async_collections = {"doctors": None, "users": None}
+
+
+class ServiceJSONResponse(JSONResponse):
+    """JSON response that serializes ObjectIds like the Flask app."""
+
+    def render(self, content: Any) -> bytes:
+        return json.dumps(content, cls=MongoJSONEncoder).encode("utf-8")
+
+
+def instrumented(endpoint: str):
+    """Record request metrics and the slow-request breakdown for a native route."""
+    def decorator(handler):
+        @functools.wraps(handler)
+        async def wrapper(request: Request) -> Response:
+            started = time.perf_counter()
+            begin_request()
+            status = 500
+            try:
+                response = await handler(request)
+                status = response.status_code
+                return response
+            finally:
+                end_request(endpoint, request.method, status, time.perf_counter() - started)
+        return wrapper
+    return decorator
+
+
+def request_client(request: Request) -> str:
+    """Identity used for rate limiting (see client_identity)."""
+    return client_identity(request.headers.get("x-client-id"), request.client.host if request.client else None)
+
+
+def admitted(endpoint: str):
+    """Run a native route under admission control, shedding load with 429 and Retry-After."""
+    def decorator(handler):
+        @functools.wraps(handler)
+        async def wrapper(request: Request) -> Response:
+            if request.method != "POST":
+                return await handler(request)
+            client = request_client(request)
+            data = None
+            if endpoint == "/recommend":
+                try:
+                    data = await request.json()
+                except ValueError:
+                    pass
+            outcome, retry_after = await admission.admit_async(client, request_priority(endpoint, data, client))
+            if outcome != "admitted":
+                logger.warning(f"Rejected {endpoint} from {client}: {outcome}")
+                return ServiceJSONResponse({"error": rejection_message(outcome)}, status_code=429,
+                                           headers={"Retry-After": str(retry_after)})
+            admitted_at = time.perf_counter()
+            try:
+                return await handler(request)
+            finally:
+                admission.release(admitted_at)
+        return wrapper
+    return decorator
+
+
+async def timed(name: str, awaitable):
+    """Await under a stage timer, for stages that run inside asyncio.gather."""
+    with stage(name):
+        return await awaitable
+
+
+async def find_doctors_async(search: DoctorSearch) -> tuple:
+    """Async variant of MedicalSystem.find_doctors."""
+    cache_key = search.cache_key()
+    cached = doctor_directory_cache.get(cache_key)
+    if cached is not None:
+        return cached["doctors"], cached["next_cursor"]
+
+    if async_collections["doctors"] is None:
+        logger.warning("Database connection not available, returning empty doctors list")
+        return [], None
+
+    async def fetch(name: str, pipeline: list, collation: Optional[dict]) -> list:
+        cursor = await async_collections[name].aggregate(pipeline, collation=collation)
+        return [document async for document in cursor]
+
+    try:
+        doctors, next_cursor = await search.run_async(fetch)
+        doctor_directory_cache.set(cache_key, {"doctors": doctors, "next_cursor": next_cursor})
+        return doctors, next_cursor
+    except Exception as e:
+        logger.error(f"Database error: {str(e)}")
+        return [], None
+
+
+async def analyze_upload_async(stream, language: str, cache_key: Optional[str] = None):
+    """Async variant of app.analyze_upload; extraction runs on a worker thread."""
+    if cache_key is None:
+        with stage("upload_hash"):
+            cache_key = await run_in_threadpool(analysis_cache_key, stream, language)
+    cached = analysis_cache.get(cache_key)
+    if cached is not None:
+        return cached, True
+
+    medical_system = await run_in_threadpool(get_medical_system)
+    if medical_system.translates(language):
+        canonical, _ = await analyze_upload_async(
+            stream, CANONICAL_LANGUAGE, language_cache_key(cache_key, CANONICAL_LANGUAGE)
+        )
+        result = await medical_system.localize_async("analysis", canonical, language)
+    else:
+        pages = await run_in_threadpool(medical_system.extract_pages_from_pdf, stream)
+        result = await medical_system.analyze_medical_report_async(" ".join(pages), language, pages)
+    # Fallback payloads carry an "error" key and must not be served again
+    if "error" not in result:
+        analysis_cache.set(cache_key, result)
+    return result, False
+
+
+@instrumented("/recommend")
+@admitted("/recommend")
+async def recommend(request: Request) -> Response:
+    """Handle symptom-based doctor recommendations with dynamic precautions."""
+    if request.method == "OPTIONS":
+        return Response(status_code=204)
+
+    try:
+        try:
+            data = await request.json()
+        except ValueError:
+            data = None
+        logger.info(f"Received request data: {data}")
+
+        if not data:
+            logger.warning("No JSON data received in request")
+            return ServiceJSONResponse({"error": "No data provided in request"}, status_code=400)
+
+        symptoms = data.get("symptoms", "")
+        language = request_language(data.get("language"))
+
+        if not symptoms:
+            return ServiceJSONResponse({"error": "Symptoms are required."}, status_code=400)
+        if language is None:
+            return ServiceJSONResponse({"error": "language must be a string"}, status_code=400)
+
+        medical_system = await run_in_threadpool(get_medical_system)
+        with stage("specialty_match"):
+            specialty, matches = medical_system.match_specialty(symptoms)
+        try:
+            search = DoctorSearch.from_request(specialty, data)
+        except ValueError as e:
+            return ServiceJSONResponse({"error": str(e)}, status_code=400)
+        local_answer, triage = triage_tier.decide(symptoms, language, matches)
+
+        if local_answer is not None:
+            doctors, next_cursor = await timed("doctor_lookup", find_doctors_async(search))
+            note_assessment(request_client(request), local_answer)
+            return ServiceJSONResponse(
+                build_recommendation(specialty, doctors, local_answer, matches, triage, next_cursor)
+            )
+
+        # The doctor lookup and the model call do not depend on each other
+        (doctors, next_cursor), precautions_data = await asyncio.gather(
+            timed("doctor_lookup", find_doctors_async(search)),
+            medical_system.get_precautions_and_recommendations_async(symptoms, language)
+        )
+        note_assessment(request_client(request), precautions_data)
+        return ServiceJSONResponse(
+            build_recommendation(specialty, doctors, precautions_data, matches, triage, next_cursor)
+        )
+
+    except Exception as e:
+        logger.error(f"Request error: {str(e)}")
+        return ServiceJSONResponse({"error": f"An unexpected error occurred: {str(e)}"}, status_code=500)
+
+
+@instrumented("/analyze")
+@admitted("/analyze")
+async def analyze(request: Request) -> Response:
+    """Handle medical report analysis requests."""
+    if request.method == "OPTIONS":
+        return Response(status_code=204)
+
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > MAX_UPLOAD_BYTES:
+        return ServiceJSONResponse(
+            {"error": f"File too large. Maximum upload size is {MAX_UPLOAD_BYTES // (1024 * 1024)} MB"},
+            status_code=413
+        )
+
+    with stage("upload"):
+        form = await request.form(max_part_size=MAX_UPLOAD_BYTES)
+    try:
+        file = form.get("file")
+        if file is None or isinstance(file, str):
+            return ServiceJSONResponse({"error": "No file provided"}, status_code=400)
+        if not file.filename or not file.filename.lower().endswith(".pdf"):
+            return ServiceJSONResponse({"error": "Invalid or no file selected"}, status_code=400)
+
+        language = form.get("language", "en-US")
+        if (request.query_params.get("mode") or form.get("mode", "")).lower() == "job":
+            content = await file.read()
+            try:
+                job_id = await run_in_threadpool(analysis_jobs.submit, content, file.filename, language)
+            except queue.Full:
+                return ServiceJSONResponse({"error": "Analysis queue is full, retry later"}, status_code=429,
+                                           headers={"Retry-After": str(analysis_jobs.retry_after())})
+            return ServiceJSONResponse(
+                {"job_id": job_id, "status": "queued", "status_url": f"/analyze/{job_id}"},
+                status_code=202,
+                headers={"Location": f"/analyze/{job_id}", "Retry-After": str(analysis_jobs.retry_after())}
+            )
+
+        try:
+            result, cached = await analyze_upload_async(file.file, language)
+            return ServiceJSONResponse(result, headers={"X-Cache": "HIT" if cached else "MISS"})
+        except Exception as e:
+            logger.error(f"Analysis error: {str(e)}")
+            return ServiceJSONResponse({"error": str(e)}, status_code=500)
+    finally:
+        await form.close()
+
+
+@asynccontextmanager
+async def lifespan(app: Starlette):
+    """Open the async MongoDB client for the lifetime of the server."""
+    # A worker forked from a preloading master (AI_PREFORK) starts its clients and job workers here
+    await run_in_threadpool(ensure_worker)
+    client = None
+    try:
+        client = AsyncMongoClient(MONGO_URI, **MONGO_CLIENT_OPTIONS)
+        db = client.get_database()
+        async_collections["doctors"] = db["doctors"]
+        async_collections["users"] = db["users"]
+        logger.info("Async MongoDB client created")
+    except Exception as e:
+        logger.error(f"Async MongoDB setup error: {str(e)}")
+    yield
+    async_collections["doctors"] = None
+    async_collections["users"] = None
+    if client is not None:
+        await client.close()
+
+
+native_app = Starlette(
+    routes=[
+        Route("/recommend", recommend, methods=["POST", "OPTIONS"]),
+        Route("/analyze", analyze, methods=["POST", "OPTIONS"]),
+    ],
+    middleware=[
+        Middleware(
+            CORSMiddleware,
+            allow_origins=["http://localhost:5173", "http://127.0.0.1:3000", "*"],
+            allow_methods=["GET", "POST", "OPTIONS"],
+            allow_headers=["Content-Type", "Authorization"],
+            allow_credentials=True
+        )
+    ],
+    lifespan=lifespan
+)
+NATIVE_PATHS = {"/recommend", "/analyze"}
+flask_fallback = WSGIMiddleware(flask_service.app)
+
+
+def wants_event_stream(scope) -> bool:
+    """Streaming responses (?stream=true or Accept: text/event-stream) are served by Flask."""
+    query = scope.get("query_string", b"").decode("latin-1").lower()
+    accept = dict(scope.get("headers", [])).get(b"accept", b"").decode("latin-1")
+    return any(flag in query.split("&") for flag in ("stream=1", "stream=true", "stream=yes")) \
+        or "text/event-stream" in accept
+
+
+async def app(scope, receive, send):
+    """Route native paths to the async app and everything else to Flask."""
+    if scope["type"] == "lifespan" or (scope.get("path") in NATIVE_PATHS and not wants_event_stream(scope)):
+        await native_app(scope, receive, send)
+    else:
+        await flask_fallback(scope, receive, send)
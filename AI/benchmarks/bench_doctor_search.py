@@ -0,0 +1,201 @@
+"""Benchmark ranked, keyset-paginated doctor search against the old lookup.
+
+Seeds a reproducible directory (100k doctors by default) and times each
+query shape DoctorSearch issues, next to the old unranked "first five
+available" aggregation and to reaching a deep page with $skip:
+
+    legacy      first 5 available doctors, unranked (the pre-search query)
+    page 1      most experienced first
+    city        requested city first: the city's user ids, then its doctors
+    elsewhere   everyone outside the city, after the city's doctors ran out
+    page N      page N through the cursor chain, timing only the last page
+    page N skip the same page reached with $skip
+    near        nearest first, in distance bands, from a city centre
+
+By default the queries run against the in-memory FakeDatabase, which has
+no indexes: it shows latency and round trips, and its examined column is
+what an unindexed collection would scan. Set BENCH_MONGO_URI to run against
+a real MongoDB instead; the directory is written to the ai_bench_doctor_search
+database, the REQUIRED_INDEXES are created, and explain() reports the keys
+and documents each query examined.
+
+Usage:
+    python benchmarks/bench_doctor_search.py [--doctors 100000] [--page-size 5] [--page 20] [--runs 20]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("AI_LAZY_INIT", "true")
+
+import app  # noqa: E402
+from app import CITY_COLLATION, DoctorSearch, MedicalSystem, REQUIRED_INDEXES  # noqa: E402
+from fakes import CITIES, FakeDatabase, seed_directory  # noqa: E402
+
+SPECIALTY = "Cardiologist"
+CITY = "Pune"
+
+
+def legacy_pipeline(specialty: str, limit: int = 5) -> list:
+    """The unranked aggregation get_doctors_for_specialty ran before DoctorSearch."""
+    return [
+        {"$match": {"specialization": specialty, "isAvailable": True}},
+        {"$limit": limit},
+        {"$lookup": {"from": "users", "localField": "userId", "foreignField": "_id", "as": "user"}},
+        {"$unwind": "$user"},
+        {"$project": {"degree": 1, "experience": 1, "user.firstName": 1, "user.lastName": 1, "user.address.city": 1}}
+    ]
+
+
+def skip_pipeline(search: DoctorSearch, page: int) -> list:
+    """The ranked first-segment query, reaching a page with $skip instead of a cursor."""
+    _, pipeline = search.pipeline("all", None, search.page_size)
+    pipeline = [stage for stage in pipeline if "$limit" not in stage]
+    sort_at = next(i for i, stage in enumerate(pipeline) if "$sort" in stage)
+    paging = [{"$skip": (page - 1) * search.page_size}, {"$limit": search.page_size}]
+    return pipeline[:sort_at + 1] + paging + pipeline[sort_at + 1:]
+
+
+def cursor_for_page(search_args: dict, page: int, fetch) -> str:
+    """Follow the cursor chain to the cursor of the given page."""
+    cursor = None
+    for _ in range(page - 1):
+        _, cursor = DoctorSearch(SPECIALTY, cursor=cursor, **search_args).run(fetch)
+    return cursor
+
+
+def percentile(sorted_values: list, fraction: float) -> float:
+    index = min(len(sorted_values) - 1, max(0, round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def examined(explain: dict) -> tuple:
+    """Sum (keys, documents) examined over every stage of an explain() result."""
+    keys = docs = 0
+    if isinstance(explain, dict):
+        keys += explain.get("totalKeysExamined", 0) if isinstance(explain.get("totalKeysExamined"), int) else 0
+        docs += explain.get("totalDocsExamined", 0) if isinstance(explain.get("totalDocsExamined"), int) else 0
+        children = explain.values()
+    elif isinstance(explain, list):
+        children = explain
+    else:
+        return 0, 0
+    for child in children:
+        if isinstance(child, (dict, list)):
+            child_keys, child_docs = examined(child)
+            keys += child_keys
+            docs += child_docs
+    return keys, docs
+
+
+class Backend:
+    """Runs aggregations on the fake or a real database and reports their cost."""
+
+    def __init__(self, database, real: bool):
+        self.database = database
+        self.real = real
+        self.round_trips = 0
+
+    def fetch(self, collection: str, pipeline: list, collation: dict = None) -> list:
+        self.round_trips += 1
+        return list(self.database[collection].aggregate(pipeline, collation=collation))
+
+    def cost(self, collection: str, pipeline: list, collation: dict = None) -> str:
+        """Keys/documents examined by one run of a pipeline."""
+        if self.real:
+            command = {"aggregate": collection, "pipeline": pipeline, "cursor": {}}
+            if collation:
+                command["collation"] = collation
+            keys, docs = examined(self.database.command("explain", command, verbosity="executionStats"))
+            return f"{keys} keys / {docs} docs"
+        before = {name: c.examined for name, c in self.database.collections.items()}
+        self.fetch(collection, pipeline, collation)
+        self.round_trips -= 1
+        scanned = sum(c.examined - before.get(name, 0) for name, c in self.database.collections.items())
+        return f"{scanned} docs"
+
+
+def open_backend(doctors: int) -> Backend:
+    per_specialty = max(1, doctors // len(MedicalSystem.SPECIALIZATIONS))
+    seeded = seed_directory(FakeDatabase(), MedicalSystem.SPECIALIZATIONS, per_specialty)
+    uri = os.getenv("BENCH_MONGO_URI")
+    if not uri:
+        return Backend(seeded, real=False)
+
+    from pymongo import MongoClient
+    database = MongoClient(uri)["ai_bench_doctor_search"]
+    for name in ("users", "doctors"):
+        database[name].drop()
+        database[name].insert_many(seeded[name].documents)
+    for name, keys, options in REQUIRED_INDEXES:
+        database[name].create_index(keys, **options)
+    return Backend(database, real=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--doctors", type=int, default=100000)
+    parser.add_argument("--page-size", type=int, default=5)
+    parser.add_argument("--page", type=int, default=20, help="deep page compared between cursor and $skip")
+    parser.add_argument("--runs", type=int, default=20)
+    args = parser.parse_args()
+    app.logger.setLevel("ERROR")
+
+    started = time.perf_counter()
+    backend = open_backend(args.doctors)
+    print(f"seeded {args.doctors} doctors in {time.perf_counter() - started:.1f}s "
+          f"({'MongoDB' if backend.real else 'in-memory fake, no indexes'})")
+
+    longitude, latitude = CITIES[CITY]
+    all_args = {"page_size": args.page_size}
+    near_args = {"page_size": args.page_size, "coordinates": (longitude, latitude)}
+    deep_cursor = cursor_for_page(all_args, args.page, backend.fetch)
+    deep = DoctorSearch(SPECIALTY, cursor=deep_cursor, **all_args)
+    city_search = DoctorSearch(SPECIALTY, city=CITY, **all_args)
+    # Each case is a list of (collection, pipeline, collation) run one after the other
+    city_lookup = (*city_search.city_pipeline(), CITY_COLLATION)
+    city_users = [document["_id"] for document in backend.fetch(*city_lookup)]
+    cases = [
+        ("legacy", lambda: [("doctors", legacy_pipeline(SPECIALTY, args.page_size), None)]),
+        ("page 1", lambda: [(*DoctorSearch(SPECIALTY, **all_args).pipeline("all", None, args.page_size + 1), None)]),
+        ("city", lambda: [city_lookup,
+                          (*city_search.pipeline("city", None, args.page_size + 1, city_users), None)]),
+        ("elsewhere", lambda: [city_lookup,
+                               (*city_search.pipeline("elsewhere", None, args.page_size + 1, city_users), None)]),
+        (f"page {args.page}", lambda: [(*deep.pipeline(deep.segment, deep.after, args.page_size + 1), None)]),
+        (f"page {args.page} skip", lambda: [("doctors", skip_pipeline(deep, args.page), None)]),
+        ("near", lambda: [(*DoctorSearch(SPECIALTY, **near_args).pipeline("near", None, args.page_size + 1), None)]),
+    ]
+
+    print(f"{'query':<14} {'p50 ms':>8} {'p95 ms':>8} {'trips':>6}  examined")
+    for name, queries in cases:
+        latencies = []
+        for _ in range(args.runs):
+            backend.round_trips = 0
+            began = time.perf_counter()
+            for collection, pipeline, collation in queries():
+                backend.fetch(collection, pipeline, collation)
+            latencies.append(time.perf_counter() - began)
+        latencies.sort()
+        cost = ", ".join(backend.cost(*query) for query in queries())
+        print(f"{name:<14} {percentile(latencies, 0.5) * 1000:>8.1f} {percentile(latencies, 0.95) * 1000:>8.1f} "
+              f"{backend.round_trips:>6}  {cost}")
+
+    # End to end through DoctorSearch.run, which may need a second query at a segment boundary;
+    # the city lookup runs on the first page only, later pages reuse the cached user ids
+    search = DoctorSearch(SPECIALTY, city=CITY, **all_args)
+    backend.round_trips = 0
+    pages = 0
+    while True:
+        doctors, cursor = search.run(backend.fetch)
+        pages += 1
+        if cursor is None or pages >= args.page:
+            break
+        search = DoctorSearch(SPECIALTY, city=CITY, cursor=cursor, **all_args)
+    print(f"city search, {pages} pages through DoctorSearch.run: {backend.round_trips / pages:.2f} round trips per page")
+
+
+if __name__ == "__main__":
+    main()
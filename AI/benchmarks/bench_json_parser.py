@@ -0,0 +1,90 @@
+"""Benchmark clean_json_response against the previous regex/quote-replacement parser.
+
+Runs both parsers over data/malformed_responses.jsonl, a corpus of model
+outputs covering the failure modes seen from Gemini (code fences, prose
+around the object, trailing commas, single quotes, apostrophes, truncation,
+raw newlines, refusals). Reports per-response parse success and the average
+time per response for each parser.
+
+Usage:
+    python benchmarks/bench_json_parser.py [--corpus PATH] [--iterations N]
+"""
+import argparse
+import json
+import logging
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("AI_LAZY_INIT", "true")
+
+from app import MedicalSystem  # noqa: E402
+
+DEFAULT_CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "malformed_responses.jsonl")
+
+
+def legacy_clean_json_response(response_text: str):
+    """The parser clean_json_response replaced, kept here for comparison."""
+    try:
+        return json.loads(response_text)
+    except json.JSONDecodeError:
+        match = re.search(r'\{.*\}', response_text, re.DOTALL)
+        if match:
+            try:
+                return json.loads(match.group(0))
+            except json.JSONDecodeError:
+                pass
+        try:
+            return json.loads(response_text.replace("'", '"'))
+        except json.JSONDecodeError:
+            pass
+    return {"error": "Failed to parse AI response", "raw_response": response_text}
+
+
+def parsed(result) -> bool:
+    return isinstance(result, dict) and "error" not in result
+
+
+def time_parser(parser, responses, iterations: int) -> float:
+    """Average microseconds per response."""
+    started = time.perf_counter()
+    for _ in range(iterations):
+        for text in responses:
+            parser(text)
+    return (time.perf_counter() - started) / (iterations * len(responses)) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS)
+    parser.add_argument("--iterations", type=int, default=200)
+    args = parser.parse_args()
+    logging.getLogger("app").setLevel(logging.ERROR)
+
+    with open(args.corpus, "r", encoding="utf-8") as f:
+        corpus = [json.loads(line) for line in f if line.strip()]
+    responses = [entry["response"] for entry in corpus]
+
+    print(f"{'response':<36} {'chars':>6} {'legacy':>7} {'us':>7} {'new':>5} {'us':>7}")
+    for entry in corpus:
+        text = entry["response"]
+        legacy_ok = parsed(legacy_clean_json_response(text))
+        new_ok = parsed(MedicalSystem.clean_json_response(text))
+        legacy_us = time_parser(legacy_clean_json_response, [text], args.iterations)
+        new_us = time_parser(MedicalSystem.clean_json_response, [text], args.iterations)
+        print(f"{entry['name']:<36} {len(text):>6} {'ok' if legacy_ok else 'FAIL':>7} {legacy_us:>7.1f} "
+              f"{'ok' if new_ok else 'FAIL':>5} {new_us:>7.1f}")
+
+    legacy_success = sum(parsed(legacy_clean_json_response(text)) for text in responses)
+    new_success = sum(parsed(MedicalSystem.clean_json_response(text)) for text in responses)
+    legacy_us = time_parser(legacy_clean_json_response, responses, args.iterations)
+    new_us = time_parser(MedicalSystem.clean_json_response, responses, args.iterations)
+    print()
+    print(f"legacy: {legacy_success}/{len(responses)} parsed, {legacy_us:.1f} us/response")
+    print(f"new:    {new_success}/{len(responses)} parsed, {new_us:.1f} us/response")
+
+
+if __name__ == "__main__":
+    main()
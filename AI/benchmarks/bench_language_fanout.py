@@ -0,0 +1,75 @@
+"""Compare model cost of serving one report and one symptom set in several languages.
+
+With LANGUAGE_FANOUT off every language runs a full analysis; with it on the
+canonical analysis runs once and each other language only translates the
+text fields. Uses the Flask test client and FakeGenerativeModel, and prints
+model calls and estimated input tokens (instruction plus prompt) per mode.
+
+Usage:
+    python benchmarks/bench_language_fanout.py [--languages en-US hi-IN es-ES fr-FR] [--pages N]
+"""
+import argparse
+import io
+import logging
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("AI_LAZY_INIT", "true")
+
+import app  # noqa: E402
+from fakes import install, make_pdf  # noqa: E402
+from make_corpus import report_page  # noqa: E402
+
+SYMPTOMS = "persistent dry cough with a sore throat and mild fever"
+
+
+def run(fanout: bool, languages: list, report: bytes) -> dict:
+    """Serve the report and the symptoms in every language and total the model traffic."""
+    app.LANGUAGE_FANOUT = fanout
+    for cache in (app.analysis_cache, app.chunk_analysis_cache, app.precautions_cache, app.translation_cache):
+        cache.clear()
+    fake = install(app)
+    client = app.app.test_client()
+    for language in languages:
+        response = client.post("/analyze", data={"file": (io.BytesIO(report), "report.pdf"), "language": language},
+                               content_type="multipart/form-data")
+        assert response.status_code == 200 and "error" not in response.get_json(), response.get_data(as_text=True)
+        response = client.post("/recommend", json={"symptoms": SYMPTOMS, "language": language})
+        assert response.status_code == 200, response.get_data(as_text=True)
+
+    totals = {}
+    for system_instruction, prompt in fake.prompts:
+        task = next(name for name, task in app.TASK_PROMPTS.items() if task.instruction == system_instruction)
+        # The bound system instruction is billed as input on every call too
+        calls, chars = totals.get(task, (0, 0))
+        totals[task] = (calls + 1, chars + len(system_instruction) + len(prompt))
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--languages", nargs="+", default=["en-US", "hi-IN", "es-ES", "fr-FR"])
+    parser.add_argument("--pages", type=int, default=8)
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.ERROR)
+    # Every request comes from the test client's single address
+    app.admission.enabled = False
+    # Mild, confident cases are answered by the triage tier; turn it off to exercise the model path
+    app.triage_tier.enabled = False
+
+    rng = random.Random(3)
+    report = make_pdf([report_page(rng, 1, page, args.pages) for page in range(args.pages)])
+
+    print(f"{len(args.languages)} languages: {' '.join(args.languages)}")
+    print(f"{'mode':<8} {'task':<12} {'calls':>6} {'input tokens':>14}")
+    for fanout in (False, True):
+        totals = run(fanout, args.languages, report)
+        for task, (calls, chars) in sorted(totals.items()):
+            print(f"{'fanout' if fanout else 'direct':<8} {task:<12} {calls:>6} {chars // app.CHARS_PER_TOKEN:>14}")
+    print("(translation prompts carry only the text fields; analysis prompts carry the whole report)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""Check and measure per-request prompt sizes against a local stand-in model.
+
+Sends /recommend and /analyze requests through the Flask test client with
+FakeGenerativeModel in place of Gemini. Verifies that every model handle is
+bound to its task's system instruction and that no request resends the
+instruction, then prints the average prompt size per task with the
+instruction inlined (before) and as actually sent (after).
+
+Usage:
+    python benchmarks/bench_prompt_sizes.py [--requests N]
+"""
+import argparse
+import io
+import logging
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("AI_LAZY_INIT", "true")
+
+import app  # noqa: E402
+from fakes import install, make_pdf  # noqa: E402
+
+SAMPLE_SYMPTOMS = [
+    "fever and dry cough for three days",
+    "sharp chest pain when climbing stairs",
+    "itchy rash on both arms after gardening",
+    "my child has had a headache since yesterday",
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=20)
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.ERROR)
+    # Every request comes from the test client's single address
+    app.admission.enabled = False
+
+    fake = install(app)
+    client = app.app.test_client()
+    for i in range(args.requests):
+        symptoms = f"{SAMPLE_SYMPTOMS[i % len(SAMPLE_SYMPTOMS)]} (case {i})"
+        language = "en-US" if i % 2 else "es-ES"
+        response = client.post("/recommend", json={"symptoms": symptoms, "language": language})
+        assert response.status_code == 200, response.get_data(as_text=True)
+
+        report = make_pdf([f"Patient {i}: temperature 38.2 C, dry cough, mild fatigue.", "No chest pain reported."])
+        response = client.post("/analyze", data={"file": (io.BytesIO(report), f"report-{i}.pdf"), "language": language},
+                               content_type="multipart/form-data")
+        assert response.status_code == 200, response.get_data(as_text=True)
+
+    assert fake.prompts, "the stand-in model was never called"
+    for system_instruction, prompt in fake.prompts:
+        assert system_instruction in (task.instruction for task in app.TASK_PROMPTS.values()), \
+            "model handle is not bound to a task instruction"
+        assert "Required JSON structure" not in prompt, "request prompt still carries the schema"
+
+    print(f"{len(fake.prompts)} model calls, all with a bound system instruction and no resent schema")
+    print(f"{'task':<12} {'requests':>8} {'instruction':>11} {'before':>8} {'after':>8} {'saved':>7}")
+    for task, stats in app.prompt_stats.stats().items():
+        print(f"{task:<12} {stats['requests']:>8} {stats['instruction_tokens']:>11} "
+              f"{stats['avg_inline_tokens']:>8} {stats['avg_sent_tokens']:>8} {stats['saved_ratio']:>7.1%}")
+    print("(sizes are estimated tokens per request)")
+
+
+if __name__ == "__main__":
+    main()
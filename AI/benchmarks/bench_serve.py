@@ -0,0 +1,185 @@
+"""Compare the pre-forking server (python app.py serve) with the debug server.
+
+Starts the service in a subprocess, once as `app.run(debug=True)` (the
+plain python app.py entry point) and once through serve() with gunicorn
+workers, each with Gemini and MongoDB replaced by the stand-ins from
+fakes.py. Both are then driven with the same requests as load_test.py. The
+result caches are disabled by default so every request does its full
+work; --warm keeps them.
+
+Besides latency and throughput, the run reports the memory of the whole
+server process tree: RSS counts shared pages once per process, PSS splits
+them between the processes sharing them, so the gap between the two is
+what pre-forking saves.
+
+Usage:
+    python benchmarks/bench_serve.py [--modes debug serve] [--endpoints recommend analyze]
+        [--concurrency 1 8 32] [--requests N] [--workers N] [--threads N] [--latency S] [--warm]
+"""
+import argparse
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+AI_DIR = os.path.dirname(BENCH_DIR)
+
+
+def run_server(mode: str, latency: float, jitter: float, mongo_latency: float):
+    """Subprocess side: install the stand-ins and run one of the entry points."""
+    sys.path.insert(0, AI_DIR)
+    if mode == "serve":
+        os.environ["AI_PREFORK"] = "true"
+    import app
+    from fakes import FakeDatabase, install, install_store, seed_directory
+
+    def use_stand_ins():
+        install(app, latency=latency, jitter=jitter)
+        install_store(app, seed_directory(FakeDatabase(mongo_latency), app.MedicalSystem.SPECIALIZATIONS, 50))
+
+    if mode == "serve":
+        init_worker = app.init_worker
+
+        def init_worker_with_stand_ins():
+            init_worker()
+            use_stand_ins()
+
+        # post_fork looks init_worker up at call time, so each worker gets the stand-ins after its own init
+        app.init_worker = init_worker_with_stand_ins
+        app.serve()
+    else:
+        use_stand_ins()
+        host, port = os.environ["SERVE_BIND"].rsplit(":", 1)
+        app.app.run(host=host, port=int(port), debug=True)
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_ready(port: int, timeout: float = 60.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/health", timeout=2) as response:
+                if response.status == 200:
+                    return
+        except OSError:
+            time.sleep(0.2)
+    raise SystemExit(f"Server on port {port} did not become ready")
+
+
+def process_tree(root: int) -> list:
+    """The root pid and all of its descendants."""
+    children = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat", "r") as f:
+                parent = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, ValueError, IndexError):
+            continue
+        children.setdefault(parent, []).append(int(entry))
+    pids, stack = [], [root]
+    while stack:
+        pid = stack.pop()
+        pids.append(pid)
+        stack.extend(children.get(pid, []))
+    return pids
+
+
+def tree_memory(root: int) -> tuple:
+    """(RSS MB, PSS MB) summed over the server's process tree."""
+    rss = pss = 0
+    for pid in process_tree(root):
+        try:
+            with open(f"/proc/{pid}/smaps_rollup", "r") as f:
+                for line in f:
+                    if line.startswith("Rss:"):
+                        rss += int(line.split()[1])
+                    elif line.startswith("Pss:"):
+                        pss += int(line.split()[1])
+        except OSError:
+            continue
+    return round(rss / 1024, 1), round(pss / 1024, 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modes", nargs="+", default=["debug", "serve"], choices=["debug", "serve"])
+    parser.add_argument("--endpoints", nargs="+", default=["recommend", "analyze"], choices=["recommend", "analyze"])
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--requests", type=int, default=200, help="requests per concurrency level")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.8, help="stand-in model latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.4)
+    parser.add_argument("--mongo-latency", type=float, default=0.02)
+    parser.add_argument("--warm", action="store_true", help="keep the result caches on")
+    parser.add_argument("--run-server", choices=["debug", "serve"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_server:
+        run_server(args.run_server, args.latency, args.jitter, args.mongo_latency)
+        return
+
+    sys.path.insert(0, AI_DIR)
+    os.environ.setdefault("AI_LAZY_INIT", "true")
+    from load_test import RequestFactory, run_level
+
+    factory = RequestFactory()
+    results = []
+    for mode in args.modes:
+        port = free_port()
+        environment = {
+            **os.environ,
+            "SERVE_BIND": f"127.0.0.1:{port}",
+            "SERVE_WORKERS": str(args.workers),
+            "SERVE_THREADS": str(args.threads),
+            "MONGO_URI": "invalid://bench",
+            "AI_LAZY_INIT": "false",
+            "ADMISSION_ENABLED": "false",
+            "ANALYSIS_JOB_DB_PATH": os.path.join(tempfile.mkdtemp(), "jobs.sqlite3"),
+            "PYTHONWARNINGS": "ignore"
+        }
+        if not args.warm:
+            environment.update({"ANALYSIS_CACHE_TTL": "0", "PRECAUTIONS_CACHE_TTL": "0", "DOCTOR_CACHE_TTL": "0"})
+        command = [sys.executable, os.path.abspath(__file__), "--run-server", mode, "--latency", str(args.latency),
+                   "--jitter", str(args.jitter), "--mongo-latency", str(args.mongo_latency)]
+        server = subprocess.Popen(command, cwd=AI_DIR, env=environment, start_new_session=True,
+                                  stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            wait_ready(port)
+            for endpoint in args.endpoints:
+                for concurrency in args.concurrency:
+                    result = run_level(port, factory, endpoint, concurrency, args.requests, cold=False)
+                    result["mode"] = mode
+                    result["rss_mb"], result["pss_mb"] = tree_memory(server.pid)
+                    results.append(result)
+                    print(f"{mode:<6} {endpoint:<10} c={concurrency:<4} ok={result['ok']:<5} err={result['errors']:<4} "
+                          f"rps={result['rps']:<8} p50={result['p50_ms']:<8} p95={result['p95_ms']:<8} "
+                          f"rss={result['rss_mb']} MB pss={result['pss_mb']} MB", flush=True)
+        finally:
+            os.killpg(server.pid, signal.SIGTERM)
+            try:
+                server.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                os.killpg(server.pid, signal.SIGKILL)
+
+    print(f"\n{'mode':<6} {'endpoint':<10} {'conc':>4} {'ok':>5} {'err':>4} {'rps':>8} {'p50 ms':>8} {'p95 ms':>8} "
+          f"{'p99 ms':>8} {'RSS MB':>8} {'PSS MB':>8}")
+    for r in results:
+        print(f"{r['mode']:<6} {r['endpoint']:<10} {r['concurrency']:>4} {r['ok']:>5} {r['errors']:>4} {r['rps']:>8} "
+              f"{r['p50_ms']:>8} {r['p95_ms']:>8} {r['p99_ms']:>8} {r['rss_mb']:>8} {r['pss_mb']:>8}")
+
+
+if __name__ == "__main__":
+    main()
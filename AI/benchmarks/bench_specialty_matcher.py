@@ -0,0 +1,86 @@
+"""Micro-benchmark for SpecialtyMatcher against the old linear keyword scan.
+
+Pads the real vocabulary with synthetic keywords to increasing sizes and
+reports the per-request matching cost. The compiled matcher should stay
+roughly flat while the linear scan grows with the vocabulary.
+
+Usage:
+    python benchmarks/bench_specialty_matcher.py [--sizes 100 1000 10000 100000]
+"""
+import argparse
+import os
+import random
+import string
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("AI_LAZY_INIT", "true")
+
+from app import MedicalSystem, SPECIALTY_VOCAB_PATH, SpecialtyMatcher  # noqa: E402
+
+SAMPLE_SYMPTOMS = [
+    "chest pain after a fracture",
+    "mild cold and cough for two days",
+    "my child has a rash and high temperature",
+    "severe headache with numbness in the left arm",
+    "feeling anxious and cannot sleep at night",
+    "knee pain and swelling after running, also some back pain",
+    "I have been coughing for three weeks with fatigue and body ache and no appetite",
+]
+
+
+def synthetic_vocabulary(size: int, rng: random.Random) -> dict:
+    """Return the real vocabulary padded with random one- and two-word terms."""
+    base = SpecialtyMatcher.from_file(SPECIALTY_VOCAB_PATH, MedicalSystem.SPECIALIZATIONS)
+    vocabulary = {specialty: {} for specialty in MedicalSystem.SPECIALIZATIONS}
+    for term, entries in base._terms.items():
+        for specialty, weight in entries:
+            vocabulary[specialty][term] = weight
+    specialties = list(vocabulary)
+    while sum(len(terms) for terms in vocabulary.values()) < size:
+        words = ["".join(rng.choices(string.ascii_lowercase, k=rng.randint(5, 10))) for _ in range(rng.randint(1, 2))]
+        vocabulary[rng.choice(specialties)][" ".join(words)] = round(rng.uniform(0.5, 3.0), 1)
+    return vocabulary
+
+
+def linear_scan(vocabulary: dict, symptoms: str) -> str:
+    """The pre-matcher find_best_specialty: substring test per keyword, first hit wins."""
+    symptoms_lower = symptoms.lower()
+    for specialty, terms in vocabulary.items():
+        for keyword in terms:
+            if keyword in symptoms_lower:
+                return specialty
+    return "General Medicine"
+
+
+def time_per_call(fn, iterations: int) -> float:
+    """Average microseconds per call of fn over all sample symptoms."""
+    started = time.perf_counter()
+    for _ in range(iterations):
+        for symptoms in SAMPLE_SYMPTOMS:
+            fn(symptoms)
+    return (time.perf_counter() - started) / (iterations * len(SAMPLE_SYMPTOMS)) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000, 100000])
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    print(f"{'vocabulary':>10} {'build ms':>10} {'matcher us':>11} {'linear us':>10}")
+    for size in args.sizes:
+        vocabulary = synthetic_vocabulary(size, rng)
+        started = time.perf_counter()
+        matcher = SpecialtyMatcher(vocabulary)
+        build_ms = (time.perf_counter() - started) * 1000
+        matcher_us = time_per_call(matcher.rank, args.iterations)
+        linear_us = time_per_call(lambda symptoms: linear_scan(vocabulary, symptoms), max(1, args.iterations // 10))
+        print(f"{matcher.vocabulary_size:>10} {build_ms:>10.1f} {matcher_us:>11.1f} {linear_us:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
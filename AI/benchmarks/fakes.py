@@ -0,0 +1,453 @@
+"""Local stand-ins for the external services, used by the benchmark scripts.
+
+FakeGenerativeModel replaces google.generativeai.GenerativeModel: it answers
+with canned, schema-valid JSON for the task its system instruction belongs
+to (translations tag each string with the target language) and records
+every prompt it receives. FakeCollection is an in-memory stand-in for the
+doctors and users collections that understands the aggregation stages the
+service uses. make_pdf builds small text PDFs for /analyze without any PDF
+tooling.
+"""
+import asyncio
+import copy
+import json
+import math
+import random
+import threading
+import time
+
+from bson import ObjectId
+
+PRECAUTIONS_RESPONSE = {
+    "initial_assessment": {"severity": "mild", "immediate_action_required": False, "seek_emergency": False},
+    "precautions": [{"category": "Rest", "measures": ["Get plenty of sleep", "Stay hydrated"], "priority": "high"}],
+    "lifestyle_recommendations": [{"area": "Diet", "suggestions": ["Eat light meals"], "duration": "temporary"}],
+    "home_remedies": [{"remedy": "Warm fluids", "instructions": "Drink warm water with honey", "caution": "None"}],
+    "when_to_seek_emergency": ["Difficulty breathing", "Persistent high fever"]
+}
+
+ANALYSIS_RESPONSE = {
+    "summary": {
+        "overview": "Findings consistent with a mild respiratory infection",
+        "severity_assessment": "mild",
+        "key_findings": ["Elevated temperature", "Dry cough"],
+        "urgent_attention": "no",
+        "follow_up_timeline": "routine"
+    },
+    "symptoms": [{"symptom": "Cough", "severity": "mild", "duration": "3 days", "related_conditions": ["Bronchitis"]}],
+    "possible_diseases": [{"disease": "Common cold", "confidence": "medium", "reasoning": "Symptom pattern",
+                           "common_complications": []}],
+    "recommended_doctor": {
+        "primary": {"specialist": "General Medicine", "specialty_area": "Primary care", "urgency": "routine"},
+        "secondary": None,
+        "reasoning": "Mild symptoms"
+    },
+    "precautions": [{"precaution": "Rest", "importance": "recommended", "duration": "1 week", "details": "Avoid exertion"}],
+    "additional_tests": [{"test": "Complete blood count", "purpose": "Rule out infection", "urgency": "routine"}],
+    "lifestyle_recommendations": [{"category": "sleep", "recommendation": "Sleep 8 hours", "importance": "high"}]
+}
+
+
+class FakeResponse:
+    def __init__(self, text: str):
+        self.text = text
+        self.parts = [text]
+
+
+def translate(prompt: str) -> dict:
+    """Answer a translation prompt by tagging every string with the target language."""
+    header, _, strings = prompt.partition("Strings:")
+    target = header.split("Target language:")[-1].strip()
+    return {key: f"[{target}] {text}" for key, text in json.loads(strings).items()}
+
+
+class FakeGenerativeModel:
+    """Drop-in for genai.GenerativeModel with configurable latency.
+
+    Each call sleeps latency seconds plus up to jitter seconds, then returns
+    the canned response matching the system instruction. Prompts are kept in
+    the class-level prompts list as (system_instruction, prompt) pairs.
+    """
+
+    latency = 0.0
+    jitter = 0.0
+    prompts = []
+    _lock = threading.Lock()
+
+    def __init__(self, model_name, generation_config=None, system_instruction=None, **kwargs):
+        self.model_name = model_name
+        self.generation_config = generation_config
+        self.system_instruction = system_instruction
+
+    @classmethod
+    def reset(cls, latency: float = 0.0, jitter: float = 0.0):
+        cls.latency = latency
+        cls.jitter = jitter
+        with cls._lock:
+            cls.prompts = []
+
+    def _respond(self, prompt) -> str:
+        with self._lock:
+            self.prompts.append((self.system_instruction, prompt))
+        if self.system_instruction and '"initial_assessment"' in self.system_instruction:
+            return json.dumps(PRECAUTIONS_RESPONSE)
+        if self.system_instruction and self.system_instruction.startswith("Translate"):
+            return json.dumps(translate(prompt), ensure_ascii=False)
+        return json.dumps(ANALYSIS_RESPONSE)
+
+    def _delay(self) -> float:
+        return self.latency + random.uniform(0, self.jitter)
+
+    def generate_content(self, prompt, stream: bool = False, **kwargs):
+        time.sleep(self._delay())
+        text = self._respond(prompt)
+        if stream:
+            step = max(1, len(text) // 8)
+            return [FakeResponse(text[i:i + step]) for i in range(0, len(text), step)]
+        return FakeResponse(text)
+
+    async def generate_content_async(self, prompt, **kwargs):
+        await asyncio.sleep(self._delay())
+        return FakeResponse(self._respond(prompt))
+
+
+def install(app_module, latency: float = 0.0, jitter: float = 0.0):
+    """Point an imported app module at FakeGenerativeModel and rebuild its MedicalSystem.
+
+    Waits for the app's own Gemini initialization first: with lazy init it
+    runs in a background thread that would otherwise reset the model name
+    after it fails, leaving a MedicalSystem that serves only fallbacks.
+    """
+    app_module._init_done["gemini"].wait()
+    for thread in threading.enumerate():
+        if thread.name == "gemini-init":
+            thread.join()
+    FakeGenerativeModel.reset(latency, jitter)
+    app_module.genai.GenerativeModel = FakeGenerativeModel
+    app_module.gemini_model_name = "models/stand-in"
+    app_module._init_done["gemini"].set()
+    app_module._medical_system = None
+    return FakeGenerativeModel
+
+
+def _get_path(document, path: str):
+    for part in path.split("."):
+        if not isinstance(document, dict) or part not in document:
+            return None
+        document = document[part]
+    return document
+
+
+def _fold(value):
+    return value.casefold() if isinstance(value, str) else value
+
+
+def _prepare(query: dict) -> dict:
+    """Turn $in/$nin lists into sets once per stage, so large id lists match in constant time."""
+    prepared = {}
+    for path, condition in query.items():
+        if path == "$or":
+            prepared[path] = [_prepare(branch) for branch in condition]
+        elif isinstance(condition, dict):
+            prepared[path] = dict(condition)
+            for operator in ("$in", "$nin"):
+                if operator in condition:
+                    try:
+                        prepared[path][operator] = set(condition[operator])
+                    except TypeError:
+                        pass
+        else:
+            prepared[path] = condition
+    return prepared
+
+
+def _matches(document, query: dict, fold_case: bool = False) -> bool:
+    """Equality, $in/$nin, $ne, $gt/$gte/$lt/$lte and top-level $or matching on (dotted) fields.
+
+    fold_case compares strings case-insensitively, like a strength 2 collation.
+    """
+    for path, condition in query.items():
+        if path == "$or":
+            if not any(_matches(document, branch, fold_case) for branch in condition):
+                return False
+            continue
+        value = _get_path(document, path)
+        if fold_case:
+            value = _fold(value)
+            if isinstance(condition, dict):
+                condition = {key: _fold(operand) for key, operand in condition.items()}
+            else:
+                condition = _fold(condition)
+        if isinstance(condition, dict) and any(key.startswith("$") for key in condition):
+            for operator, operand in condition.items():
+                if operator == "$in" and value not in operand:
+                    return False
+                if operator == "$nin" and value in operand:
+                    return False
+                if operator == "$ne" and value == operand:
+                    return False
+                if operator == "$gt" and (value is None or not value > operand):
+                    return False
+                if operator == "$gte" and (value is None or value < operand):
+                    return False
+                if operator == "$lt" and (value is None or not value < operand):
+                    return False
+                if operator == "$lte" and (value is None or value > operand):
+                    return False
+        elif value != condition:
+            return False
+    return True
+
+
+def _evaluate(document, expression):
+    """Aggregation expressions: field paths, $floor and $divide."""
+    if isinstance(expression, str) and expression.startswith("$"):
+        return _get_path(document, expression[1:])
+    if isinstance(expression, dict):
+        (operator, operand), = expression.items()
+        if operator == "$floor":
+            return math.floor(_evaluate(document, operand))
+        if operator == "$divide":
+            return _evaluate(document, operand[0]) / _evaluate(document, operand[1])
+        raise NotImplementedError(f"FakeCollection does not support {operator}")
+    return expression
+
+
+def _distance_meters(a, b) -> float:
+    """Great-circle distance between two [longitude, latitude] points."""
+    lng1, lat1, lng2, lat2 = map(math.radians, (*a, *b))
+    h = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+    return 2 * 6378100 * math.asin(math.sqrt(h))
+
+
+def _project(document, fields: dict) -> dict:
+    """Inclusion projection on (dotted) fields; _id is kept unless excluded."""
+    projected = {}
+    if fields.get("_id", 1) and "_id" in document:
+        projected["_id"] = document["_id"]
+    for path, include in fields.items():
+        if path == "_id" or not include:
+            continue
+        value = _get_path(document, path)
+        if value is None:
+            continue
+        target = projected
+        parts = path.split(".")
+        for part in parts[:-1]:
+            target = target.setdefault(part, {})
+        target[parts[-1]] = value
+    return projected
+
+
+class FakeCollection:
+    """In-memory collection supporting the query and aggregation stages the service uses.
+
+    Every call sleeps latency seconds to stand in for the network round trip.
+    Supported stages: $geoNear (first stage only), $match, $sort, $skip,
+    $limit, $lookup (localField and foreignField), $unwind, $addFields and
+    inclusion $project. There are no indexes: examined counts every document
+    a query had to look at, which is what an unindexed MongoDB would scan.
+    """
+
+    def __init__(self, database, name: str, latency: float = 0.0):
+        self.database = database
+        self.name = name
+        self.latency = latency
+        self.documents = []
+        self.round_trips = 0
+        self.examined = 0
+        self._lookup_keys = {}
+
+    def _round_trip(self):
+        self.round_trips += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def insert_many(self, documents):
+        for document in documents:
+            document.setdefault("_id", ObjectId())
+            self.documents.append(document)
+        self._lookup_keys.clear()
+
+    def lookup_key(self, field: str) -> dict:
+        """Documents grouped by a field, built once and reused by $lookup like an index."""
+        if field not in self._lookup_keys:
+            grouped = {}
+            for document in self.documents:
+                grouped.setdefault(_get_path(document, field), []).append(document)
+            self._lookup_keys[field] = grouped
+        return self._lookup_keys[field]
+
+    def find_one(self, query=None, projection=None):
+        self._round_trip()
+        for document in self.documents:
+            if _matches(document, query or {}):
+                return copy.deepcopy(_project(document, projection) if projection else document)
+        return None
+
+    def find(self, query=None, projection=None):
+        self._round_trip()
+        self.examined += len(self.documents)
+        return [copy.deepcopy(_project(document, projection) if projection else document)
+                for document in self.documents if _matches(document, query or {})]
+
+    def index_information(self) -> dict:
+        return {"_id_": {"key": [("_id", 1)]}}
+
+    def create_index(self, keys, **kwargs):
+        return "_".join(f"{field}_{direction}" for field, direction in keys)
+
+    def aggregate(self, pipeline, collation=None):
+        self._round_trip()
+        fold_case = bool(collation) and collation.get("strength", 3) <= 2
+        pipeline = list(pipeline)
+        (operator, spec), = pipeline[0].items()
+        self.examined += len(self.documents)
+        # Stages only ever replace top-level fields, so shallow copies keep the stored documents intact
+        if operator == "$geoNear":
+            documents = []
+            for document in self.documents:
+                if not _matches(document, spec.get("query", {}), fold_case):
+                    continue
+                point = _get_path(document, "geoLocation.coordinates")
+                if point is None:
+                    continue
+                distance = _distance_meters(spec["near"]["coordinates"], point)
+                if spec.get("minDistance", 0) <= distance <= spec.get("maxDistance", math.inf):
+                    documents.append({**document, spec["distanceField"]: distance})
+            documents.sort(key=lambda document: document[spec["distanceField"]])
+            pipeline = pipeline[1:]
+        elif operator == "$match":
+            spec = _prepare(spec)
+            documents = [dict(document) for document in self.documents if _matches(document, spec, fold_case)]
+            pipeline = pipeline[1:]
+        else:
+            documents = [dict(document) for document in self.documents]
+        for stage in pipeline:
+            (operator, spec), = stage.items()
+            if operator == "$match":
+                spec = _prepare(spec)
+                documents = [document for document in documents if _matches(document, spec, fold_case)]
+            elif operator == "$sort":
+                for field, direction in reversed(list(spec.items())):
+                    documents.sort(key=lambda document: (_get_path(document, field) is None, _get_path(document, field)),
+                                   reverse=direction < 0)
+            elif operator == "$skip":
+                documents = documents[spec:]
+            elif operator == "$limit":
+                documents = documents[:spec]
+            elif operator == "$lookup":
+                foreign = self.database[spec["from"]]
+                by_key = foreign.lookup_key(spec["foreignField"])
+                for document in documents:
+                    matched = by_key.get(_get_path(document, spec["localField"]), [])
+                    # An indexed join looks at the matching documents only
+                    foreign.examined += len(matched)
+                    document[spec["as"]] = [dict(other) for other in matched]
+            elif operator == "$addFields":
+                for document in documents:
+                    for field, expression in spec.items():
+                        document[field] = _evaluate(document, expression)
+            elif operator == "$unwind":
+                field = spec.lstrip("$") if isinstance(spec, str) else spec["path"].lstrip("$")
+                documents = [{**document, field: item} for document in documents for item in document.get(field) or []]
+            elif operator == "$project":
+                documents = [_project(document, spec) for document in documents]
+            else:
+                raise NotImplementedError(f"FakeCollection does not support {operator}")
+        return iter([copy.deepcopy(document) for document in documents])
+
+
+class FakeDatabase:
+    """Dictionary of FakeCollections sharing one simulated round-trip latency."""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.collections = {}
+
+    def __getitem__(self, name: str) -> FakeCollection:
+        if name not in self.collections:
+            self.collections[name] = FakeCollection(self, name, self.latency)
+        return self.collections[name]
+
+    def round_trips(self) -> int:
+        return sum(collection.round_trips for collection in self.collections.values())
+
+
+# City centres as [longitude, latitude]
+CITIES = {
+    "Mumbai": [72.8777, 19.0760], "Delhi": [77.1025, 28.7041], "Bengaluru": [77.5946, 12.9716],
+    "Chennai": [80.2707, 13.0827], "Pune": [73.8567, 18.5204], "Kolkata": [88.3639, 22.5726],
+    "Hyderabad": [78.4867, 17.3850], "Jaipur": [75.7873, 26.9124],
+}
+FIRST_NAMES = ["Asha", "Ravi", "Meera", "Arjun", "Priya", "Vikram", "Nisha", "Karan", "Leela", "Sanjay"]
+LAST_NAMES = ["Sharma", "Iyer", "Patel", "Reddy", "Das", "Menon", "Gupta", "Khan", "Nair", "Joshi"]
+
+
+def seed_directory(database: FakeDatabase, specialties, doctors_per_specialty: int = 20, seed: int = 7):
+    """Fill the users and doctors collections with a reproducible doctor directory."""
+    rng = random.Random(seed)
+    users, doctors = [], []
+    for specialty in specialties:
+        for _ in range(doctors_per_specialty):
+            user_id = ObjectId()
+            city = rng.choice(sorted(CITIES))
+            # Spread doctors up to about 15 km around the city centre
+            longitude, latitude = CITIES[city]
+            users.append({
+                "_id": user_id,
+                "firstName": rng.choice(FIRST_NAMES),
+                "lastName": rng.choice(LAST_NAMES),
+                "email": f"{user_id}@example.com",
+                "role": "doctor",
+                "address": {"city": city},
+                "geoLocation": {
+                    "type": "Point",
+                    "coordinates": [longitude + rng.uniform(-0.14, 0.14), latitude + rng.uniform(-0.14, 0.14)]
+                }
+            })
+            doctors.append({
+                "userId": user_id,
+                "specialization": specialty,
+                "degree": rng.choice(["MBBS", "MD", "MS", "DNB"]),
+                "experience": rng.randint(1, 35),
+                "isAvailable": rng.random() < 0.8
+            })
+    database["users"].insert_many(users)
+    database["doctors"].insert_many(doctors)
+    return database
+
+
+def install_store(app_module, database: FakeDatabase):
+    """Bind an imported app module's collections to a FakeDatabase."""
+    app_module._init_done["mongo"].wait()
+    app_module.db = database
+    app_module.doctors_collection = database["doctors"]
+    app_module.users_collection = database["users"]
+    app_module._init_done["mongo"].set()
+    return database
+
+
+def make_pdf(pages) -> bytes:
+    """Build a minimal PDF with one Helvetica text page per string in pages."""
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>", None, "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for text in pages:
+        lines = [line.replace("\\", "").replace("(", "[").replace(")", "]") for line in text.split("\n")]
+        content = "BT /F1 11 Tf 50 780 Td 14 TL " + " ".join(f"({line}) '" for line in lines) + " ET"
+        objects.append(f"<< /Length {len(content)} >>\nstream\n{content}\nendstream")
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+                       f"/Resources << /Font << /F1 3 0 R >> >> /Contents {len(objects)} 0 R >>")
+        kids.append(len(objects))
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(f'{kid} 0 R' for kid in kids)}] /Count {len(kids)} >>"
+
+    out = b"%PDF-1.4\n"
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += f"{number} 0 obj\n{body}\nendobj\n".encode("latin-1")
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    out += b"".join(f"{offset:010d} 00000 n \n".encode() for offset in offsets)
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    return out
@@ -0,0 +1,241 @@
+"""Offline load test for /recommend and /analyze.
+
+Serves the Flask app on a local port with every external dependency
+replaced by a stand-in from fakes.py: Gemini by FakeGenerativeModel (with
+configurable latency and jitter) and MongoDB by an in-memory doctor
+directory. /analyze uploads the report corpus in data/reports (see
+make_corpus.py). Each endpoint is driven at fixed concurrency levels and
+the run reports p50/p95/p99 latency, requests per second and peak memory.
+A 200 whose body is a fallback (it carries an "error" key) counts as an
+error, since it never reached the model.
+
+Admission control is off by default, since every request comes from one
+address and the per-client rate limit would turn the run into a 429 test;
+--admission keeps it on, with each simulated user sending its own
+X-Client-Id, trusted as if the loopback address were a proxy.
+
+--save writes the results as JSON. --baseline compares a run against a
+saved one and exits non-zero when p95 latency or throughput regress by more
+than --max-regression, so the run can gate a change.
+
+Usage:
+    python benchmarks/load_test.py [--endpoints recommend analyze] [--concurrency 1 8 32]
+        [--requests N] [--latency S] [--jitter S] [--mongo-latency S] [--cold] [--admission]
+        [--save FILE] [--baseline FILE] [--max-regression R]
+"""
+import argparse
+import glob
+import http.client
+import json
+import logging
+import os
+import resource
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+os.environ.setdefault("AI_LAZY_INIT", "true")
+
+from werkzeug.serving import make_server  # noqa: E402
+
+import app  # noqa: E402
+from fakes import FakeDatabase, install, install_store, seed_directory  # noqa: E402
+
+CORPUS_DIR = os.path.join(BENCH_DIR, "data", "reports")
+SAMPLE_SYMPTOMS = [
+    "fever and dry cough for three days",
+    "sharp chest pain when climbing stairs",
+    "itchy rash on both arms after gardening",
+    "my child has a high temperature and will not eat",
+    "severe headache with numbness in the left arm",
+    "knee pain and swelling after running",
+    "feeling anxious and cannot sleep at night",
+    "sore throat and a mild cold",
+]
+
+
+def multipart_body(filename: str, content: bytes, fields: dict) -> tuple:
+    """Encode a single-file multipart/form-data body."""
+    boundary = uuid.uuid4().hex
+    parts = []
+    for name, value in fields.items():
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode())
+    parts.append(
+        f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="{filename}"\r\n'
+        f'Content-Type: application/pdf\r\n\r\n'.encode() + content + b"\r\n"
+    )
+    parts.append(f"--{boundary}--\r\n".encode())
+    return b"".join(parts), f"multipart/form-data; boundary={boundary}"
+
+
+class RequestFactory:
+    """Builds the n-th request body for an endpoint, cycling through the samples."""
+
+    def __init__(self):
+        self.reports = []
+        for path in sorted(glob.glob(os.path.join(CORPUS_DIR, "*.pdf"))):
+            with open(path, "rb") as f:
+                self.reports.append((os.path.basename(path), f.read()))
+        if not self.reports:
+            raise SystemExit(f"No reports in {CORPUS_DIR}; run benchmarks/make_corpus.py first")
+
+    def build(self, endpoint: str, n: int) -> tuple:
+        if endpoint == "recommend":
+            body = json.dumps({"symptoms": SAMPLE_SYMPTOMS[n % len(SAMPLE_SYMPTOMS)], "language": "en-US"})
+            return "/recommend", body.encode(), "application/json"
+        filename, content = self.reports[n % len(self.reports)]
+        body, content_type = multipart_body(filename, content, {"language": "en-US"})
+        return "/analyze", body, content_type
+
+
+def is_fallback(body: bytes) -> bool:
+    """True for a 200 answered with a fallback payload, which carries an "error" key."""
+    try:
+        payload = json.loads(body)
+    except ValueError:
+        return True
+    if not isinstance(payload, dict):
+        return False
+    return "error" in payload or "error" in (payload.get("precautions_and_recommendations") or {})
+
+
+def clear_caches():
+    for cache in (app.analysis_cache, app.chunk_analysis_cache, app.precautions_cache, app.doctor_directory_cache):
+        cache.clear()
+
+
+def percentile(sorted_values: list, fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def run_level(port: int, factory: RequestFactory, endpoint: str, concurrency: int, requests: int,
+              cold: bool) -> dict:
+    """Send requests at a fixed concurrency and summarize latency and throughput."""
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+
+    def send(n: int):
+        if cold:
+            clear_caches()
+        path, body, content_type = factory.build(endpoint, n)
+        connection = http.client.HTTPConnection("127.0.0.1", port, timeout=120)
+        started = time.perf_counter()
+        try:
+            connection.request("POST", path, body=body,
+                               headers={"Content-Type": content_type, "X-Client-Id": f"load-test-{n}"})
+            response = connection.getresponse()
+            body = response.read()
+            elapsed = time.perf_counter() - started
+            with lock:
+                if response.status != 200:
+                    errors.append(response.status)
+                elif is_fallback(body):
+                    errors.append("fallback")
+                else:
+                    latencies.append(elapsed)
+        except Exception as e:
+            with lock:
+                errors.append(type(e).__name__)
+        finally:
+            connection.close()
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(send, range(requests)))
+    wall = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "endpoint": endpoint,
+        "concurrency": concurrency,
+        "requests": requests,
+        "ok": len(latencies),
+        "errors": len(errors),
+        "rps": round(len(latencies) / wall, 2) if wall else 0.0,
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 1),
+        # ru_maxrss is in kilobytes on Linux and never decreases, so this is the peak so far
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    }
+
+
+def compare(results: list, baseline_path: str, max_regression: float) -> bool:
+    """Print regressions against a saved run; return True when all levels are within bounds."""
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = {(r["endpoint"], r["concurrency"]): r for r in json.load(f)["results"]}
+    passed = True
+    for result in results:
+        before = baseline.get((result["endpoint"], result["concurrency"]))
+        if before is None:
+            continue
+        p95_change = result["p95_ms"] / before["p95_ms"] - 1 if before["p95_ms"] else 0.0
+        rps_change = result["rps"] / before["rps"] - 1 if before["rps"] else 0.0
+        regressed = p95_change > max_regression or rps_change < -max_regression
+        passed = passed and not regressed
+        print(f"{result['endpoint']:<10} c={result['concurrency']:<4} p95 {p95_change:+.1%}  rps {rps_change:+.1%}"
+              f"{'  REGRESSION' if regressed else ''}")
+    return passed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--endpoints", nargs="+", default=["recommend", "analyze"], choices=["recommend", "analyze"])
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--requests", type=int, default=200, help="requests per concurrency level")
+    parser.add_argument("--latency", type=float, default=0.8, help="stand-in model latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.4, help="extra random model latency, up to this many seconds")
+    parser.add_argument("--mongo-latency", type=float, default=0.02, help="simulated database round trip in seconds")
+    parser.add_argument("--doctors-per-specialty", type=int, default=50)
+    parser.add_argument("--cold", action="store_true", help="clear the result caches before every request")
+    parser.add_argument("--admission", action="store_true", help="keep admission control and rate limiting on")
+    parser.add_argument("--save", help="write results as JSON to this path")
+    parser.add_argument("--baseline", help="compare against results saved with --save")
+    parser.add_argument("--max-regression", type=float, default=0.2)
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.ERROR)
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+
+    install(app, latency=args.latency, jitter=args.jitter)
+    app.admission.enabled = args.admission
+    # The simulated users reach the server from the loopback address, standing in for a proxy
+    app.TRUSTED_PROXIES = frozenset({"127.0.0.1"})
+    database = seed_directory(FakeDatabase(args.mongo_latency), app.MedicalSystem.SPECIALIZATIONS,
+                              args.doctors_per_specialty)
+    install_store(app, database)
+    factory = RequestFactory()
+
+    server = make_server("127.0.0.1", 0, app.app, threaded=True)
+    threading.Thread(target=server.serve_forever, name="load-test-server", daemon=True).start()
+
+    results = []
+    try:
+        print(f"{'endpoint':<10} {'conc':>4} {'ok':>5} {'err':>4} {'rps':>8} {'p50 ms':>8} {'p95 ms':>8} "
+              f"{'p99 ms':>8} {'peak MB':>8}")
+        for endpoint in args.endpoints:
+            for concurrency in args.concurrency:
+                clear_caches()
+                result = run_level(server.server_port, factory, endpoint, concurrency, args.requests, args.cold)
+                results.append(result)
+                print(f"{endpoint:<10} {concurrency:>4} {result['ok']:>5} {result['errors']:>4} {result['rps']:>8} "
+                      f"{result['p50_ms']:>8} {result['p95_ms']:>8} {result['p99_ms']:>8} {result['peak_rss_mb']:>8}")
+    finally:
+        server.shutdown()
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=2)
+    if args.baseline and not compare(results, args.baseline, args.max_regression):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
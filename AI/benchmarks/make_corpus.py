@@ -0,0 +1,70 @@
+"""Generate the sample report corpus used by load_test.py.
+
+Writes data/reports/report_NN.pdf: synthetic lab and discharge reports of
+1 to 24 pages built from a fixed seed, so every run (and every checkout)
+benchmarks the same documents. Re-run after changing the templates below.
+
+Usage:
+    python benchmarks/make_corpus.py [--out DIR] [--seed N]
+"""
+import argparse
+import os
+import random
+
+from fakes import make_pdf
+
+DEFAULT_OUT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "reports")
+PAGE_COUNTS = [1, 1, 2, 2, 3, 4, 6, 8, 12, 24]
+
+COMPLAINTS = [
+    "persistent dry cough and low grade fever", "intermittent chest pain on exertion", "itchy rash on forearms",
+    "recurrent headaches with blurred vision", "lower back pain radiating to the left leg",
+    "fatigue and unexplained weight loss", "shortness of breath when lying flat", "joint swelling in both knees",
+    "difficulty sleeping and low mood", "abdominal pain after meals",
+]
+LAB_TESTS = [
+    ("Hemoglobin", "g/dL", 9.5, 16.5), ("WBC count", "x10^9/L", 3.0, 14.0), ("Platelets", "x10^9/L", 120, 420),
+    ("Fasting glucose", "mg/dL", 70, 180), ("HbA1c", "%", 4.8, 9.5), ("Creatinine", "mg/dL", 0.6, 1.9),
+    ("Total cholesterol", "mg/dL", 140, 290), ("TSH", "mIU/L", 0.3, 7.5), ("CRP", "mg/L", 0.5, 45.0),
+    ("Vitamin D", "ng/mL", 8, 60),
+]
+
+
+def report_page(rng: random.Random, patient: int, page: int, pages: int) -> str:
+    """One page of a synthetic report: history on page 1, labs and notes afterwards."""
+    lines = [f"City Hospital - Patient {patient:04d} - Page {page + 1} of {pages}"]
+    if page == 0:
+        lines += [
+            f"Age: {rng.randint(4, 88)}  Sex: {rng.choice(['F', 'M'])}",
+            f"Chief complaint: {rng.choice(COMPLAINTS)} for {rng.randint(2, 40)} days.",
+            f"Vitals: BP {rng.randint(100, 170)}/{rng.randint(60, 105)} mmHg, HR {rng.randint(55, 120)} bpm, "
+            f"Temp {rng.uniform(36.2, 39.4):.1f} C, SpO2 {rng.randint(89, 100)}%.",
+        ]
+    for test, unit, low, high in rng.sample(LAB_TESTS, 6):
+        lines.append(f"{test}: {rng.uniform(low, high):.1f} {unit}")
+    lines += [
+        f"Progress note: patient reports {rng.choice(COMPLAINTS)}; "
+        f"{rng.choice(['improving', 'unchanged', 'worsening'])} since last review.",
+        f"Plan: {rng.choice(['repeat labs in one week', 'start oral medication', 'refer to specialist', 'imaging ordered'])}.",
+    ]
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--out", default=DEFAULT_OUT)
+    parser.add_argument("--seed", type=int, default=11)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    os.makedirs(args.out, exist_ok=True)
+    for number, pages in enumerate(PAGE_COUNTS, 1):
+        pdf = make_pdf([report_page(rng, number, page, pages) for page in range(pages)])
+        path = os.path.join(args.out, f"report_{number:02d}.pdf")
+        with open(path, "wb") as f:
+            f.write(pdf)
+        print(f"{path}: {pages} pages, {len(pdf)} bytes")
+
+
+if __name__ == "__main__":
+    main()
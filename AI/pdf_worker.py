@@ -0,0 +1,22 @@
+"""PDF page extraction run inside the extraction process pool.
+
+Kept separate from app.py so pool workers need only PyPDF2. When app.py is
+the main script, spawn still re-imports it in each pool process (as
+__mp_main__); app.py skips its runtime initialization there, so pool
+processes never connect to MongoDB or Gemini or start job workers.
+"""
+import io
+from typing import List
+
+import PyPDF2
+
+
+def extract_page_range(pdf_bytes: bytes, start: int, stop: int) -> List[str]:
+    """Extract text from pages [start, stop) of an in-memory PDF."""
+    reader = PyPDF2.PdfReader(io.BytesIO(pdf_bytes))
+    pages = []
+    for index in range(start, stop):
+        page_text = reader.pages[index].extract_text()
+        if page_text:
+            pages.append(page_text)
+    return pages
@@ -0,0 +1,30 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+AI_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, AI_DIR)
+sys.path.insert(0, os.path.join(AI_DIR, "benchmarks"))
+
+# The app starts its services on import: keep them off the network and out of the working tree
+os.environ.setdefault("AI_LAZY_INIT", "true")
+os.environ.setdefault("MONGO_URI", "invalid://tests")
+os.environ.setdefault("ANALYSIS_JOB_DB_PATH", os.path.join(tempfile.mkdtemp(), "jobs.sqlite3"))
+os.environ.setdefault("ANALYSIS_CACHE_PATH", "")
+
+
+@pytest.fixture
+def fake_model():
+    """FakeGenerativeModel installed in place of Gemini, with its prompt log cleared."""
+    import app
+    from fakes import install
+    return install(app)
+
+
+@pytest.fixture
+def medical_system(fake_model):
+    """A MedicalSystem whose model pools hand out FakeGenerativeModel handles."""
+    import app
+    return app.MedicalSystem(pool_size=2)
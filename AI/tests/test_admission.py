@@ -0,0 +1,139 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+import app
+from app import AdmissionController
+
+URGENT, INTERACTIVE, BULK = AdmissionController.URGENT, AdmissionController.INTERACTIVE, AdmissionController.BULK
+
+
+def controller(**options) -> AdmissionController:
+    settings = {"slots": 1, "queue_size": 1, "max_wait": 5.0, "rate": 1000.0, "burst": 1000.0, "enabled": True}
+    return AdmissionController(**{**settings, **options})
+
+
+def admit_in_background(admission: AdmissionController, client: str, priority: int) -> tuple:
+    """Start admit() in a thread and wait until the request is queued; return (thread, outcomes)."""
+    outcomes = []
+    thread = threading.Thread(target=lambda: outcomes.append(admission.admit(client, priority)))
+    name = AdmissionController.PRIORITY_NAMES[priority]
+    queued = admission.stats()["queued"][name]
+    thread.start()
+    deadline = time.monotonic() + 5
+    while admission.stats()["queued"][name] == queued:
+        assert time.monotonic() < deadline, "request never queued"
+        time.sleep(0.005)
+    return thread, outcomes
+
+
+def test_admits_up_to_the_slots_then_queues_and_hands_over_on_release():
+    admission = controller(slots=2)
+    assert admission.admit("a", INTERACTIVE) == ("admitted", 0)
+    assert admission.admit("b", INTERACTIVE) == ("admitted", 0)
+
+    thread, outcomes = admit_in_background(admission, "c", INTERACTIVE)
+    admission.release(time.perf_counter())
+    thread.join(5)
+
+    assert outcomes == [("admitted", 0)]
+    assert admission.stats()["active"] == 2
+
+
+def test_full_queue_rejects_a_request_no_more_urgent_than_its_waiters():
+    admission = controller()
+    admission.admit("a", INTERACTIVE)
+    thread, outcomes = admit_in_background(admission, "b", INTERACTIVE)
+
+    outcome, retry_after = admission.admit("c", BULK)
+    assert outcome == "queue_full" and retry_after >= 1
+    assert admission.admit("d", INTERACTIVE)[0] == "queue_full"
+
+    admission.release(time.perf_counter())
+    thread.join(5)
+    assert outcomes == [("admitted", 0)]
+    assert admission.stats()["queue_full"] == 2
+
+
+def test_full_queue_evicts_the_newest_least_urgent_waiter_for_an_urgent_request():
+    admission = controller(queue_size=2)
+    admission.admit("a", INTERACTIVE)
+    older, older_outcomes = admit_in_background(admission, "b", BULK)
+    newer, newer_outcomes = admit_in_background(admission, "c", BULK)
+
+    urgent, urgent_outcomes = admit_in_background(admission, "d", URGENT)
+    newer.join(5)
+    assert newer_outcomes[0][0] == "evicted" and newer_outcomes[0][1] >= 1
+    assert admission.stats()["queued"] == {"urgent": 1, "interactive": 0, "bulk": 1}
+
+    # The urgent request is served first, then the surviving bulk request
+    admission.release(time.perf_counter())
+    urgent.join(5)
+    assert urgent_outcomes == [("admitted", 0)] and not older_outcomes
+    admission.release(time.perf_counter())
+    older.join(5)
+    assert older_outcomes == [("admitted", 0)]
+    assert admission.stats()["evicted"] == 1
+
+
+def test_timed_out_waiter_leaves_the_queue_and_the_slot_is_freed_on_release():
+    admission = controller(max_wait=0.05)
+    admission.admit("a", INTERACTIVE)
+
+    outcome, retry_after = admission.admit("b", INTERACTIVE)
+    assert outcome == "timeout" and retry_after >= 1
+    assert sum(admission.stats()["queued"].values()) == 0
+
+    admission.release(time.perf_counter())
+    assert admission.stats()["active"] == 0
+    assert admission.admit("c", INTERACTIVE) == ("admitted", 0)
+
+
+def test_cancelled_waiter_gives_back_a_slot_granted_in_the_meantime():
+    admission = controller()
+
+    async def scenario():
+        assert await admission.admit_async("a", INTERACTIVE) == ("admitted", 0)
+        waiter = asyncio.create_task(admission.admit_async("b", INTERACTIVE))
+        while sum(admission.stats()["queued"].values()) == 0:
+            await asyncio.sleep(0)
+        # The waiter is cancelled, and the slot goes to it before it sees the cancellation
+        waiter.cancel()
+        admission.release(time.perf_counter())
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+
+    asyncio.run(scenario())
+    assert admission.stats()["active"] == 0
+    assert admission.admit("c", INTERACTIVE) == ("admitted", 0)
+
+
+def test_rate_limit_is_per_client_with_retry_after():
+    admission = controller(slots=4, rate=0.5, burst=1)
+    assert admission.admit("a", INTERACTIVE) == ("admitted", 0)
+    assert admission.admit("a", INTERACTIVE) == ("rate_limited", 2)
+    assert admission.admit("b", INTERACTIVE) == ("admitted", 0)
+
+
+def test_client_id_header_is_trusted_only_from_a_configured_proxy(monkeypatch):
+    monkeypatch.setattr(app, "TRUSTED_PROXIES", frozenset({"10.0.0.2"}))
+    assert app.client_identity("user-1", "10.0.0.2") == "user-1"
+    assert app.client_identity("user-1", "203.0.113.9") == "203.0.113.9"
+    assert app.client_identity(None, "10.0.0.2") == "10.0.0.2"
+    assert app.client_identity("user-1", None) == "unknown"
+    with app.app.test_request_context(headers={"X-Client-Id": "user-1"}, environ_base={"REMOTE_ADDR": "203.0.113.9"}):
+        assert app.request_client() == "203.0.113.9"
+    with app.app.test_request_context(headers={"X-Client-Id": "user-1"}, environ_base={"REMOTE_ADDR": "10.0.0.2"}):
+        assert app.request_client() == "user-1"
+
+
+def test_priority_ignores_client_claimed_emergencies_but_honours_recorded_ones():
+    client = f"priority-test-{time.monotonic_ns()}"
+    claimed = {"symptoms": "slight cough", "prior_assessment": {"seek_emergency": True}}
+    assert app.request_priority("/recommend", claimed, client) == app.ADMISSION_PRIORITIES["/recommend"]
+
+    app.note_assessment(client, {"initial_assessment": {"seek_emergency": True}})
+    assert app.request_priority("/recommend", {"symptoms": "slight cough"}, client) == URGENT
+    assert app.request_priority("/analyze", None, client) == URGENT
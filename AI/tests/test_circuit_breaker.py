@@ -0,0 +1,117 @@
+import time
+
+import pytest
+
+import app
+from app import CircuitBreaker
+
+COOLDOWN = 0.05
+
+
+def breaker() -> CircuitBreaker:
+    return CircuitBreaker("test", error_rate=0.5, min_calls=4, window=10, cooldown=COOLDOWN)
+
+
+def open_breaker() -> CircuitBreaker:
+    tripped = breaker()
+    for success in (True, False, True, False):
+        assert tripped.allow()
+        tripped.record(success)
+    return tripped
+
+
+def test_stays_closed_below_min_calls_and_error_rate():
+    closed = breaker()
+    for success in (False, False, False):
+        closed.record(success)
+    assert closed.stats()["state"] == "closed"
+
+    closed = breaker()
+    for success in (True, True, True, False, True, False):
+        closed.record(success)
+    assert closed.stats()["state"] == "closed"
+    assert closed.allow()
+
+
+def test_opens_at_the_error_rate_and_short_circuits():
+    tripped = open_breaker()
+    assert tripped.stats()["state"] == "open"
+    assert not tripped.allow()
+    assert not tripped.allow()
+    assert tripped.stats()["opened"] == 1
+    assert tripped.stats()["short_circuited"] == 2
+
+
+def test_half_open_lets_one_probe_through_and_closes_on_success():
+    tripped = open_breaker()
+    time.sleep(COOLDOWN * 1.5)
+
+    assert tripped.allow()
+    assert tripped.stats()["state"] == "half_open"
+    assert not tripped.allow()
+    tripped.record(True)
+
+    assert tripped.stats()["state"] == "closed"
+    assert tripped.stats()["recent_calls"] == 0
+    assert tripped.allow() and tripped.allow()
+
+
+def test_failed_probe_opens_again_for_another_cooldown():
+    tripped = open_breaker()
+    time.sleep(COOLDOWN * 1.5)
+
+    assert tripped.allow()
+    tripped.record(False)
+    assert tripped.stats()["state"] == "open"
+    assert tripped.stats()["opened"] == 2
+    assert not tripped.allow()
+
+
+def test_released_probe_lets_the_next_call_probe():
+    tripped = open_breaker()
+    time.sleep(COOLDOWN * 1.5)
+
+    assert tripped.allow()
+    tripped.release()
+    assert tripped.allow()
+    assert tripped.stats()["state"] == "half_open"
+
+
+def held_pool_system(monkeypatch, breaker_state: str):
+    """A MedicalSystem with one precautions handle, held by a hung call, and a breaker in the given state."""
+    system = app.MedicalSystem(pool_size=1)
+    checkout = system.model_pools["precautions"].model()
+    checkout.__enter__()
+    tripped = open_breaker() if breaker_state == "open" else breaker()
+    monkeypatch.setitem(app.model_breakers, "precautions", tripped)
+    monkeypatch.setattr(app, "GEMINI_POOL_TIMEOUT", 0.3)
+    monkeypatch.setattr(app, "GEMINI_HEDGE", False)
+    return system, tripped, checkout
+
+
+def test_open_breaker_fails_fast_while_the_pool_is_exhausted(fake_model, monkeypatch):
+    system, _, checkout = held_pool_system(monkeypatch, "open")
+    try:
+        started = time.monotonic()
+        with pytest.raises(app.CircuitOpenError):
+            system.generate("precautions", "Symptoms:\ncough")
+        assert time.monotonic() - started < 0.1
+        with pytest.raises(app.CircuitOpenError):
+            list(system.generate_stream("precautions", "Symptoms:\ncough"))
+    finally:
+        checkout.__exit__(None, None, None)
+
+
+def test_pool_timeout_is_not_retried_and_frees_the_probe_slot(fake_model, monkeypatch):
+    system, tripped, checkout = held_pool_system(monkeypatch, "open")
+    time.sleep(COOLDOWN * 1.5)
+    try:
+        started = time.monotonic()
+        with pytest.raises(app.PoolTimeoutError):
+            system.generate("precautions", "Symptoms:\ncough")
+        assert time.monotonic() - started < 2 * app.GEMINI_POOL_TIMEOUT
+        assert tripped.stats()["state"] == "half_open"
+    finally:
+        checkout.__exit__(None, None, None)
+    system.generate("precautions", "Symptoms:\ncough")
+    assert tripped.stats()["state"] == "closed"
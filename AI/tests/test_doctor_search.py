@@ -0,0 +1,121 @@
+import pytest
+
+import app
+from app import DoctorSearch
+from fakes import FakeDatabase, seed_directory
+
+SPECIALTY = "Cardiologist"
+
+
+@pytest.fixture(scope="module")
+def directory():
+    return seed_directory(FakeDatabase(), [SPECIALTY, "Dermatologist"], 60)
+
+
+@pytest.fixture(autouse=True)
+def empty_directory_cache():
+    app.doctor_directory_cache.clear()
+    yield
+    app.doctor_directory_cache.clear()
+
+
+def fetcher(database):
+    return lambda name, pipeline, collation: list(database[name].aggregate(pipeline, collation=collation))
+
+
+def all_pages(database, **search_args) -> list:
+    """Follow the cursor chain from the first page; return the pages."""
+    pages, cursor = [], None
+    while True:
+        doctors, cursor = DoctorSearch(SPECIALTY, cursor=cursor, **search_args).run(fetcher(database))
+        pages.append(doctors)
+        if cursor is None:
+            return pages
+        assert len(pages) < 100, "cursor chain does not end"
+
+
+def available(database, city=None) -> list:
+    users = {user["_id"]: user for user in database["users"].documents}
+    return [doctor for doctor in database["doctors"].documents
+            if doctor["specialization"] == SPECIALTY and doctor["isAvailable"]
+            and (city is None or users[doctor["userId"]]["address"]["city"] == city)]
+
+
+def test_cursor_round_trip():
+    search = DoctorSearch(SPECIALTY, city="Pune", page_size=3)
+    cursor = search._encode("elsewhere", [12, "0123456789abcdef01234567"])
+    resumed = DoctorSearch(SPECIALTY, city="Pune", page_size=3, cursor=cursor)
+    assert (resumed.segment, resumed.after) == ("elsewhere", [12, "0123456789abcdef01234567"])
+    assert resumed.cache_key() != search.cache_key()
+
+
+@pytest.mark.parametrize("cursor", ["not-a-cursor", "e30", DoctorSearch(SPECIALTY)._encode("all", [3, "not-an-id"])])
+def test_invalid_cursor(cursor):
+    with pytest.raises(ValueError, match="Invalid cursor"):
+        DoctorSearch(SPECIALTY, cursor=cursor)
+
+
+def test_cursor_from_a_different_search():
+    cursor = DoctorSearch(SPECIALTY, city="Pune")._encode("city", None)
+    with pytest.raises(ValueError, match="different search"):
+        DoctorSearch(SPECIALTY, city="Delhi", cursor=cursor)
+    with pytest.raises(ValueError, match="different search"):
+        DoctorSearch("Dermatologist", city="Pune", cursor=cursor)
+    # The city is matched case-insensitively, so its cursors are too
+    assert DoctorSearch(SPECIALTY, city="PUNE", cursor=cursor).segment == "city"
+
+
+def test_pages_cover_every_doctor_once_most_experienced_first(directory):
+    pages = all_pages(directory, page_size=4)
+    doctors = [doctor for page in pages for doctor in page]
+
+    assert all(len(page) == 4 for page in pages[:-1])
+    assert len({doctor["doctorId"] for doctor in doctors}) == len(doctors) == len(available(directory))
+    experience = [doctor["experience"] for doctor in doctors]
+    assert experience == sorted(experience, reverse=True)
+
+
+def test_city_pages_come_first_then_everyone_else_without_duplicates(directory):
+    pages = all_pages(directory, city="pune", page_size=3)
+    doctors = [doctor for page in pages for doctor in page]
+    in_city = len(available(directory, "Pune"))
+
+    assert in_city and len(doctors) == len(available(directory))
+    assert len({doctor["doctorId"] for doctor in doctors}) == len(doctors)
+    assert [doctor["location"] for doctor in doctors[:in_city]] == ["Pune"] * in_city
+    assert "Pune" not in {doctor["location"] for doctor in doctors[in_city:]}
+
+
+def test_later_pages_reuse_the_city_lookup(directory):
+    city_lookups = []
+
+    def fetch(name, pipeline, collation):
+        if collation is not None:
+            city_lookups.append(pipeline)
+        return fetcher(directory)(name, pipeline, collation)
+
+    cached = []
+    doctors, cursor = DoctorSearch(SPECIALTY, city="Pune", page_size=2).run(fetch)
+    while cursor is not None:
+        cached.append(doctors)
+        doctors, cursor = DoctorSearch(SPECIALTY, city="PUNE", page_size=2, cursor=cursor).run(fetch)
+    cached.append(doctors)
+    assert len(cached) > 2 and len(city_lookups) == 1
+
+    # Without the cache every page looks the city up again, and ranks the same doctors
+    uncached, cursor = [], None
+    while True:
+        app.doctor_directory_cache.clear()
+        doctors, cursor = DoctorSearch(SPECIALTY, city="Pune", page_size=2, cursor=cursor).run(fetch)
+        uncached.append(doctors)
+        if cursor is None:
+            break
+    assert uncached == cached
+    assert len(city_lookups) == 1 + len(uncached)
+
+
+def test_bad_page_size():
+    with pytest.raises(ValueError):
+        DoctorSearch(SPECIALTY, page_size=0)
+    with pytest.raises(ValueError):
+        DoctorSearch(SPECIALTY, page_size=app.DOCTOR_MAX_PAGE_SIZE + 1)
@@ -0,0 +1,91 @@
+import json
+import os
+
+import pytest
+
+import app
+import fakes
+from app import MedicalSystem, json_parse_stats, repair_json
+
+CORPUS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                      "benchmarks", "data", "malformed_responses.jsonl")
+
+# How clean_json_response should handle each response in the corpus
+EXPECTED = {
+    "well_formed_analysis": "direct",
+    "well_formed_precautions": "direct",
+    "code_fence_analysis": "extracted",
+    "code_fence_precautions": "extracted",
+    "prose_wrapped_analysis": "extracted",
+    "prose_wrapped_apostrophes": "extracted",
+    "trailing_commas_analysis": "repaired",
+    "trailing_commas_fenced_precautions": "repaired",
+    "single_quoted_precautions": "repaired",
+    "truncated_analysis": "truncated",
+    "truncated_precautions_mid_string": "truncated",
+    "raw_newline_in_string": "repaired",
+    "two_objects_then_prose": "extracted",
+    "no_json_refusal": "failed",
+}
+
+
+def load_corpus() -> dict:
+    with open(CORPUS, "r", encoding="utf-8") as f:
+        return {entry["name"]: entry["response"] for entry in map(json.loads, filter(str.strip, f))}
+
+
+CORPUS_RESPONSES = load_corpus()
+
+
+def test_the_corpus_is_covered():
+    assert set(CORPUS_RESPONSES) == set(EXPECTED)
+
+
+@pytest.mark.parametrize("name", sorted(EXPECTED))
+def test_parse_outcome(name):
+    before = json_parse_stats.stats()
+    result = MedicalSystem.clean_json_response(CORPUS_RESPONSES[name])
+    after = json_parse_stats.stats()
+
+    outcome = EXPECTED[name]
+    assert after[outcome] == before[outcome] + 1
+    assert after["responses"] == before["responses"] + 1
+    if outcome in ("truncated", "failed"):
+        assert "error" in result
+        assert result["raw_response"] == CORPUS_RESPONSES[name]
+    else:
+        assert "error" not in result
+        assert "initial_assessment" in result or "summary" in result
+
+
+def test_repairs_keep_the_content():
+    result = MedicalSystem.clean_json_response(CORPUS_RESPONSES["single_quoted_precautions"])
+    assert result["precautions"][1]["measures"][1] == "Don't go to work while feverish"
+    assert result["initial_assessment"]["immediate_action_required"] is False
+
+    result = MedicalSystem.clean_json_response(CORPUS_RESPONSES["raw_newline_in_string"])
+    assert result["precautions"][0]["measures"][0] == "Drink warm fluids\nthrough the day"
+
+    result = MedicalSystem.clean_json_response(CORPUS_RESPONSES["two_objects_then_prose"])
+    assert "note" not in result
+
+
+def test_truncated_output_is_not_closed():
+    assert repair_json('{"a": [1, 2') is None
+    assert repair_json('{"a": "unfinished') is None
+    assert repair_json("no object here") is None
+    assert json.loads(repair_json("{'a': [1, 2,],}")) == {"a": [1, 2]}
+
+
+def test_truncated_analysis_is_not_cached(medical_system, monkeypatch):
+    monkeypatch.setattr(fakes.FakeGenerativeModel, "_respond",
+                        lambda self, prompt: CORPUS_RESPONSES["truncated_analysis"])
+    chunk = "Page 1: haemoglobin 10.8 g/dL, ferritin 9 ng/mL, truncated response test"
+    key = f"{app.hashlib.sha256(chunk.encode('utf-8')).hexdigest()}:en-US"
+
+    result = medical_system.analyze_chunk(chunk, "en-US")
+    assert "error" in result
+    assert app.chunk_analysis_cache.get(key) is None
+
+    result = medical_system.analyze_medical_report("Haemoglobin 10.8 g/dL, ferritin 9 ng/mL", "en-US")
+    assert "error" in result
@@ -0,0 +1,77 @@
+import copy
+import json
+
+import app
+from app import TASK_PROMPTS
+from fakes import ANALYSIS_RESPONSE, PRECAUTIONS_RESPONSE
+
+
+def test_each_task_pool_is_bound_to_its_instruction(medical_system):
+    assert set(medical_system.model_pools) == set(TASK_PROMPTS)
+    for task, prompt in TASK_PROMPTS.items():
+        pool = medical_system.model_pools[task]
+        handles = list(pool._handles.queue) + [pool.async_model]
+        assert len(handles) == pool.size + 1
+        assert all(handle.system_instruction == prompt.instruction for handle in handles), task
+
+
+def test_instructions_carry_the_schema_and_templates_do_not():
+    for task, prompt in TASK_PROMPTS.items():
+        assert "ONLY the JSON object" in prompt.instruction, task
+        assert "Required JSON structure" not in prompt.template, task
+    assert '"initial_assessment"' in TASK_PROMPTS["precautions"].instruction
+    assert '"recommended_doctor"' in TASK_PROMPTS["analysis"].instruction
+
+
+def test_precautions_prompt(medical_system, fake_model, monkeypatch):
+    monkeypatch.setattr(app, "LANGUAGE_FANOUT", False)
+    symptoms = "throbbing pain behind the left knee after a long flight"
+    result = medical_system.get_precautions_and_recommendations(symptoms, "es-ES")
+
+    assert result["initial_assessment"] == PRECAUTIONS_RESPONSE["initial_assessment"]
+    assert fake_model.prompts == [(
+        TASK_PROMPTS["precautions"].instruction,
+        f"Respond in es-ES language.\nSymptoms:\n{symptoms}"
+    )]
+
+
+def test_analysis_prompt(medical_system, fake_model):
+    text = "Hemoglobin 9.1 g/dL, ferritin low, patient reports fatigue."
+    result = medical_system.analyze_medical_report(text, "en-US", [text])
+
+    assert result["summary"]["overview"] == ANALYSIS_RESPONSE["summary"]["overview"]
+    assert fake_model.prompts == [(TASK_PROMPTS["analysis"].instruction, f"Medical Report:\n{text}")]
+
+
+def test_chunk_prompts(medical_system, fake_model, monkeypatch):
+    monkeypatch.setattr(app, "ANALYSIS_CHUNK_TOKENS", 200)
+    pages = [f"Page {number}: blood pressure reading {120 + number}/80 mmHg. " * 12 for number in range(6)]
+    chunks = app.split_report(pages, app.ANALYSIS_CHUNK_TOKENS * app.CHARS_PER_TOKEN)
+    assert len(chunks) > 1
+
+    medical_system.analyze_medical_report_chunked(pages, "fr-FR")
+
+    section = "This is one section of a longer medical report; analyze only what this section contains.\n"
+    expected = {f"Respond in fr-FR language.\nMedical Report:\n{section}{chunk}" for chunk in chunks}
+    assert {prompt for _, prompt in fake_model.prompts} == expected
+    assert len(fake_model.prompts) == len(chunks)
+    assert all(instruction == TASK_PROMPTS["analysis"].instruction for instruction, _ in fake_model.prompts)
+
+
+def test_translation_prompts(medical_system, fake_model, monkeypatch):
+    monkeypatch.setattr(app, "LANGUAGE_FANOUT", True)
+    canonical = copy.deepcopy(PRECAUTIONS_RESPONSE)
+    canonical["precautions"][0]["category"] = "Keep the affected leg raised above heart level"
+    result = medical_system.localize("precautions", canonical, "hi-IN")
+
+    assert fake_model.prompts
+    sent = []
+    for instruction, prompt in fake_model.prompts:
+        assert instruction == TASK_PROMPTS["translation"].instruction
+        header, _, strings = prompt.partition("Strings:\n")
+        assert header == "Respond in hi-IN language.\nTarget language: hi-IN\n"
+        sent.extend(json.loads(strings).values())
+    assert canonical["precautions"][0]["category"] in sent
+    assert len(sent) == len(set(sent))
+    assert result["precautions"][0]["category"] == f"[hi-IN] {canonical['precautions'][0]['category']}"
+    assert result["initial_assessment"] == canonical["initial_assessment"]
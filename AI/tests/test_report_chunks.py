@@ -0,0 +1,77 @@
+import copy
+import random
+
+import app
+import fakes
+from app import merge_chunk_analyses, split_report
+
+MAX_CHARS = 8000
+
+
+def report(pages: int = 40, seed: int = 3) -> list:
+    rng = random.Random(seed)
+    words = ["glucose", "mg/dL", "hemoglobin", "normal", "elevated", "patient", "reports", "mild", "pain", "follow-up"]
+    return [f"Page {number}: " + " ".join(rng.choice(words) for _ in range(rng.randint(150, 350)))
+            for number in range(pages)]
+
+
+def test_chunks_stay_within_the_budget():
+    pages = report() + ["x" * (3 * MAX_CHARS), ("short line\n" * 2000), "y" * 50 + "\n" + "z" * (MAX_CHARS + 1)]
+    chunks = split_report(pages, MAX_CHARS)
+    assert all(0 < len(chunk) <= MAX_CHARS for chunk in chunks)
+    assert "".join(chunks).replace(" ", "").replace("\n", "") == "".join(pages).replace(" ", "").replace("\n", "")
+
+
+def test_editing_a_page_keeps_the_other_chunks():
+    pages = report()
+    before = split_report(pages, MAX_CHARS)
+    assert len(before) > 4
+    for edited in (0, len(pages) // 2, len(pages) - 1):
+        changed = list(pages)
+        changed[edited] += " Addendum: repeat the fasting glucose test in two weeks."
+        after = split_report(changed, MAX_CHARS)
+
+        # Only the edited page's chunk, and at most the one after it, may differ
+        assert len(set(after) - set(before)) <= 2
+        assert len(set(before) - set(after)) <= 2
+        assert any(changed[edited] in chunk for chunk in after)
+
+
+def finding(severity: str, follow_up: str, urgent: str, referral_urgency: str, specialist: str) -> dict:
+    result = copy.deepcopy(fakes.ANALYSIS_RESPONSE)
+    result["summary"].update(severity_assessment=severity, follow_up_timeline=follow_up, urgent_attention=urgent,
+                             key_findings=[f"{severity} finding"])
+    result["recommended_doctor"]["primary"].update(urgency=referral_urgency, specialist=specialist)
+    return result
+
+
+def test_merge_keeps_the_worst_severity_and_urgency():
+    merged = merge_chunk_analyses([
+        finding("mild", "routine", "no", "routine", "General Medicine"),
+        finding("severe", "soon", "yes", "immediate", "Cardiologist"),
+        finding("moderate", "immediate", "no", "soon", "Neurologist"),
+    ])
+    assert merged["summary"]["severity_assessment"] == "severe"
+    assert merged["summary"]["follow_up_timeline"] == "immediate"
+    assert merged["summary"]["urgent_attention"] == "yes"
+    assert merged["summary"]["key_findings"] == ["mild finding", "severe finding", "moderate finding"]
+    assert merged["recommended_doctor"]["primary"]["specialist"] == "Cardiologist"
+
+
+def test_chunked_analysis_tolerates_a_referral_without_secondary(medical_system, monkeypatch):
+    response = copy.deepcopy(fakes.ANALYSIS_RESPONSE)
+    del response["recommended_doctor"]["secondary"]
+    monkeypatch.setattr(fakes, "ANALYSIS_RESPONSE", response)
+
+    result = medical_system.analyze_medical_report_chunked(report(seed=11), "en-US")
+    assert "error" not in result
+    assert result["recommended_doctor"]["primary"]["specialty_description"]
+
+
+def test_chunked_analysis_falls_back_when_the_merge_fails(medical_system, monkeypatch):
+    def broken_merge(findings):
+        raise KeyError("summary")
+    monkeypatch.setattr(app, "merge_chunk_analyses", broken_merge)
+
+    result = medical_system.analyze_medical_report_chunked(report(seed=12), "en-US")
+    assert "error" in result
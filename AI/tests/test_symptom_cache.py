@@ -0,0 +1,64 @@
+import asyncio
+
+import pytest
+
+from app import SingleFlight, normalize_symptoms, precautions_cache_key
+
+
+def test_negation_stays_with_its_symptom():
+    assert normalize_symptoms("fever, no cough") == "fever no-cough"
+    assert normalize_symptoms("cough, no fever") == "cough no-fever"
+    assert precautions_cache_key("fever, no cough", "en-US") != precautions_cache_key("cough, no fever", "en-US")
+
+
+def test_phrasings_of_the_same_symptoms_share_a_key():
+    assert precautions_cache_key("I have a fever and a cough", "en-US") == precautions_cache_key("Cough, fever", "en-US")
+    assert precautions_cache_key("I don't have a fever", "en-US") == precautions_cache_key("no fever", "en-US")
+    assert precautions_cache_key("cough", "en-US") != precautions_cache_key("cough", "hi-IN")
+
+
+def test_followers_of_a_cancelled_leader_do_not_hang():
+    async def scenario():
+        flight = SingleFlight()
+        started = asyncio.Event()
+
+        async def slow():
+            started.set()
+            await asyncio.sleep(60)
+            return {"precautions": []}
+
+        leader = asyncio.create_task(flight.do_async("fever", slow))
+        await started.wait()
+        follower = asyncio.create_task(flight.do_async("fever", slow))
+        await asyncio.sleep(0)
+        leader.cancel()
+
+        with pytest.raises(asyncio.CancelledError):
+            await asyncio.wait_for(follower, timeout=5)
+        assert flight.stats() == {"executions": 1, "coalesced": 1, "in_flight": 0}
+
+        # The key is free again for the next caller
+        async def fast():
+            return {"precautions": ["rest"]}
+        assert await asyncio.wait_for(flight.do_async("fever", fast), timeout=5) == {"precautions": ["rest"]}
+
+    asyncio.run(scenario())
+
+
+def test_followers_share_the_leader_result():
+    async def scenario():
+        flight = SingleFlight()
+        release = asyncio.Event()
+
+        async def work():
+            await release.wait()
+            return {"precautions": ["rest"]}
+
+        calls = [asyncio.create_task(flight.do_async("fever", work)) for _ in range(3)]
+        await asyncio.sleep(0)
+        release.set()
+        results = await asyncio.wait_for(asyncio.gather(*calls), timeout=5)
+        assert results == [{"precautions": ["rest"]}] * 3
+        assert flight.stats()["executions"] == 1
+
+    asyncio.run(scenario())
@@ -0,0 +1,94 @@
+import json
+
+import pytest
+
+import app
+from app import TriageTier
+
+
+@pytest.fixture
+def triage():
+    tier = TriageTier.from_file(app.TRIAGE_TEMPLATES_PATH)
+    tier.enabled = True
+    return tier
+
+
+UNSAFE = [
+    "I feel a bit depressed and want to die",
+    "mild anxiety, I want to end my life",
+    "slightly depressed, no reason to live",
+    "mild headache after I hit my head",
+    "mild rash and my lips are swelling",
+    "mild back pain and cannot move legs",
+    "I have a mild headache and my vision is blurry",
+    "mild heart palpitations",
+]
+
+
+def decide(triage, symptoms: str, language: str = "en-US"):
+    return triage.decide(symptoms, language, app.specialty_matcher.rank(symptoms))
+
+
+@pytest.mark.parametrize("symptoms", UNSAFE + ["slight headache and double vision", "my heart is racing a little"])
+def test_red_flags_go_to_the_model_first(triage, symptoms):
+    template, info = decide(triage, symptoms)
+    assert template is None
+    assert info == {"tier": "model", "reason": "red_flag", "severity": info["severity"]}
+    assert triage.is_urgent(symptoms)
+
+
+@pytest.mark.parametrize("symptoms", UNSAFE)
+def test_unlisted_words_go_to_the_model_without_red_flags(symptoms):
+    with open(app.TRIAGE_TEMPLATES_PATH, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    data["red_flags"] = []
+    template, info = decide(TriageTier(data, enabled=True), symptoms)
+    assert template is None
+    assert info["reason"] in ("unlisted_words", "escalated_specialty")
+
+
+def test_psychiatric_complaints_always_go_to_the_model(triage):
+    template, info = decide(triage, "mild anxiety")
+    assert template is None and info["reason"] == "escalated_specialty"
+
+
+@pytest.mark.parametrize("symptoms", ["headache since this morning", "my heart feels odd"])
+def test_heart_and_nerve_complaints_need_a_severity_cue(triage, symptoms):
+    template, info = decide(triage, symptoms)
+    assert template is None
+    assert (info["reason"], info["severity"]) == ("no_severity_cue", "unspecified")
+
+
+@pytest.mark.parametrize("symptoms, severity", [
+    ("mild headache since this morning", "mild"),
+    ("persistent headache for weeks", "moderate"),
+    ("itchy rash on my arm", "unspecified"),
+    ("mild fever and cough", "mild"),
+    ("sore throat and a mild cold", "mild"),
+    ("knee pain after running", "unspecified"),
+    ("slightly high blood pressure reading", "mild"),
+])
+def test_local_answers(triage, symptoms, severity):
+    template, info = decide(triage, symptoms)
+    assert info["tier"] == "local" and info["reason"] == "template"
+    assert info["severity"] == severity and info["template_version"] == triage.version
+    assert template["initial_assessment"]["seek_emergency"] is False
+
+
+def test_severe_and_non_english_descriptions_go_to_the_model(triage):
+    assert decide(triage, "sudden headache")[1]["reason"] == "severe"
+    assert decide(triage, "mild headache", "hi-IN")[1]["reason"] == "language"
+
+
+def test_mild_templates_do_not_ask_for_immediate_action(triage):
+    for specialty, templates in triage.templates.items():
+        assessment = templates["mild"]["initial_assessment"]
+        assert assessment["severity"] == "mild", specialty
+        assert assessment["immediate_action_required"] is False, specialty
+        assert assessment["seek_emergency"] is False, specialty
+
+
+@pytest.mark.parametrize("language, status", [(None, 200), ("", 200), (" en-GB ", 200), (5, 400), (["en"], 400)])
+def test_recommend_validates_the_language(fake_model, language, status):
+    response = app.app.test_client().post("/recommend", json={"symptoms": "cough", "language": language})
+    assert response.status_code == status, response.get_data(as_text=True)